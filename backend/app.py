@@ -1,21 +1,38 @@
 import os
 import logging
-from flask import Flask, request, current_app, jsonify  
+from flask import Flask, Response, request, current_app, jsonify  
 from dotenv import load_dotenv  
-from backend.extensions import db, migrate  
+from backend.config import configurations, log_config_warnings
+from backend.extensions import db, init_migrate, registry
+from backend.logging_config import configure_logging
 from backend.models import User, Lead, ChatLog, BankRate  # Correct capitalization
 from backend.routes.chatbot import chatbot_bp  
-from backend.utils.whatsapp import send_whatsapp_message  
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from backend.utils import metrics
+from backend.scheduler import scheduler_cli
+from backend.utils.chat_archive import chat_archive_cli
+from backend.utils.retention import retention_cli
+from backend.utils.rollups import rollups_cli
+from backend.utils.sql_audit import init_sql_audit, query_budget
+from backend.utils.tracing import init_tracing
+from backend.utils.traffic_capture import init_traffic_capture
 
 # Load environment variables
 load_dotenv()
 
-def create_app():
-    """Create and configure the Flask app."""
+logger = logging.getLogger(__name__)
+
+def create_app(config_overrides=None):
+    """Create and configure the Flask app.
+
+    Nothing expensive happens at import time: API clients, presets and Redis are
+    registered with the app-scoped registry and built on first use.
+    """
     app = Flask(__name__)
+    # Production unless FLASK_ENV says otherwise: Procfile and gunicorn.conf.py never set it
+    app.config.from_object(configurations.get(os.getenv('FLASK_ENV', 'production'), configurations['production']))
+
+    # Queue-based structured logging; replaces the old per-module basicConfig calls
+    configure_logging(app.config)
 
     # Setup database config
     database_url = os.getenv('DATABASE_URL', 'sqlite:///local.db')
@@ -26,21 +43,56 @@ def create_app():
 
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config_overrides or {})
+    log_config_warnings(app.config)
+
+    # Lazily-built services (OpenAI, WhatsApp, presets, Redis) read this app's config
+    registry.init_app(app)
+    metrics.configure_metrics(app.config)
 
-    # Initialize database and migrate
+    # Initialize database; Flask-Migrate (and Alembic) only load for the flask CLI
     db.init_app(app)  
-    migrate.init_app(app, db)  
+    if os.getenv('FLASK_RUN_FROM_CLI') == 'true':
+        init_migrate(app)
 
     # Register all blueprints
     register_routes(app)
 
+    # Request tracing (no-op unless TRACE_EXPORT_PATH or TRACE_OTLP_ENDPOINT is set)
+    init_tracing(app)
+
+    # Per-request SQL counts, repeats and budgets (headers only with SQL_AUDIT_HEADERS, metrics always)
+    init_sql_audit(app)
+
+    # Pseudonymized webhook capture for benchmarks/replay.py (no-op unless TRAFFIC_CAPTURE_DIR is set)
+    init_traffic_capture(app)
+
+    # Register maintenance CLI commands (e.g. `flask rollups rebuild`, `flask scheduler once`)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(scheduler_cli)
+    app.cli.add_command(chat_archive_cli)
+    app.cli.add_command(retention_cli)
+
     return app
 
 def register_routes(app):
     """Register all routes for the application."""
     app.register_blueprint(chatbot_bp, url_prefix='/chatbot')  
+    register_admin_routes(app)
+
+    @app.after_request
+    def flush_metrics(response):
+        metrics.maybe_flush()
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Expose funnel and runtime metrics (aggregated across workers via Redis)."""
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
     @app.route('/webhook', methods=['GET', 'POST'])
+    # One commit per message (unit_of_work); a completion measures ~7 queries, 10 for a first-time user
+    @query_budget(12, max_commits=1)
     def webhook():
         if request.method == 'GET':
             mode = request.args.get('hub.mode')
@@ -48,10 +100,10 @@ def register_routes(app):
             challenge = request.args.get('hub.challenge')
 
             if mode == 'subscribe' and token == os.getenv('VERIFY_TOKEN', 'myverifytoken123'):
-                logging.info('✅ Webhook verification successful!')
+                logger.info('Webhook verification successful')
                 return challenge, 200
             else:
-                logging.warning('⚠️ Webhook verification failed! Check the token and URL.')
+                logger.warning('Webhook verification failed! Check the token and URL.')
                 return 'Verification failed', 403
 
         if request.method == 'POST':
@@ -66,7 +118,7 @@ def register_routes(app):
                         for message in messages:
                             phone_number = message.get('from', 'Unknown')
                             user_message = message.get('text', {}).get('body', 'No message body').strip()
-                            logging.info(f"💎 Incoming message from {phone_number}: {user_message}")
+                            logger.info("Incoming message", extra={'phone_number': phone_number, 'chars': len(user_message)})
 
                             # Pass data explicitly to chatbot
                             with current_app.app_context():  
@@ -74,13 +126,28 @@ def register_routes(app):
                 return 'OK', 200
 
             except Exception as e:
-                logging.exception(f"❌ Error occurred while processing webhook: {e}")
+                logger.exception("Error occurred while processing webhook: %s", e)
                 return 'Internal Server Error', 500
 
-    # Print environment variables for debugging
-    logging.info("WHATSAPP_API_URL: %s", os.getenv('WHATSAPP_API_URL'))
-    logging.info("WHATSAPP_API_TOKEN: %s", os.getenv('WHATSAPP_API_TOKEN'))
-    logging.info("WHATSAPP_PHONE_NUMBER_ID: %s", os.getenv('WHATSAPP_PHONE_NUMBER_ID'))
+    # Log WhatsApp configuration for debugging (never the token itself)
+    logger.info("WHATSAPP_API_URL: %s", app.config.get('WHATSAPP_API_URL'))
+    logger.info("WHATSAPP_API_TOKEN set: %s", bool(app.config.get('WHATSAPP_API_TOKEN')))
+    logger.info("WHATSAPP_PHONE_NUMBER_ID: %s", app.config.get('WHATSAPP_PHONE_NUMBER_ID'))
+
+def register_admin_routes(app):
+    """Register the JWT-protected admin API (leads, exports, analytics, chat history) under /api/admin.
+
+    Tokens must carry role=admin and be signed with JWT_SECRET_KEY. Without a dedicated
+    key the API stays off rather than accepting tokens signed with the default SECRET_KEY.
+    """
+    if not app.config.get('JWT_SECRET_KEY'):
+        logger.warning("JWT_SECRET_KEY is not set; the admin API (/api/admin) is disabled")
+        return
+    from flask_jwt_extended import JWTManager
+    from backend.routes.admin import admin_bp
+
+    JWTManager(app)
+    app.register_blueprint(admin_bp)
 
 if __name__ == '__main__':
     DEBUG = os.getenv('DEBUG', 'False').lower() in ['true', '1', 'yes']
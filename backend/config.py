@@ -8,8 +8,7 @@ load_dotenv()
 class Config:
     """Base configuration class with default settings."""
     SECRET_KEY = os.getenv('SECRET_KEY', 'your_default_secret_key')
-    if SECRET_KEY == 'your_default_secret_key':
-        logging.warning("SECRET_KEY is not set in .env. Using the default, which is not safe for production.")
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')  # Signs admin API tokens; /api/admin is off unless set
 
     # Load the DATABASE_URL from the .env file
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///local.db')
@@ -21,13 +20,131 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False  # Disable SQLAlchemy event tracking to boost performance
 
     DEBUG = os.getenv('DEBUG', 'False').lower() in ['true', '1', 'yes']  # Convert DEBUG to boolean
-    ENV = os.getenv('FLASK_ENV', 'development')  # Set the environment (development/production/testing)
+    ENV = os.getenv('FLASK_ENV', 'production')  # Set the environment (development/production/testing)
+
+    # Logging (see backend/logging_config.py)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.getenv('LOG_LEVELS', 'sqlalchemy.engine=WARNING,urllib3=WARNING')  # Per-logger overrides
+    LOG_SAMPLING = os.getenv('LOG_SAMPLING', '')  # e.g. "backend.utils.whatsapp=0.1"
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json | text
+    LOG_FILE = os.getenv('LOG_FILE')  # Optional rotating file; stdout only when unset
+
+    # External services (clients are built lazily through backend.extensions.registry)
+    OPENAI_API_KEY = (os.getenv('OPENAI_API_KEY') or '').strip()
+    OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')  # Optional override, e.g. a local stand-in for benchmarks
+    WHATSAPP_API_URL = os.getenv('WHATSAPP_API_URL')
+    WHATSAPP_API_TOKEN = os.getenv('WHATSAPP_API_TOKEN')
+    WHATSAPP_PHONE_NUMBER_ID = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
+    ADMIN_WHATSAPP_NUMBERS = os.getenv('ADMIN_WHATSAPP_NUMBERS', '')
+    REDIS_URL = os.getenv('REDIS_URL')  # Optional; enables cross-worker metrics and coordination
+
+    # Metrics and tracing (see backend/utils/metrics.py and backend/utils/tracing.py)
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '10'))
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'finzo-chatbot')
+    TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH')
+    TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+    TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '2000'))
+
+    # Webhook traffic capture for replay benchmarks (see backend/utils/traffic_capture.py)
+    TRAFFIC_CAPTURE_DIR = os.getenv('TRAFFIC_CAPTURE_DIR')  # Capture is off unless set
+    TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.getenv('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0'))
+    TRAFFIC_CAPTURE_MAX_FILE_MB = float(os.getenv('TRAFFIC_CAPTURE_MAX_FILE_MB', '64'))  # Then start a new file
+    TRAFFIC_CAPTURE_MAX_FILES = int(os.getenv('TRAFFIC_CAPTURE_MAX_FILES', '20'))  # Oldest files deleted beyond this
+    TRAFFIC_CAPTURE_SALT = os.getenv('TRAFFIC_CAPTURE_SALT')  # HMAC key for phone pseudonyms; required to capture
+
+    # Outbound reply coalescing (see backend/utils/outbox.py)
+    OUTBOUND_COALESCE_ENABLED = os.getenv('OUTBOUND_COALESCE_ENABLED', 'true').lower() in ['true', '1', 'yes']
+    OUTBOUND_MAX_CHARS = int(os.getenv('OUTBOUND_MAX_CHARS', '4096'))  # WhatsApp's text body limit
+
+    # Inbound debouncing of rapid-fire messages (see backend/utils/debounce.py)
+    INBOUND_DEBOUNCE_MS = float(os.getenv('INBOUND_DEBOUNCE_MS', '0'))  # Quiet time before a burst is handled; 0 = off
+    INBOUND_DEBOUNCE_MAX_WAIT_MS = float(os.getenv('INBOUND_DEBOUNCE_MAX_WAIT_MS', '5000'))  # Handle a burst by then anyway
+
+    # Admin lead digest (see backend/utils/lead_digest.py)
+    LEAD_DIGEST_INTERVAL_MINUTES = float(os.getenv('LEAD_DIGEST_INTERVAL_MINUTES', '30'))  # Oldest lead waits at most this long
+    LEAD_DIGEST_MAX_LEADS = int(os.getenv('LEAD_DIGEST_MAX_LEADS', '20'))  # Or send once this many are waiting
+    LEAD_DIGEST_COMMIT_GRACE_SECONDS = float(os.getenv('LEAD_DIGEST_COMMIT_GRACE_SECONDS', '120'))  # Longer than any message's transaction
+    LEAD_ALERT_MIN_MONTHLY_SAVINGS = float(os.getenv('LEAD_ALERT_MIN_MONTHLY_SAVINGS', '500'))  # RM; alerted immediately, 0 = every lead
+
+    # Adaptive load shedding of query mode (see backend/utils/load_shedding.py)
+    LOAD_SHED_ENABLED = os.getenv('LOAD_SHED_ENABLED', 'true').lower() in ['true', '1', 'yes']
+    LOAD_SHED_MAX_IN_FLIGHT = int(os.getenv('LOAD_SHED_MAX_IN_FLIGHT', os.getenv('GUNICORN_THREADS', '1')))  # Threads per worker
+    LOAD_SHED_UTILIZATION_TARGET = float(os.getenv('LOAD_SHED_UTILIZATION_TARGET', '0.9'))  # Busy fraction that degrades
+    LOAD_SHED_UTILIZATION_WINDOW_SECONDS = float(os.getenv('LOAD_SHED_UTILIZATION_WINDOW_SECONDS', '2'))  # Averaged over
+    LOAD_SHED_QUEUE_TARGET_MS = float(os.getenv('LOAD_SHED_QUEUE_TARGET_MS', '1000'))  # Router queue wait (X-Request-Start)
+    LOAD_SHED_UPSTREAM_P95_MS = float(os.getenv('LOAD_SHED_UPSTREAM_P95_MS', '8000'))  # Model latency that degrades query mode
+    LOAD_SHED_CRITICAL_RATIO = float(os.getenv('LOAD_SHED_CRITICAL_RATIO', '2.0'))  # Shed all of query mode from here
+    LOAD_SHED_COOLDOWN_SECONDS = float(os.getenv('LOAD_SHED_COOLDOWN_SECONDS', '10'))  # Calm time before stepping down
+    LOAD_SHED_PROBE_RATE = float(os.getenv('LOAD_SHED_PROBE_RATE', '0.1'))  # Model questions still let through when degraded
+
+    # Read-only caches shared by preforked workers (see backend/warmup.py)
+    BANK_RATE_CACHE_SECONDS = float(os.getenv('BANK_RATE_CACHE_SECONDS', '300'))  # Bank-rate index refresh interval
+
+    # Coalescing of identical in-flight OpenAI questions (see backend/utils/singleflight.py)
+    SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv('SINGLEFLIGHT_WAIT_SECONDS', '20'))  # Then followers call OpenAI themselves
+    SINGLEFLIGHT_RESULT_TTL = float(os.getenv('SINGLEFLIGHT_RESULT_TTL', '5'))  # Seconds an answer is shared across workers
+    SINGLEFLIGHT_POLL_MS = float(os.getenv('SINGLEFLIGHT_POLL_MS', '50'))  # Remote followers' Redis poll interval
+
+    # Query-mode model routing (see backend/utils/query_router.py)
+    QUERY_ROUTING_ENABLED = os.getenv('QUERY_ROUTING_ENABLED', 'true').lower() in ['true', '1', 'yes']
+    QUERY_MODEL_FAST = os.getenv('QUERY_MODEL_FAST', 'gpt-3.5-turbo')  # Short and standard questions
+    QUERY_MODEL_STRONG = os.getenv('QUERY_MODEL_STRONG', 'gpt-3.5-turbo')  # Complex questions, unless over the SLO
+    QUERY_MAX_TOKENS = os.getenv('QUERY_MAX_TOKENS', '')  # Overrides per route, e.g. "short=60,complex=400"
+    QUERY_LATENCY_SLO_MS = float(os.getenv('QUERY_LATENCY_SLO_MS', '4000'))  # p95 target per route
+    QUERY_LATENCY_WINDOW = int(os.getenv('QUERY_LATENCY_WINDOW', '200'))  # Recent calls the p95 is taken over
+
+    # Retrieval over the FAQ and policy documents (see backend/utils/retrieval.py)
+    RETRIEVAL_ENABLED = os.getenv('RETRIEVAL_ENABLED', 'true').lower() in ['true', '1', 'yes']
+    RETRIEVAL_ANSWER_MIN_CONFIDENCE = float(os.getenv('RETRIEVAL_ANSWER_MIN_CONFIDENCE', '0.65'))  # Answer with the preset
+    RETRIEVAL_CONTEXT_MIN_CONFIDENCE = float(os.getenv('RETRIEVAL_CONTEXT_MIN_CONFIDENCE', '0.25'))  # Give passage to model
+    RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '3'))
+    RETRIEVAL_CONTEXT_CHARS = int(os.getenv('RETRIEVAL_CONTEXT_CHARS', '1200'))  # Prompt budget for passages
+
+    # Language auto-detection for new conversations (see backend/utils/language.py)
+    LANGUAGE_DETECTION_ENABLED = os.getenv('LANGUAGE_DETECTION_ENABLED', 'true').lower() in ['true', '1', 'yes']
+    LANGUAGE_DETECTION_MIN_CONFIDENCE = float(os.getenv('LANGUAGE_DETECTION_MIN_CONFIDENCE', '0.8'))  # Below: show menu
+    LANGUAGE_DETECTION_MIN_LETTERS = int(os.getenv('LANGUAGE_DETECTION_MIN_LETTERS', '10'))  # Shorter text: less confident
+    LANGUAGE_DETECTION_SEED = int(os.getenv('LANGUAGE_DETECTION_SEED', '0'))
+    LANGUAGE_CACHE_SIZE = int(os.getenv('LANGUAGE_CACHE_SIZE', '10000'))  # Phone numbers remembered per process
+
+    # Proactive messaging worker (see backend/scheduler.py); WhatsApp only allows free-form replies for 24h
+    SCHEDULER_INTERVAL_SECONDS = float(os.getenv('SCHEDULER_INTERVAL_SECONDS', '60'))
+    SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '100'))  # Conversations fetched per query
+    SCHEDULER_SEND_RATE = float(os.getenv('SCHEDULER_SEND_RATE', '10'))  # Messages per second; 0 = unthrottled
+    REMINDER_IDLE_HOURS = float(os.getenv('REMINDER_IDLE_HOURS', '20'))  # Nudge stalled flows after this long
+    REMINDER_LOOKBACK_HOURS = float(os.getenv('REMINDER_LOOKBACK_HOURS', '3'))  # ...unless idle longer than this too
+    RATE_RENOTIFY_MIN_GAIN = float(os.getenv('RATE_RENOTIFY_MIN_GAIN', '50'))  # RM/month below the quoted repayment
+    RATE_RENOTIFY_CHUNK_SIZE = int(os.getenv('RATE_RENOTIFY_CHUNK_SIZE', '1000'))  # Leads per checkpointed chunk
+    RATE_RENOTIFY_CHUNKS_PER_RUN = int(os.getenv('RATE_RENOTIFY_CHUNKS_PER_RUN', '10'))  # Then yield to other jobs
+
+    # Cold archive of old chat logs (see backend/utils/chat_archive.py)
+    CHAT_ARCHIVE_DIR = os.getenv('CHAT_ARCHIVE_DIR', 'chat_archive')  # Durable storage for compressed segments
+    CHAT_ARCHIVE_AFTER_DAYS = float(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', '90'))  # 0 disables archiving
+    CHAT_ARCHIVE_BATCH_SIZE = int(os.getenv('CHAT_ARCHIVE_BATCH_SIZE', '2000'))  # Rows moved per transaction
+    CHAT_ARCHIVE_BATCHES_PER_RUN = int(os.getenv('CHAT_ARCHIVE_BATCHES_PER_RUN', '10'))  # Then yield to other jobs
+    CHAT_ARCHIVE_SEGMENT_MB = float(os.getenv('CHAT_ARCHIVE_SEGMENT_MB', '64'))  # Then start a new segment file
+
+    # Retention and erasure requests, per deletion-policy.txt (see backend/utils/retention.py)
+    RETENTION_DAYS = os.getenv('RETENTION_DAYS', '')  # Per table, e.g. "chat_logs=180,leads=365"; unset or 0 keeps forever
+    RETENTION_ERASURE_DELAY_DAYS = float(os.getenv('RETENTION_ERASURE_DELAY_DAYS', '0'))  # Grace before an erasure runs
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '200'))  # Rows per delete transaction
+    RETENTION_ROWS_PER_SECOND = float(os.getenv('RETENTION_ROWS_PER_SECOND', '200'))  # Write budget; 0 = unthrottled
+    RETENTION_MAX_ROWS_PER_RUN = int(os.getenv('RETENTION_MAX_ROWS_PER_RUN', '20000'))  # Then yield to other jobs
+
+    # Per-request SQL audit (see backend/utils/sql_audit.py)
+    SQL_AUDIT_ENABLED = os.getenv('SQL_AUDIT_ENABLED', 'true').lower() in ['true', '1', 'yes']
+    SQL_AUDIT_HEADERS = os.getenv('SQL_AUDIT_HEADERS', 'false').lower() in ['true', '1', 'yes']  # X-SQL-* response headers
+    SQL_AUDIT_STRICT = False  # Raise QueryBudgetExceeded instead of logging
+    SQL_QUERY_BUDGETS = os.getenv('SQL_QUERY_BUDGETS', '')  # Overrides @query_budget, e.g. "webhook=12"
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', '5'))
 
 
 class DevelopmentConfig(Config):
     """Configuration for development environment."""
     DEBUG = True  # Enable debug mode
     ENV = 'development'  # Set the environment to development
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # Human-readable logs locally
 
 
 class ProductionConfig(Config):
@@ -40,6 +157,7 @@ class TestingConfig(Config):
     """Configuration for testing environment."""
     TESTING = True  # Enable testing mode
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # Use an in-memory database for tests
+    SQL_AUDIT_STRICT = True  # Routes over their SQL budget fail the test
 
 
 # Dictionary to select configuration by environment
@@ -49,6 +167,14 @@ configurations = {
     'testing': TestingConfig
 }
 
-# Log the environment being used
-current_env = os.getenv('FLASK_ENV', 'development')
-logging.info(f"App running in {current_env} mode using {configurations[current_env].SQLALCHEMY_DATABASE_URI}")
+
+def log_config_warnings(config):
+    """Log configuration problems once at app startup (instead of at import time)."""
+    logger = logging.getLogger(__name__)
+    logger.info("App running in %s mode", config.get('ENV'))
+    if config.get('SECRET_KEY') == 'your_default_secret_key':
+        logger.warning("SECRET_KEY is not set in .env. Using the default, which is not safe for production.")
+    missing = [key for key in ('OPENAI_API_KEY', 'WHATSAPP_API_URL', 'WHATSAPP_API_TOKEN', 'WHATSAPP_PHONE_NUMBER_ID')
+               if not config.get(key)]
+    if missing:
+        logger.warning("Missing configuration: %s. Features using them will fail on first use.", ', '.join(missing))
@@ -1,5 +1,90 @@
+import logging
+
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 
 db = SQLAlchemy()  # ✅ Single instance of db
-migrate = Migrate()  # ✅ Single instance of migrate
+
+
+class Registry:
+    """
+    App-scoped registry of lazily created services (API clients, presets, Redis...).
+    Modules register a factory at import time, which is just a dict insert, and
+    the service is built on first get(). init_app binds the registry to an app's
+    config. warm() builds services eagerly, e.g. in the gunicorn master before fork.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._config = None
+
+    def register(self, name, factory):
+        """ factory(config) -> service. Re-registering replaces the factory and drops any cached instance. """
+        self._factories[name] = factory
+        self._instances.pop(name, None)
+
+    def init_app(self, app):
+        self._config = app.config
+        self._instances.clear()
+        app.extensions['registry'] = self
+
+    @property
+    def config(self):
+        if self._config is None:
+            from backend.config import Config  # Scripts without an app fall back to the env-driven defaults
+            self._config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+        return self._config
+
+    def get(self, name):
+        try:
+            return self._instances[name]
+        except KeyError:
+            instance = self._instances[name] = self._factories[name](self.config)
+            return instance
+
+    def reset(self, name=None):
+        """ Drop cached instances so they are rebuilt on next use (e.g. after a reload or fork). """
+        if name is None:
+            self._instances.clear()
+        else:
+            self._instances.pop(name, None)
+
+    def warm(self, *names):
+        """ Build the named services (all registered ones by default), logging rather than raising failures. """
+        for name in names or tuple(self._factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                logging.getLogger(__name__).warning("Could not warm %s: %s", name, e)
+
+
+registry = Registry()
+
+
+def init_migrate(app):
+    """ Flask-Migrate pulls in Alembic (~0.2s of imports); only wire it up when the flask CLI runs. """
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+
+def _create_redis(config):
+    redis_url = config.get('REDIS_URL')
+    if not redis_url:
+        return None
+    try:
+        import redis
+        return redis.Redis.from_url(redis_url, decode_responses=True, socket_timeout=1.0)
+    except Exception as e:
+        logging.getLogger(__name__).warning("Redis unavailable, using per-process state: %s", e)
+        return None
+
+
+registry.register('redis', _create_redis)
+
+
+def get_redis():
+    """
+    Return the shared Redis client built from REDIS_URL, or None when Redis is not configured.
+    Features that coordinate across workers fall back to per-process behaviour on None.
+    """
+    return registry.get('redis')
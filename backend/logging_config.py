@@ -0,0 +1,174 @@
+"""
+Application logging: non-blocking, structured and configured in one place.
+
+Request threads only append LogRecords to an in-memory queue. A
+QueueListener thread does the formatting and the stdout/file I/O, so slow
+disks or pipes never stall a webhook. Records keep their %-style args until
+the listener formats them, which makes filtered-out DEBUG lines almost free.
+Output is one JSON object per line (LOG_FORMAT=json) or plain text.
+
+Config keys (see backend.config.Config):
+    LOG_LEVEL     root level, e.g. INFO
+    LOG_LEVELS    per-logger levels, e.g. "backend.routes.chatbot=DEBUG,sqlalchemy.engine=WARNING"
+    LOG_SAMPLING  keep-ratios for high-volume loggers, e.g. "backend.utils.whatsapp=0.1"
+    LOG_FORMAT    json | text
+    LOG_FILE      optional rotating log file; stdout only when unset
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field.
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+_listener = None
+_listener_pid = None
+
+
+def parse_mapping(value):
+    """ Parse "a=1,b=2" (or an existing dict) into {'a': '1', 'b': '2'}. """
+    if isinstance(value, dict):
+        return dict(value)
+    pairs = (item.split('=', 1) for item in (value or '').split(',') if '=' in item)
+    return {name.strip(): setting.strip() for name, setting in pairs}
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per record, including any `extra=` fields. """
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value if isinstance(value, _PRIMITIVES + (list, tuple, dict)) else repr(value)
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of INFO/DEBUG records from noisy loggers.
+    A call can also pass extra={'sample_rate': 0.01}. Warnings and errors are never sampled.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {name: float(rate) for name, rate in rates.items()}
+
+    def _rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, 'sample_rate', None)
+        if rate is None:
+            rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that defers formatting to the listener thread.
+    Args stay unformatted unless they are non-primitive objects (e.g. ORM
+    instances), which are rendered now so they aren't touched from another thread.
+    """
+
+    def prepare(self, record):
+        _ensure_listener()
+        if record.args and not all(isinstance(arg, _PRIMITIVES) for arg in (
+                record.args.values() if isinstance(record.args, dict) else record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # Never block a request on logging; drop the record instead.
+
+
+def _build_output_handlers(config):
+    formatter = (
+        JsonFormatter() if str(config.get('LOG_FORMAT', 'json')).lower() == 'json'
+        else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = config.get('LOG_FILE')
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=int(config.get('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024)),
+            backupCount=int(config.get('LOG_FILE_BACKUP_COUNT', 5)), encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _ensure_listener():
+    """ (Re)start the listener thread in this process; threads don't survive a fork. """
+    global _listener_pid
+    if _listener is not None and _listener_pid != os.getpid():
+        _listener_pid = os.getpid()
+        _listener._thread = None
+        _listener.start()
+
+
+def configure_logging(config=None):
+    """
+    Install the queue-based logging pipeline on the root logger.
+    Safe to call more than once; later calls replace the previous setup.
+    Args:
+        config (Mapping): Flask app.config or any dict with the LOG_* keys.
+    """
+    global _listener, _listener_pid
+    config = config or {}
+
+    if _listener is not None:
+        _listener.stop()
+
+    log_queue = queue.Queue(maxsize=int(config.get('LOG_QUEUE_SIZE', 10000)))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    sampling = parse_mapping(config.get('LOG_SAMPLING'))
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(str(config.get('LOG_LEVEL', 'INFO')).upper())
+
+    for name, level in parse_mapping(config.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *_build_output_handlers(config), respect_handler_level=True)
+    _listener_pid = os.getpid()
+    _listener.start()
+
+
+def shutdown_logging():
+    """ Drain the queue and stop the listener thread. """
+    if _listener is not None and _listener._thread is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+atexit.register(shutdown_logging)
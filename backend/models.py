@@ -8,6 +8,10 @@ MYT = pytz.timezone('Asia/Kuala_Lumpur')
 
 class ChatflowTemp(db.Model):
     __tablename__ = 'chatflow_temp'
+    __table_args__ = (
+        # Idle-conversation scans by the scheduler (backend/scheduler.py) are a range on updated_at per mode
+        db.Index('ix_chatflow_temp_mode_updated_at', 'mode', 'updated_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     phone_number = Column(String(20), nullable=False, unique=True)
@@ -33,6 +37,7 @@ class User(db.Model):
     
     # Use lazy='dynamic' for ChatLog relationship
     chat_logs = db.relationship('ChatLog', backref='user', lazy='dynamic', cascade="all, delete-orphan")
+    chat_log_archives = db.relationship('ChatLogArchive', lazy='dynamic', cascade="all, delete-orphan")
     chatflows = db.relationship('ChatflowTemp', backref='user', cascade="all, delete-orphan")  
     
     leads = db.relationship('Lead', backref='user', cascade="all, delete-orphan")  
@@ -63,6 +68,11 @@ class Lead(db.Model):
 
 class ChatLog(db.Model):  # Capital L
     __tablename__ = 'chat_logs'
+    __table_args__ = (
+        # Archival scans old rows in (created_at, id) order (backend/utils/chat_archive.py)
+        db.Index('ix_chat_logs_created_at_id', 'created_at', 'id'),
+        db.Index('ix_chat_logs_user_id', 'user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # ✅ User reference
@@ -71,6 +81,21 @@ class ChatLog(db.Model):  # Capital L
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT), onupdate=lambda: datetime.now(MYT), nullable=False)
 
 
+class ChatLogArchive(db.Model):
+    """ Where one user's archived chat logs sit in a cold segment file (backend/utils/chat_archive.py). """
+    __tablename__ = 'chat_log_archives'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True, nullable=False)
+    segment = db.Column(db.String(100), nullable=False)  # File name inside CHAT_ARCHIVE_DIR
+    offset = db.Column(db.BigInteger, nullable=False)  # Byte offset of the user's gzip member
+    length = db.Column(db.Integer, nullable=False)  # Compressed size of the member
+    row_count = db.Column(db.Integer, nullable=False)
+    first_created_at = db.Column(db.DateTime, nullable=False)
+    last_created_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT), nullable=False)
+
+
 class BankRate(db.Model):
     __tablename__ = 'bank_rates'
 
@@ -81,3 +106,63 @@ class BankRate(db.Model):
     interest_rate = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT))  
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT), onupdate=lambda: datetime.now(MYT))
+
+
+class LeadRollup(db.Model):
+    __tablename__ = 'lead_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'language_code', 'loan_bucket', name='uq_lead_rollups_day_language_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    language_code = db.Column(db.String(10), nullable=False)
+    loan_bucket = db.Column(db.String(20), nullable=False)
+    conversation_count = db.Column(db.Integer, nullable=False, default=0)  # Users who entered a loan amount
+    lead_count = db.Column(db.Integer, nullable=False, default=0)
+    monthly_savings_total = db.Column(db.Float, nullable=False, default=0.0)
+    lifetime_savings_total = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT), onupdate=lambda: datetime.now(MYT))
+
+
+class OutreachLog(db.Model):
+    """ One proactive message (reminder, rate-change notice...) per recipient and reference, claimed before sending. """
+    __tablename__ = 'outreach_log'
+    __table_args__ = (
+        db.UniqueConstraint('phone_number', 'kind', 'reference', name='uq_outreach_log_phone_kind_reference'),
+        db.Index('ix_outreach_log_kind_created_at', 'kind', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    phone_number = db.Column(db.String(20), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'reminder', 'rate_change'
+    reference = db.Column(db.String(64), nullable=False)  # What the message is about, e.g. the idle conversation's updated_at
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending -> sent | failed
+    error = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT), nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+
+class ErasureRequest(db.Model):
+    """ A user's request to delete their data, processed by the retention job (backend/utils/retention.py). """
+    __tablename__ = 'erasure_requests'
+    __table_args__ = (
+        db.Index('ix_erasure_requests_status_due_at', 'status', 'due_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    phone_number = db.Column(db.String(64), nullable=False)  # Replaced by its SHA-256 once erased
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending -> done
+    due_at = db.Column(db.DateTime, nullable=False)
+    rows_deleted = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT), nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+
+class SchedulerCursor(db.Model):
+    """ Per-job progress marker so scheduled jobs resume where they stopped. """
+    __tablename__ = 'scheduler_cursors'
+
+    job = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.String(100), nullable=True)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(MYT), onupdate=lambda: datetime.now(MYT))
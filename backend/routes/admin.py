@@ -1,10 +1,13 @@
 # backend/routes/admin.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..decorators import admin_required  # Relative import
 from backend.extensions import db
 from ..models import Lead, User  # Relative import
+from ..utils.chat_archive import chat_history
+from ..utils.lead_export import DEFAULT_PAGE_SIZE, fetch_leads_page, iter_leads_csv, iter_leads_ndjson
+from ..utils.rollups import summarize_rollups
 
 import logging
 
@@ -15,36 +18,41 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 @admin_required
 def get_all_leads():
     """
-    Retrieves all leads. Accessible only to admins.
+    Retrieves leads one keyset page at a time. Accessible only to admins.
+    Query params: after_id (default 0) and limit (default 100, max 1000).
     """
     try:
-        leads = Lead.query.all()
-        leads_data = []
-        for lead in leads:
-            leads_data.append({
-                'id': lead.id,
-                'phone_number': lead.phone_number,  # Assuming phone number is a key field
-                'user_id': lead.user_id,
-                'property_reference': lead.property_reference,
-                'original_loan_amount': lead.original_loan_amount,
-                'original_loan_tenure': lead.original_loan_tenure,
-                'current_repayment': lead.current_repayment,
-                'new_repayment': lead.new_repayment,
-                'monthly_savings': lead.monthly_savings,
-                'yearly_savings': lead.yearly_savings,
-                'total_savings': lead.total_savings,
-                'years_saved': lead.years_saved,
-                'interest_rate': lead.interest_rate,
-                'remaining_tenure': lead.remaining_tenure,
-                'created_at': lead.created_at,
-                'updated_at': lead.updated_at
-            })
-        return jsonify({'leads': leads_data}), 200
+        after_id = request.args.get('after_id', 0, type=int)
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+
+        leads_data, next_after_id = fetch_leads_page(after_id=after_id, limit=limit)
+        return jsonify({'leads': leads_data, 'next_after_id': next_after_id}), 200
     except Exception as e:
         logging.error(f"❌ Error occurred while fetching leads: {e}")
         return jsonify({'message': 'An error occurred while fetching leads.'}), 500
 
 
+@admin_bp.route('/leads/export', methods=['GET'])
+@jwt_required()
+@admin_required
+def export_leads():
+    """
+    Streams every lead as NDJSON (default) or CSV. Accessible only to admins.
+    Rows are fetched in batches so memory use stays flat regardless of table size.
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format == 'csv':
+        chunks, mimetype, extension = iter_leads_csv(), 'text/csv', 'csv'
+    elif export_format == 'ndjson':
+        chunks, mimetype, extension = iter_leads_ndjson(), 'application/x-ndjson', 'ndjson'
+    else:
+        return jsonify({'message': 'Invalid format. Valid formats: ndjson, csv.'}), 400
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=leads.{extension}'
+    return response
+
+
 @admin_bp.route('/lead/<int:lead_id>', methods=['PUT'])
 @jwt_required()
 @admin_required
@@ -71,4 +79,45 @@ def update_lead_status(lead_id):
         logging.error(f"❌ Error occurred while updating lead status: {e}")
         return jsonify({'message': 'An error occurred while updating lead status.'}), 500
 
+
+@admin_bp.route('/analytics/leads', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_lead_analytics():
+    """
+    Returns dashboard lead analytics from pre-aggregated rollups. Accessible only to admins.
+    Query params: days (default 30, max 366).
+    """
+    try:
+        days = max(1, min(request.args.get('days', 30, type=int), 366))
+        return jsonify(summarize_rollups(days=days)), 200
+    except Exception as e:
+        logging.error(f"❌ Error occurred while fetching lead analytics: {e}")
+        return jsonify({'message': 'An error occurred while fetching lead analytics.'}), 500
+
+
+@admin_bp.route('/chat-history/<phone_number>', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_chat_history(phone_number):
+    """
+    Returns a user's full chat history, including logs moved to the cold archive. Accessible only to admins.
+    Query params: archive (default true); false returns only the recent, hot rows.
+    """
+    try:
+        user = User.query.filter_by(phone_number=phone_number).first()
+        if not user:
+            return jsonify({'message': 'User not found.'}), 404
+        include_archive = request.args.get('archive', 'true').lower() in ['true', '1', 'yes']
+        history = [
+            {'id': row['id'], 'message': row['message'], 'created_at': row['created_at'].isoformat(),
+             'archived': row['archived']}
+            for row in chat_history(user.id, include_archive=include_archive)
+        ]
+        return jsonify({'phone_number': phone_number, 'chat_logs': history}), 200
+    except Exception as e:
+        logging.error(f"❌ Error occurred while fetching chat history: {e}")
+        return jsonify({'message': 'An error occurred while fetching chat history.'}), 500
+
+
 # Add more admin routes as needed
@@ -1,10 +1,9 @@
-# Keep existing logging setup at the top
 import logging
 
 # System imports
 import json
-import traceback
 import os
+import time
 import pytz
 
 # Flask imports
@@ -15,26 +14,30 @@ chatbot_bp = Blueprint('chatbot', __name__)
 
 # Custom project imports
 from backend.utils.calculation import calculate_refinance_savings
-from backend.utils.whatsapp import send_whatsapp_message
 from backend.models import User, Lead, ChatflowTemp, ChatLog
-from backend.extensions import db
-import openai  # Correctly import the openai module
+from backend.extensions import db, registry
+from backend.utils.openai_client import get_openai
 from backend.utils.presets import get_preset_response
+from backend.utils.query_router import answer_length_hint, context_prompt, get_query_router
+from backend.utils.rollups import record_conversation, record_lead
+from backend.utils.singleflight import coalesce, normalize_text
+from backend.utils.sql_audit import query_budget
+from backend.utils.debounce import buffer_message
+from backend.utils.outbox import queue_message
+from backend.utils.unit_of_work import defer, unit_of_work
+from backend.utils import funnel
+from backend.utils.load_shedding import busy_message, get_admission_controller, parse_request_start
+from backend.utils.lead_digest import admin_lead_recipient, is_high_value
+from backend.utils.whatsapp import send_in_background
+from backend.utils.intents import GREETING, RESTART, detect_intents
+from backend.utils.language import remember_language, resolve_language
+from backend.utils.tracing import traced
 from datetime import datetime
 
 MYT = pytz.timezone('Asia/Kuala_Lumpur')  # Malaysia timezone
 
-openai.api_key = os.getenv("OPENAI_API_KEY").strip()
-
-# Logging setup
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("debug.log")
-    ]
-)
+# Logging is configured once in create_app (backend.logging_config)
+logger = logging.getLogger(__name__)
 
 ADMIN_PHONE_NUMBER = os.getenv('ADMIN_PHONE_NUMBER', '60126181683')
 WHATSAPP_LINK = f"https://wa.me/{ADMIN_PHONE_NUMBER}"
@@ -70,15 +73,6 @@ PROMPTS = {
     }
 }
 
-openai.api_key = os.getenv("OPENAI_API_KEY").strip()
-
-# Add greeting patterns
-GREETING_PATTERNS = {
-    'en': ['hi', 'hey', 'hello', 'start', 'begin', 'help'],
-    'ms': ['hai', 'apa khabar', 'selamat', 'mula', 'tolong'],
-    'zh': ['你好', '哈罗', '开始', '帮助']
-}
-
 
 
 # ✅ Add routes (Example Route)
@@ -121,13 +115,8 @@ def validate_process_completion(x, user_data=None):
     return True, ""
 
 def is_greeting(message):
-    """Check if the message is a greeting in any supported language."""
-    message_lower = message.lower().strip()
-    return any(
-        greeting in message_lower 
-        for greetings in GREETING_PATTERNS.values() 
-        for greeting in greetings
-    )
+    """Check if the message opens with a greeting in any supported language (see backend.utils.intents)."""
+    return GREETING in detect_intents(message)
 
 
 STEP_CONFIG = {
@@ -163,47 +152,6 @@ STEP_CONFIG = {
     }
 }
 
-def delete_chatflow_data(phone_number):
-    """Delete all chatflow data for a specific phone number."""
-    ChatflowTemp.query.filter_by(phone_number=phone_number).delete()
-    db.session.commit()
-
-def process_user_input(current_step, user_data, message_body):
-    """Process user input and store it in ChatflowTemp with separate columns."""
-    data_to_update = {}
-
-    if current_step == 'choose_language':
-        language_mapping = {'1': 'en', '2': 'ms', '3': 'zh'}
-        if message_body in language_mapping:
-            data_to_update['language_code'] = language_mapping[message_body]
-            user_data.language_code = language_mapping[message_body]
-        else:
-            logging.error(f"❌ Invalid language selection: {message_body}")
-            user_data.language_code = 'en'
-
-    elif current_step == 'get_name':
-        data_to_update['name'] = message_body.title()
-
-    elif current_step == 'get_loan_amount':
-        data_to_update['original_loan_amount'] = float(message_body)
-
-    elif current_step == 'get_loan_tenure':
-        data_to_update['original_loan_tenure'] = int(message_body)
-
-    elif current_step == 'get_monthly_repayment':
-        data_to_update['current_repayment'] = float(message_body)
-
-    for key, value in data_to_update.items():
-        setattr(user_data, key, value)
-
-    next_step = STEP_CONFIG.get(current_step, {}).get('next_step')
-    if next_step:
-        user_data.current_step = next_step
-
-    db.session.commit()
-    logging.info(f"✅ Updated step for user to {user_data.current_step}")
-    return jsonify({"status": "success"}), 200
-
 # Map numbers to language codes
 LANGUAGE_MAP = {'1': 'en', '2': 'ms', '3': 'zh'}
 
@@ -234,27 +182,27 @@ LANGUAGE_OPTIONS = {
     }
 }
 
-def get_message(key, language_code):
-    """ Retrieve a message from the appropriate language file. """
-    try:
-        # Map language codes if provided as 1, 2, or 3
-        if language_code in ['1', '2', '3']:
-            language_code = {'1': 'en', '2': 'ms', '3': 'zh'}[language_code]
-
-        # Check LANGUAGE_OPTIONS first, then fallback to PROMPTS
-        if language_code in LANGUAGE_OPTIONS and key in LANGUAGE_OPTIONS[language_code]:
-            message = LANGUAGE_OPTIONS[language_code].get(key, 'Message not found')
-        elif language_code in PROMPTS and key in PROMPTS[language_code]:
-            message = PROMPTS[language_code].get(key, 'Message not found')
-        else:
-            logging.error(f"Key '{key}' not found in LANGUAGE_OPTIONS or PROMPTS for language '{language_code}'.")
-            return 'Message not found'
-
-    except Exception as e:
-        logging.error(f"❌ Error in get_message: {e}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        message = 'Message not found'
+def compile_messages():
+    """
+    Merge PROMPTS and LANGUAGE_OPTIONS into one lookup table per language (LANGUAGE_OPTIONS wins),
+    keyed by both the language code and its menu number. Built once at import, which under
+    gunicorn's preload_app happens in the master, so workers share it copy-on-write.
+    """
+    messages = {}
+    for language_code in PROMPTS.keys() | LANGUAGE_OPTIONS.keys():
+        messages[language_code] = {**PROMPTS.get(language_code, {}), **LANGUAGE_OPTIONS.get(language_code, {})}
+    for number, language_code in LANGUAGE_MAP.items():
+        messages[number] = messages[language_code]
+    return messages
+
+MESSAGES = compile_messages()
 
+def get_message(key, language_code):
+    """ Retrieve a message from the compiled message table. """
+    message = MESSAGES.get(language_code, {}).get(key)
+    if message is None:
+        logger.error("Key '%s' not found in LANGUAGE_OPTIONS or PROMPTS for language '%s'.", key, language_code)
+        return 'Message not found'
     return message
 
 
@@ -272,8 +220,9 @@ def process_user_input(current_step, user_data, message_body):
         if message_body in language_mapping:
             data_to_update['language_code'] = language_mapping[message_body]
             user_data.language_code = language_mapping[message_body]
+            remember_language(user_data.phone_number, user_data.language_code)
         else:
-            logging.error(f"❌ Invalid language selection: {message_body}")
+            logger.error("Invalid language selection: %s", message_body)
             user_data.language_code = 'en'
 
     elif current_step == 'get_name':
@@ -281,6 +230,7 @@ def process_user_input(current_step, user_data, message_body):
 
     elif current_step == 'get_loan_amount':
         data_to_update['original_loan_amount'] = float(message_body)
+        record_conversation(user_data.language_code, data_to_update['original_loan_amount'])
 
     elif current_step == 'get_loan_tenure':
         data_to_update['original_loan_tenure'] = int(message_body)
@@ -291,180 +241,190 @@ def process_user_input(current_step, user_data, message_body):
     for key, value in data_to_update.items():
         setattr(user_data, key, value)
 
+    defer(funnel.step_exited, current_step, user_data.updated_at)
+
     next_step = STEP_CONFIG.get(current_step, {}).get('next_step')
     if next_step:
         user_data.current_step = next_step
+        defer(funnel.step_entered, next_step)
 
-    db.session.commit()
-    logging.info(f"✅ Updated step for user to {user_data.current_step}")
+    # Committed with the rest of the message by the unit of work in process_message
+    logger.debug("Updated step for %s to %s", user_data.phone_number, user_data.current_step)
+    return jsonify({"status": "success"}), 200
+
+def send_reply(phone_number, message):
+    """ Send a WhatsApp message once the current message's changes are committed, coalesced with its other replies. """
+    queue_message(phone_number, message)
+
+def start_flow(phone_number, user_data, language_code=None):
+    """ Welcome the user and ask for their name in language_code, or show the language menu when it is unknown. """
+    if language_code in PROMPTS:
+        user_data.language_code = language_code
+        user_data.current_step = 'get_name'
+        defer(funnel.step_entered, 'get_name')
+        message = PROMPTS[language_code]['welcome_message'] + "\n\n" + PROMPTS[language_code]['get_name']
+    else:
+        user_data.current_step = 'choose_language'
+        defer(funnel.step_entered, 'choose_language')
+        message = PROMPTS['en']['welcome_message'] + "\n\n" + PROMPTS['en']['choose_language']
+    send_reply(phone_number, message)
     return jsonify({"status": "success"}), 200
 
 @chatbot_bp.route('/process_message', methods=['POST'])
+# One commit per message (unit_of_work); a completion measures ~7 queries, 10 for a first-time user
+@query_budget(12, max_commits=1)
+@traced('chatbot.process_message')
 def process_message():
     try:
         data = request.get_json()
         phone_number = data['entry'][0]['changes'][0]['value']['contacts'][0]['wa_id']
         message_body = data['entry'][0]['changes'][0]['value']['messages'][0]['text']['body'].strip()
 
-        logging.info(f"💎 Incoming message from {phone_number}: {message_body}")
-
-        # Get ChatflowTemp Data
-        user_data = db.session.query(ChatflowTemp).filter_by(phone_number=phone_number).first()
-
-        # Handle greetings or new user
-        if not user_data or is_greeting(message_body):
-            if user_data:
-                # Reset existing user if greeting received
-                user_data.current_step = 'choose_language'
-                user_data.mode = 'flow'
-                user_data.name = None
-                user_data.original_loan_amount = None
-                user_data.original_loan_tenure = None
-                user_data.current_repayment = None
-            else:
-                # Create new user
-                user_data = ChatflowTemp(
-                    phone_number=phone_number,
-                    current_step='choose_language',
-                    language_code='en',
-                    mode='flow'
-                )
-                db.session.add(user_data)
-            
-            db.session.commit()
-            message = PROMPTS['en']['welcome_message'] + "\n\n" + PROMPTS['en']['choose_language']
-            send_whatsapp_message(phone_number, message)
-            return jsonify({"status": "success"}), 200
-
-        # Handle 24-hour reminder with timezone fix
-        last_active = user_data.updated_at.replace(tzinfo=MYT)
-        if (datetime.now(MYT) - last_active).total_seconds() > 86400:  # 24 hours
-            reminder_message = (
-                "Welcome back! If you'd like to recalculate your savings, please type 'restart'. "
-                "Otherwise, feel free to ask any questions about refinancing or home loans!"
-            )
-            send_whatsapp_message(phone_number, reminder_message)
+        logger.debug("Incoming message from %s: %s", phone_number, message_body)
+
+        get_admission_controller().observe_queue_wait(parse_request_start(request.headers.get('X-Request-Start')))
 
-        # Rest of the existing process_message code remains the same...
-        # Handle "restart" command
-        if message_body.lower() == 'restart':
-            logging.info(f"🔄 Restarting flow for user {phone_number}")
-            user_data.current_step = 'choose_language'
+        # Bursts of quick messages are handled together once the user pauses (INBOUND_DEBOUNCE_MS)
+        if buffer_message(phone_number, message_body, process_text):
+            return jsonify({"status": "buffered"}), 200
+        return process_text(phone_number, message_body)
+
+    except Exception as e:
+        logger.exception("Error in process_message: %s", e)
+        return jsonify({"status": "error"}), 500
+
+def process_text(phone_number, message_body):
+    """ Handle one (possibly combined) incoming message in its own unit of work. """
+    # Counted as in flight for load shedding; one transaction per message, replies sent only after the commit
+    with get_admission_controller().admit(), unit_of_work():
+        return handle_message(phone_number, message_body)
+
+def handle_message(phone_number, message_body):
+    """ Advance the conversation for one incoming message (runs inside a unit of work). """
+    # Get ChatflowTemp Data
+    user_data = db.session.query(ChatflowTemp).filter_by(phone_number=phone_number).first()
+    intents = detect_intents(message_body)
+
+    # Handle greetings or new user
+    if not user_data or GREETING in intents:
+        if user_data:
+            # Reset existing user if greeting received
             user_data.mode = 'flow'
             user_data.name = None
             user_data.original_loan_amount = None
             user_data.original_loan_tenure = None
             user_data.current_repayment = None
-            db.session.commit()
-            message = PROMPTS['en']['welcome_message'] + "\n\n" + PROMPTS['en']['choose_language']
-            send_whatsapp_message(phone_number, message)
-            return jsonify({"status": "success"}), 200
-
-        # Check if user is in query mode
-        if user_data.mode == 'query':
-            logging.info(f"🟢 User {phone_number} is in query mode.")
-            response = handle_gpt_query(message_body, user_data, phone_number)
-            send_whatsapp_message(phone_number, response)
-            return jsonify({"status": "success"}), 200
-
-        # Process Current Step
-        current_step = user_data.current_step or 'choose_language'
-        step_info = STEP_CONFIG.get(current_step)
-        
-        is_valid, error_message = step_info['validator'](message_body, user_data)
-        if not is_valid:
-            send_whatsapp_message(phone_number, error_message)
-            return jsonify({"status": "failed"}), 400
+        else:
+            # Create new user
+            user_data = ChatflowTemp(
+                phone_number=phone_number,
+                current_step='choose_language',
+                language_code='en',
+                mode='flow'
+            )
+            db.session.add(user_data)
+
+        # Skip the language menu when the language is stored, cached or clear from the message
+        return start_flow(phone_number, user_data, resolve_language(phone_number, message_body, user_data))
+
+    # Idle users are nudged by the scheduler worker (backend/scheduler.py), not here
+    # Rest of the existing process_message code remains the same...
+    # Handle "restart" command
+    if RESTART in intents:
+        logger.info("Restarting flow for %s", phone_number)
+        user_data.mode = 'flow'
+        user_data.name = None
+        user_data.original_loan_amount = None
+        user_data.original_loan_tenure = None
+        user_data.current_repayment = None
+        # Always offer the menu on restart, so a wrongly detected language can be changed
+        return start_flow(phone_number, user_data)
+
+    # Check if user is in query mode
+    if user_data.mode == 'query':
+        logger.debug("User %s is in query mode", phone_number)
+        response = handle_gpt_query(message_body, user_data, phone_number)
+        send_reply(phone_number, response)
+        return jsonify({"status": "success"}), 200
 
-        process_user_input(current_step, user_data, message_body)
+    # Process Current Step
+    current_step = user_data.current_step or 'choose_language'
+    step_info = STEP_CONFIG.get(current_step)
+    
+    is_valid, error_message = step_info['validator'](message_body, user_data)
+    if not is_valid:
+        defer(funnel.step_failed, current_step)
+        send_reply(phone_number, error_message)
+        return jsonify({"status": "failed"}), 400
 
-        if step_info['next_step'] == 'process_completion':
-            return handle_process_completion(phone_number)
+    process_user_input(current_step, user_data, message_body)
 
-        user_language_code = user_data.language_code or 'en'
-        message = get_message(step_info['next_step'], user_language_code)
-        send_whatsapp_message(phone_number, message)
+    if step_info['next_step'] == 'process_completion':
+        return handle_process_completion(phone_number, user_data)
 
-        return jsonify({"status": "success"}), 200
+    user_language_code = user_data.language_code or 'en'
+    message = get_message(step_info['next_step'], user_language_code)
+    send_reply(phone_number, message)
+
+    return jsonify({"status": "success"}), 200
 
-    except Exception as e:
-        logging.error(f"❌ Error in process_message: {str(e)}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        db.session.rollback()
-        return jsonify({"status": "error"}), 500
     
-def handle_process_completion(phone_number):
-    """ Handles the completion of the process and calculates refinance savings. """
-    try:
-        user_data = db.session.query(ChatflowTemp).filter_by(phone_number=phone_number).first()
-        
-        if not user_data:
-            logging.error(f"❌ No user_data found for phone: {phone_number}")
-            return jsonify({"status": "error", "message": "No user data found"}), 404
-
-        # Hardcoded admin phone number
-        admin_phone_number = '60126181683'
-
-        # Calculate refinance savings
-        calculation_results = calculate_refinance_savings(
-            user_data.original_loan_amount, 
-            user_data.original_loan_tenure, 
-            user_data.current_repayment
-        )
+@traced()
+def handle_process_completion(phone_number, user_data):
+    """
+    Handles the completion of the process and calculates refinance savings.
+    Runs inside the message's unit of work: the lead, rollups and mode change are
+    committed together, and the summary and admin messages go out only after that.
+    """
+    # Hardcoded admin phone number
+    admin_phone_number = '60126181683'
 
-        # Handle case where new repayment is higher than current repayment
-        if calculation_results.get('new_monthly_repayment', 0.0) >= user_data.current_repayment:
-            message = (
-                "Thank you for using FinZo AI! Based on our calculations, refinancing may result in higher payments.\n\n"
-                "💬 If you'd still like to explore options, feel free to contact our admin for further assistance at "
-                f"https://wa.me/{admin_phone_number}"
-            )
-            send_whatsapp_message(phone_number, message)
-            user_data.mode = 'query'
-            db.session.commit()
-            return jsonify({"status": "success"}), 200
-
-        # Handle no results or no savings
-        if not calculation_results or calculation_results.get('monthly_savings', 0) <= 0:
-            message = (
-                "Thank you for using FinZo AI! Your current loan rates are already in great shape. "
-                "We’ll be in touch if better offers become available.\n\n"
-                f"📞 Contact admin at https://wa.me/{admin_phone_number} for help or questions!"
-            )
-            send_whatsapp_message(phone_number, message)
-            user_data.mode = 'query'
-            db.session.commit()
-            return jsonify({"status": "success"}), 200
-
-        # Prepare and send summary messages
-        language_code = user_data.language_code if user_data.language_code in LANGUAGE_OPTIONS else 'en'
-        try:
-            summary_messages = prepare_summary_messages(user_data, calculation_results, language_code)
-            for message in summary_messages:
-                send_whatsapp_message(phone_number, message)
-        except Exception as e:
-            logging.error(f"❌ Error while preparing or sending summary messages: {str(e)}")
-            return jsonify({"status": "error", "message": "Failed to send summary messages."}), 500
-
-        # Notify admin and update database
-        try:
-            send_new_lead_to_admin(phone_number, user_data, calculation_results)
-            update_database(phone_number, user_data, calculation_results)
-        except Exception as e:
-            logging.error(f"❌ Error while notifying admin or updating database: {str(e)}")
-            return jsonify({"status": "error", "message": "Failed to update admin or database."}), 500
-
-        # Commit only after all tasks succeed
+    # Calculate refinance savings
+    calculation_results = calculate_refinance_savings(
+        user_data.original_loan_amount, 
+        user_data.original_loan_tenure, 
+        user_data.current_repayment
+    )
+
+    # Handle case where new repayment is higher than current repayment
+    if calculation_results.get('new_monthly_repayment', 0.0) >= user_data.current_repayment:
+        message = (
+            "Thank you for using FinZo AI! Based on our calculations, refinancing may result in higher payments.\n\n"
+            "💬 If you'd still like to explore options, feel free to contact our admin for further assistance at "
+            f"https://wa.me/{admin_phone_number}"
+        )
+        send_reply(phone_number, message)
         user_data.mode = 'query'
-        db.session.commit()
+        defer(funnel.step_exited, 'process_completion')
+        return jsonify({"status": "success"}), 200
 
+    # Handle no results or no savings
+    if not calculation_results or calculation_results.get('monthly_savings', 0) <= 0:
+        message = (
+            "Thank you for using FinZo AI! Your current loan rates are already in great shape. "
+            "We’ll be in touch if better offers become available.\n\n"
+            f"📞 Contact admin at https://wa.me/{admin_phone_number} for help or questions!"
+        )
+        send_reply(phone_number, message)
+        user_data.mode = 'query'
+        defer(funnel.step_exited, 'process_completion')
         return jsonify({"status": "success"}), 200
 
-    except Exception as e:
-        logging.error(f"❌ Error in handle_process_completion: {str(e)}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        db.session.rollback()
-        return jsonify({"status": "error", "message": "Something went wrong"}), 500
+    # Prepare and queue summary messages. Any failure from here on propagates so the
+    # unit of work rolls the whole message back and nothing is sent.
+    language_code = user_data.language_code if user_data.language_code in LANGUAGE_OPTIONS else 'en'
+    summary_messages = prepare_summary_messages(user_data, calculation_results, language_code)
+    for message in summary_messages:
+        send_reply(phone_number, message)
+
+    # Save the lead and notify admin (the notification is sent after the commit)
+    update_database(phone_number, user_data, calculation_results)
+    send_new_lead_to_admin(phone_number, user_data, calculation_results)
+
+    user_data.mode = 'query'
+    defer(funnel.step_exited, 'process_completion')
+
+    return jsonify({"status": "success"}), 200
 
 def prepare_summary_messages(user_data, calculation_results, language_code):
     """ Prepares the summary messages to be sent to the user. """
@@ -501,6 +461,7 @@ def prepare_summary_messages(user_data, calculation_results, language_code):
 
     return [summary_message_1, summary_message_2, summary_message_3]
 
+@traced()
 def update_database(phone_number, user_data, calculation_results):
     try:
         user = User.query.filter_by(wa_id=phone_number).first()
@@ -528,21 +489,33 @@ def update_database(phone_number, user_data, calculation_results):
         )
 
         db.session.add(lead)
-        db.session.commit()
-        logging.info(f"✅ Database updated successfully for user {phone_number}")
+        record_lead(
+            user_data.language_code,
+            lead.original_loan_amount,
+            lead.monthly_savings,
+            lead.total_savings
+        )
+        db.session.flush()  # Surface constraint errors here; the commit happens once per message
+        logger.info("Lead saved for %s", phone_number)
 
     except Exception as e:
-        logging.error(f"❌ Error updating database for {phone_number}: {str(e)}")
-        db.session.rollback()
+        logger.error("Error updating database for %s: %s", phone_number, e)
+        raise
 
 
+@traced()
 def send_new_lead_to_admin(phone_number, user_data, calculation_results):
-    """Enhanced admin notification with clearer formatting."""
-    admin_number = os.getenv('ADMIN_PHONE_NUMBER')
+    """
+    Alert the admin right away about a high-value lead; the others wait for the
+    scheduler's lead digest (backend/utils/lead_digest.py).
+    """
+    admin_number = admin_lead_recipient()
     if not admin_number:
-        logging.error("ADMIN_PHONE_NUMBER not set in environment variables.")
+        logger.error("ADMIN_PHONE_NUMBER not set in environment variables.")
         return
-    
+    if not is_high_value(calculation_results.get('monthly_savings', 0), registry.config):
+        return
+
     message = (
         f"🔔 *NEW LEAD DETAILS*\n\n"
         f"👤 *Client Information*\n"
@@ -560,8 +533,10 @@ def send_new_lead_to_admin(phone_number, user_data, calculation_results):
         f"• Time Saved: {calculation_results.get('years_saved', 0)} years"
     )
 
-    send_whatsapp_message(admin_number, message)
+    # Sent after the commit by a background thread, so the user's reply never waits on it
+    defer(send_in_background, admin_number, message)
 
+@traced()
 def handle_gpt_query(question, user_data, phone_number):
     """Handles GPT query requests with improved response handling."""
     try:
@@ -578,35 +553,50 @@ def handle_gpt_query(question, user_data, phone_number):
             "8. Maintain focus on refinancing, home loans, mortgage rates, eligibility, payments, and savings"
         )
 
-        # Handle common questions directly without GPT
-        lower_question = question.lower()
-        if "admin" in lower_question or "contact" in lower_question:
-            return "You can contact our admin directly at wa.me/60126181683"
-        elif "your name" in lower_question:
-            return "I am FinZo AI, your refinancing assistant."
-        elif "who" in lower_question and "work" in lower_question:
-            return "I am FinZo AI, created to help with refinancing and home loan queries."
-
-        # For other questions, use GPT-3.5-turbo
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            temperature=0.7,
-            max_tokens=150
-        )
-        
-        message = response.choices[0].message.content.strip()
-        
+        # Shortcuts and confident FAQ matches are answered locally; the rest goes to the route's model,
+        # grounded in the passages retrieved for the question
+        language_code = getattr(user_data, 'language_code', None) or 'en'
+        router = get_query_router()
+        route = router.route(question, language_code)
+        if route.answer:
+            return route.answer
+        # Under overload model calls are shed first, so flow steps keep their capacity (backend/utils/load_shedding.py)
+        if get_admission_controller().shed_model_call():
+            return busy_message(language_code)
+
+        def ask_openai():
+            started = time.perf_counter()
+            usage = None
+            try:
+                messages = [{"role": "system", "content": f"{system_prompt}\n{answer_length_hint(route)}"}]
+                if route.context:
+                    messages.append({"role": "system", "content": context_prompt(route)})
+                messages.append({"role": "user", "content": question})
+                response = get_openai().ChatCompletion.create(
+                    model=route.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=route.max_tokens
+                )
+                usage = response.get('usage')
+                return response.choices[0].message.content.strip()
+            finally:
+                router.record(route, time.perf_counter() - started, usage)
+
+        # Identical questions asked at the same time (e.g. after a broadcast) share one OpenAI call. The key
+        # covers everything in the prompt: retrieved context is per language, so users in different languages
+        # never share an answer (coalesce hashes the key parts, so the context adds nothing to the key's size)
+        message = coalesce('openai_answer',
+                           (language_code, route.model, route.max_tokens, route.context, normalize_text(question)),
+                           ask_openai)
+
         # Log query
         log_gpt_query(phone_number, question, message)
         
         return message
 
     except Exception as e:
-        logging.error(f"❌ Error while handling GPT query for {phone_number}: {str(e)}")
+        logger.error("Error while handling GPT query for %s: %s", phone_number, e)
         return (
             "We're currently experiencing issues processing your request. "
             "Please try again later or contact our admin for assistance: wa.me/60126181683"
@@ -614,59 +604,59 @@ def handle_gpt_query(question, user_data, phone_number):
 
 
 def log_chat(phone_number, user_message, bot_message):
-    """Logs regular chats into ChatLog table with valid user_id."""
+    """Logs regular chats into ChatLog table with valid user_id (committed with the message)."""
     try:
         # 🟢 Ensure phone_number is always a string
         phone_number = str(phone_number)
 
-        # 🟢 Fetch or Create User
-        user = User.query.filter_by(phone_number=phone_number).first()
-        if not user:
-            user = User(
-                wa_id=phone_number,
-                phone_number=phone_number,
-                name="Unknown User"
-            )
-            db.session.add(user)
-            db.session.flush()  # Get user ID before commit
+        # Savepoint: a failed log write must not roll back the rest of the message
+        with db.session.begin_nested():
+            # 🟢 Fetch or Create User
+            user = User.query.filter_by(phone_number=phone_number).first()
+            if not user:
+                user = User(
+                    wa_id=phone_number,
+                    phone_number=phone_number,
+                    name="Unknown User"
+                )
+                db.session.add(user)
+                db.session.flush()  # Get user ID before commit
 
-        # 🟢 Log the Chat
-        chat_log = ChatLog(  # Correct Model Name
-            user_id=user.id,
-            message=f"User: {user_message}\nBot: {bot_message}"
-        )
-        db.session.add(chat_log)
-        db.session.commit()
-        logging.info(f"✅ Chat logged for user {user.phone_number}")
+            # 🟢 Log the Chat
+            chat_log = ChatLog(  # Correct Model Name
+                user_id=user.id,
+                message=f"User: {user_message}\nBot: {bot_message}"
+            )
+            db.session.add(chat_log)
+        logger.debug("Chat logged for %s", user.phone_number)
 
     except Exception as e:
-        logging.error(f"❌ Error while logging chat: {str(e)}")
-        db.session.rollback()
+        logger.error("Error while logging chat: %s", e)
 
 def log_gpt_query(phone_number, user_message, bot_response):
-    """Logs the GPT query to the ChatLog table with user_id properly set."""
+    """Logs the GPT query to the ChatLog table with user_id properly set (committed with the message)."""
     try:
-        # 🟢 Step 1: Fetch or Create User
-        user = User.query.filter_by(phone_number=phone_number).first()
-        if not user:
-            # Create user if it doesn't exist
-            user = User(
-                wa_id=phone_number,
-                phone_number=phone_number,
-                name="Unknown User"
-            )
-            db.session.add(user)
-            db.session.flush()  # Ensures user.id is available before commit
+        # Savepoint: a failed log write must not roll back the rest of the message
+        with db.session.begin_nested():
+            # 🟢 Step 1: Fetch or Create User
+            user = User.query.filter_by(phone_number=phone_number).first()
+            if not user:
+                # Create user if it doesn't exist
+                user = User(
+                    wa_id=phone_number,
+                    phone_number=phone_number,
+                    name="Unknown User"
+                )
+                db.session.add(user)
+                db.session.flush()  # Ensures user.id is available before commit
 
-        # 🟢 Step 2: Insert ChatLog with correct user_id
-        chat_log = ChatLog(
-            user_id=user.id,  # Use valid user ID
-            message=f"User: {user_message}\nBot: {bot_response}"
-        )
-        db.session.add(chat_log)
-        db.session.commit()
-        logging.info(f"✅ GPT query logged for user {user.phone_number}")
+            # 🟢 Step 2: Insert ChatLog with correct user_id
+            chat_log = ChatLog(
+                user_id=user.id,  # Use valid user ID
+                message=f"User: {user_message}\nBot: {bot_response}"
+            )
+            db.session.add(chat_log)
+        logger.debug("GPT query logged for %s", user.phone_number)
 
     except Exception as e:
-        logging.error(f"❌ Error logging GPT query for {phone_number}: {str(e)}")
-        db.session.rollback()
+        logger.error("Error logging GPT query for %s: %s", phone_number, e)
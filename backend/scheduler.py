@@ -0,0 +1,218 @@
+"""
+Background scheduler for proactive messages; runs as its own process.
+
+Request handling never does this work: the Procfile's worker dyno runs
+`python -m backend.scheduler`, which loops over the jobs every
+SCHEDULER_INTERVAL_SECONDS.
+
+    reminders      Conversations stalled mid-flow for REMINDER_IDLE_HOURS get one
+                   nudge that repeats the prompt for the step they stopped at.
+    rate_changes   When a bank rate is added or changed, past leads whose repayment
+                   it would cut noticeably are told about it
+                   (backend.utils.rate_renotify).
+    chat_archive   Chat logs older than CHAT_ARCHIVE_AFTER_DAYS move to compressed
+                   segment files (backend.utils.chat_archive).
+    retention      Erasure requests and expired rows are deleted in small,
+                   rate-limited batches (backend.utils.retention).
+    lead_digest    New leads are sent to the admin as one digest every
+                   LEAD_DIGEST_INTERVAL_MINUTES or LEAD_DIGEST_MAX_LEADS leads
+                   (backend.utils.lead_digest).
+
+Reminder candidates come from range scans on the (mode, updated_at) index of
+chatflow_temp, in keyset-ordered batches of SCHEDULER_BATCH_SIZE. Messages are
+claimed in outreach_log before sending and spaced to SCHEDULER_SEND_RATE per
+second (backend.utils.outreach), so several scheduler processes, or a re-run
+after a crash, never send the same message twice.
+
+WhatsApp only accepts free-form messages within 24 hours of the user's last
+message, so reminders go out between REMINDER_IDLE_HOURS and
+REMINDER_IDLE_HOURS + REMINDER_LOOKBACK_HOURS after it (20-23h by default).
+
+    python -m backend.scheduler     # run forever (worker process)
+    flask scheduler once            # run every job once and print what was sent
+"""
+import logging
+import signal
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+import pytz
+from flask.cli import AppGroup
+from sqlalchemy import and_, exists, or_, tuple_
+
+from backend.extensions import db
+from backend.models import BankRate, ChatflowTemp, OutreachLog
+from backend.utils import metrics
+from backend.utils.chat_archive import archive_chat_logs
+from backend.utils.lead_digest import send_lead_digest
+from backend.utils.outreach import Throttle, get_cursor, send_batch, set_cursor
+from backend.utils.retention import run_retention
+
+logger = logging.getLogger(__name__)
+
+MYT = pytz.timezone('Asia/Kuala_Lumpur')
+
+REMINDER_MESSAGES = {
+    'en': "👋 Still there? You're only a few steps away from seeing how much you could save by refinancing.\n\n"
+          "Just reply below to continue, or type 'restart' to start over.",
+    'ms': "👋 Masih di sana? Anda hanya beberapa langkah lagi untuk melihat berapa banyak yang anda boleh jimatkan.\n\n"
+          "Balas di bawah untuk teruskan, atau taip 'restart' untuk mula semula.",
+    'zh': "👋 还在吗？只需几步，您就能知道再融资可以为您节省多少。\n\n请直接回复继续，或输入 'restart' 重新开始。",
+}
+
+scheduler_cli = AppGroup('scheduler', help='Run proactive messaging jobs.')
+
+
+def _now():
+    """ Timestamps are stored as naive Malaysia time (see backend.models). """
+    return datetime.now(MYT).replace(tzinfo=None)
+
+
+def _language(language_code):
+    return language_code if language_code in REMINDER_MESSAGES else 'en'
+
+
+def _reminded_since_last_message():
+    return exists().where(OutreachLog.phone_number == ChatflowTemp.phone_number,
+                          OutreachLog.kind == 'reminder', OutreachLog.created_at >= ChatflowTemp.updated_at)
+
+
+def remind_idle_conversations(config, throttle, now=None):
+    """ Nudge users whose flow has been idle for REMINDER_IDLE_HOURS; returns outcome counts. """
+    from backend.routes.chatbot import get_message
+
+    now = now or _now()
+    idle_before = now - timedelta(hours=float(config.get('REMINDER_IDLE_HOURS', 20)))
+    idle_since = idle_before - timedelta(hours=float(config.get('REMINDER_LOOKBACK_HOURS', 3)))
+    batch_size = int(config.get('SCHEDULER_BATCH_SIZE', 100))
+
+    outcome = Counter()
+    position = (idle_since, 0)
+    while True:
+        rows = (
+            db.session.query(ChatflowTemp.id, ChatflowTemp.phone_number, ChatflowTemp.language_code,
+                             ChatflowTemp.current_step, ChatflowTemp.updated_at)
+            .filter(ChatflowTemp.mode == 'flow',
+                    ChatflowTemp.updated_at >= idle_since, ChatflowTemp.updated_at < idle_before,
+                    ChatflowTemp.current_step.isnot(None),
+                    tuple_(ChatflowTemp.updated_at, ChatflowTemp.id) > tuple_(*position),
+                    ~_reminded_since_last_message())
+            .order_by(ChatflowTemp.updated_at, ChatflowTemp.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        messages = []
+        for row in rows:
+            language_code = _language(row.language_code)
+            text = REMINDER_MESSAGES[language_code]
+            prompt = get_message(row.current_step, language_code)
+            if prompt:
+                text += "\n\n" + prompt
+            messages.append((row.phone_number, row.updated_at.isoformat(), text))
+        outcome += send_batch('reminder', messages, throttle)
+        position = (rows[-1].updated_at, rows[-1].id)
+    return outcome
+
+
+def _rate_position(rate):
+    return f"{rate.updated_at.isoformat()}|{rate.id}"
+
+
+def notify_rate_changes(config, throttle, now=None):
+    """ Re-notify past leads about bank rates added or changed since the last run; returns outcome counts. """
+    from backend.utils.bank_rates import load_bank_rate_index
+    from backend.utils.rate_renotify import renotify_leads
+
+    job = 'rate_changes'
+    position = get_cursor(job)
+    if position is None:
+        # First run: start from the current rates instead of announcing all of them
+        latest = db.session.query(BankRate).order_by(BankRate.updated_at.desc(), BankRate.id.desc()).first()
+        set_cursor(job, _rate_position(latest) if latest else '')
+        return Counter()
+    query = db.session.query(BankRate).order_by(BankRate.updated_at, BankRate.id)
+    if position:
+        updated_at, rate_id = position.split('|')
+        updated_at = datetime.fromisoformat(updated_at)
+        query = query.filter(or_(BankRate.updated_at > updated_at,
+                                 and_(BankRate.updated_at == updated_at, BankRate.id > int(rate_id))))
+    changed = query.all()
+    if not changed:
+        return Counter()
+
+    index = load_bank_rate_index()
+    outcome = Counter()
+    for rate in changed:
+        rate_outcome, finished = renotify_leads(rate, config, throttle, index)
+        outcome += rate_outcome
+        if not finished:
+            break  # Resumes from the pipeline's checkpoint on the next run
+        set_cursor(job, _rate_position(rate))
+    return outcome
+
+
+JOBS = {
+    'reminders': remind_idle_conversations,
+    'rate_changes': notify_rate_changes,
+    'chat_archive': archive_chat_logs,
+    'retention': run_retention,
+    'lead_digest': send_lead_digest,
+}
+
+
+def run_jobs(app, names=None):
+    """ Run the named jobs (all by default) once; a failing job is logged and never stops the others. """
+    throttle = Throttle(float(app.config.get('SCHEDULER_SEND_RATE', 10)))
+    results = {}
+    for name in names or JOBS:
+        with app.app_context():
+            try:
+                results[name] = JOBS[name](app.config, throttle)
+                if results[name]:
+                    logger.info("Scheduler job %s finished", name, extra={'outcome': dict(results[name])})
+            except Exception as e:
+                db.session.rollback()
+                metrics.inc('scheduler_job_failures_total', job=name)
+                logger.exception("Scheduler job %s failed: %s", name, e)
+            finally:
+                db.session.remove()
+    metrics.maybe_flush()
+    return results
+
+
+def run_forever(app):
+    """ Run all jobs every SCHEDULER_INTERVAL_SECONDS until SIGTERM/SIGINT. """
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    interval = float(app.config.get('SCHEDULER_INTERVAL_SECONDS', 60))
+    logger.info("Scheduler started; running %s every %ss", ', '.join(JOBS), interval)
+    while not stopping.is_set():
+        run_jobs(app)
+        stopping.wait(interval)
+    metrics.flush()
+    logger.info("Scheduler stopped")
+
+
+@scheduler_cli.command('once')
+@click.argument('jobs', nargs=-1, type=click.Choice(tuple(JOBS)))
+def once_command(jobs):
+    """ Run the given jobs (all by default) once. """
+    from flask import current_app
+
+    for name, outcome in run_jobs(current_app._get_current_object(), jobs or None).items():
+        click.echo(f"{name}: {dict(outcome)}")
+
+
+def main():
+    from backend.app import create_app
+    run_forever(create_app())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Amortization engine for home loans with fixed monthly repayments.
+
+Everything is closed-form annuity math, so building a schedule never loops
+over months to find the payment:
+
+    payment   = P * r(1+r)^n / ((1+r)^n - 1)
+    balance_k = P(1+r)^k - payment * ((1+r)^k - 1) / r
+    months    = -log(1 - rB / payment) / log(1+r)      (time to clear B paying `payment`)
+
+Schedules are immutable and memoized in an LRU keyed by (principal, annual
+rate, months), rounded to cents and basis points. Comparing the refinancing
+scenarios for one user therefore builds each schedule once, even when they
+try several options.
+
+Scenarios compared by compare_refinance():
+
+    lower_repayment  refinance the outstanding balance over the remaining tenure
+    shorten_tenure   keep paying the current repayment at the new rate; the loan ends early
+    cash_out         borrow the balance plus cash_out over the remaining tenure
+"""
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+SCHEDULE_CACHE_SIZE = 4096
+RATE_SOLVER_ITERATIONS = 60
+
+ScheduleRow = namedtuple('ScheduleRow', 'month payment interest principal balance')
+
+
+def _payment_factor(annual_rate, months):
+    """ Uncached payment_factor, for callers that try many one-off rates (the rate solver). """
+    if months <= 0:
+        return 0.0
+    monthly_rate = annual_rate / 100 / 12
+    if monthly_rate == 0:
+        return 1 / months
+    growth = (1 + monthly_rate) ** months
+    return monthly_rate * growth / (growth - 1)
+
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def payment_factor(annual_rate, months):
+    """ Monthly repayment per ringgit borrowed at annual_rate (percent) over months. """
+    return _payment_factor(annual_rate, months)
+
+
+class Schedule:
+    """ Month-by-month amortization of principal at annual_rate (percent) over months. """
+    __slots__ = ('principal', 'annual_rate', 'months', 'payment', 'monthly_rate')
+
+    def __init__(self, principal, annual_rate, months):
+        self.principal = principal
+        self.annual_rate = annual_rate
+        self.months = months
+        self.monthly_rate = annual_rate / 100 / 12
+        self.payment = principal * payment_factor(annual_rate, months)
+
+    @property
+    def total_paid(self):
+        return self.payment * self.months
+
+    @property
+    def total_interest(self):
+        return self.total_paid - self.principal
+
+    def balance_after(self, month):
+        """ Outstanding balance after month payments (0 <= month <= months). """
+        month = max(0, min(month, self.months))
+        if self.monthly_rate == 0:
+            return max(self.principal - self.payment * month, 0.0)
+        growth = (1 + self.monthly_rate) ** month
+        return max(self.principal * growth - self.payment * (growth - 1) / self.monthly_rate, 0.0)
+
+    def rows(self):
+        """ Yield a ScheduleRow per month; balances come from the closed form so rounding never drifts. """
+        previous = self.principal
+        growth = 1.0
+        for month in range(1, self.months + 1):
+            growth *= 1 + self.monthly_rate
+            if self.monthly_rate:
+                balance = max(self.principal * growth - self.payment * (growth - 1) / self.monthly_rate, 0.0)
+            else:
+                balance = max(self.principal - self.payment * month, 0.0)
+            principal_paid = previous - balance
+            yield ScheduleRow(month, self.payment, self.payment - principal_paid, principal_paid, balance)
+            previous = balance
+
+    def __repr__(self):
+        return f"Schedule(principal={self.principal:.2f}, annual_rate={self.annual_rate}, months={self.months})"
+
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def _cached_schedule(principal, annual_rate, months):
+    return Schedule(principal, annual_rate, months)
+
+
+def amortization_schedule(principal, annual_rate, months):
+    """ Memoized Schedule; principal is rounded to cents and the rate to basis points for the cache key. """
+    return _cached_schedule(round(float(principal), 2), round(float(annual_rate), 4), int(months))
+
+
+def months_to_repay(balance, annual_rate, payment):
+    """ Months needed to clear balance paying payment each month, or None if it never clears. """
+    if balance <= 0:
+        return 0.0
+    monthly_rate = annual_rate / 100 / 12
+    if monthly_rate == 0:
+        return balance / payment if payment > 0 else None
+    if payment <= balance * monthly_rate:
+        return None
+    return -math.log(1 - monthly_rate * balance / payment) / math.log(1 + monthly_rate)
+
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def implied_annual_rate(principal, months, payment):
+    """
+    Annual rate (percent) at which payment repays principal over months, found by bisection.
+    Returns 0.0 when payment does not even cover the principal without interest.
+    """
+    if months <= 0 or principal <= 0 or payment * months <= principal:
+        return 0.0
+    low, high = 0.0, 100.0
+    # Bisection midpoints are never asked for again, so they stay out of payment_factor's cache
+    for _ in range(RATE_SOLVER_ITERATIONS):
+        middle = (low + high) / 2
+        if principal * _payment_factor(middle, months) > payment:
+            high = middle
+        else:
+            low = middle
+    return round((low + high) / 2, 4)
+
+
+def compare_refinance(loan_amount, tenure_years, current_repayment, new_rate, months_paid=0, cash_out=0.0,
+                      lock_in_months=0, lock_in_penalty_rate=0.0):
+    """
+    Compare keeping the current loan with refinancing it at new_rate.
+    Args:
+        loan_amount (float): Original loan amount.
+        tenure_years (int): Original loan tenure in years.
+        current_repayment (float): Current monthly repayment.
+        new_rate (float): Annual rate of the new loan, in percent.
+        months_paid (int): Repayments already made; the rest of the tenure is refinanced.
+        cash_out (float): Extra amount borrowed on top of the outstanding balance.
+        lock_in_months (int): Early-settlement lock-in period of the current loan.
+        lock_in_penalty_rate (float): Penalty in percent of the balance when settling within the lock-in.
+    Returns:
+        dict: existing_rate, outstanding_balance, remaining_months, penalty and one dict per scenario.
+    """
+    months = int(tenure_years * 12)
+    remaining = max(months - int(months_paid), 0)
+    existing_rate = implied_annual_rate(round(float(loan_amount), 2), months, round(float(current_repayment), 2))
+    existing = amortization_schedule(loan_amount, existing_rate, months)
+    balance = existing.balance_after(months_paid)
+    penalty = balance * lock_in_penalty_rate / 100 if months_paid < lock_in_months else 0.0
+    existing_cost = current_repayment * remaining
+
+    lower = amortization_schedule(balance, new_rate, remaining)
+    result = {
+        'existing_rate': existing_rate,
+        'outstanding_balance': round(balance, 2),
+        'remaining_months': remaining,
+        'penalty': round(penalty, 2),
+        'lower_repayment': {
+            'monthly_repayment': round(lower.payment, 2),
+            'monthly_savings': round(current_repayment - lower.payment, 2),
+            'total_savings': round(existing_cost - lower.total_paid - penalty, 2),
+        },
+    }
+
+    shorter = months_to_repay(balance, new_rate, current_repayment)
+    if shorter is not None:
+        shorter_months = math.ceil(shorter)
+        result['shorten_tenure'] = {
+            'months': shorter_months,
+            'months_saved': max(remaining - shorter_months, 0),
+            'total_savings': round(existing_cost - current_repayment * shorter - penalty, 2),
+        }
+
+    if cash_out:
+        cash = amortization_schedule(balance + cash_out, new_rate, remaining)
+        result['cash_out'] = {
+            'amount': round(cash_out, 2),
+            'monthly_repayment': round(cash.payment, 2),
+            'monthly_change': round(cash.payment - current_repayment, 2),
+        }
+    return result
@@ -0,0 +1,62 @@
+"""
+In-memory index of the bank_rates table.
+
+The table is tiny and read on every completed conversation, so instead of a
+query per calculation each process keeps an immutable tuple of rows sorted by
+interest rate. Under gunicorn the index is built once in the master before
+fork (backend.warmup) and shared copy-on-write by all workers. It is rebuilt
+lazily after BANK_RATE_CACHE_SECONDS so rate changes are picked up without a
+restart.
+"""
+import logging
+import time
+from collections import namedtuple
+
+from backend.extensions import registry
+
+logger = logging.getLogger(__name__)
+
+BankRateEntry = namedtuple('BankRateEntry', 'bank_name min_amount max_amount interest_rate')
+
+
+class BankRateIndex:
+    __slots__ = ('entries', 'loaded_at')
+
+    def __init__(self, entries):
+        self.entries = tuple(sorted(entries, key=lambda entry: entry.interest_rate))
+        self.loaded_at = time.monotonic()
+
+    def best_rate(self, amount):
+        """ Lowest-rate entry whose [min_amount, max_amount] covers amount, or None. """
+        for entry in self.entries:
+            if entry.min_amount <= amount <= entry.max_amount:
+                return entry
+        return None
+
+
+def load_bank_rate_index(config=None):
+    """ Read all bank rates into a BankRateIndex (needs an app context). """
+    from backend.models import BankRate
+
+    rows = BankRate.query.with_entities(
+        BankRate.bank_name, BankRate.min_amount, BankRate.max_amount, BankRate.interest_rate).all()
+    index = BankRateIndex(BankRateEntry(*row) for row in rows)
+    logger.info("Loaded %d bank rates", len(index.entries))
+    return index
+
+
+registry.register('bank_rates', load_bank_rate_index)
+
+
+def get_bank_rate_index():
+    """ Return the cached index, reloading it once BANK_RATE_CACHE_SECONDS have passed. """
+    index = registry.get('bank_rates')
+    if time.monotonic() - index.loaded_at >= float(registry.config.get('BANK_RATE_CACHE_SECONDS', 300)):
+        registry.reset('bank_rates')
+        index = registry.get('bank_rates')
+    return index
+
+
+def best_bank_rate(amount):
+    """ Best (lowest) bank rate available for a loan amount, or None. """
+    return get_bank_rate_index().best_rate(amount)
@@ -1,14 +1,21 @@
-import logging  # ✅ Import logging to fix logging error
+import logging
 
-# Setup logging (this can be customized as needed)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from backend.utils.amortization import compare_refinance
+from backend.utils.bank_rates import best_bank_rate
+from backend.utils.tracing import traced
 
-from sqlalchemy import func
-from backend.models import BankRate  # ✅ Import bank_rates to fix the "BankRate not defined" error
+logger = logging.getLogger(__name__)
 
-def calculate_refinance_savings(original_loan_amount, original_loan_tenure, current_repayment):
+@traced()
+def calculate_refinance_savings(original_loan_amount, original_loan_tenure, current_repayment, months_paid=0,
+                                cash_out=0.0, lock_in_months=0, lock_in_penalty_rate=0.0):
     """
     Calculate potential refinance savings using the provided inputs.
+    The figures come from full amortization schedules (backend.utils.amortization): the
+    new repayment refinances the outstanding balance over the remaining tenure, and the
+    time saved is how much earlier the loan ends if the user keeps paying their current
+    repayment at the new rate. The chatflow does not ask for months_paid, cash_out or the
+    lock-in terms yet, so by default the whole original loan and tenure are refinanced.
     """
     # 🔥 Default result with default values to prevent KeyError
     result = {
@@ -19,77 +26,51 @@ def calculate_refinance_savings(original_loan_amount, original_loan_tenure, curr
         'years_saved': 0, 
         'months_saved': 0,
         'new_interest_rate': 0.0,
-        'bank_name': ''
+        'bank_name': '',
+        'scenarios': {}
     }
 
     try:
         # 1️⃣ **Input Validation**
         if not original_loan_amount or not original_loan_tenure or not current_repayment:
-            logging.error("❌ Missing essential input data. Cannot proceed with calculation.")
+            logger.error("Missing essential input data. Cannot proceed with calculation.")
             return result  # 🔥 Return default result with 0s
 
         # 2️⃣ **Query the Best Bank Rate**
-        bank_rate = BankRate.query.filter(
-            BankRate.min_amount <= original_loan_amount,
-            BankRate.max_amount >= original_loan_amount
-        ).order_by(BankRate.interest_rate).first()
+        bank_rate = best_bank_rate(original_loan_amount)  # Cached index, refreshed every BANK_RATE_CACHE_SECONDS
 
         if bank_rate:
             result['new_interest_rate'] = bank_rate.interest_rate
             result['bank_name'] = bank_rate.bank_name
-            logging.info(f"✅ Bank rate found: {bank_rate.interest_rate}% for bank: {bank_rate.bank_name}")
+            logger.debug("Bank rate found: %s%% for bank: %s", bank_rate.interest_rate, bank_rate.bank_name)
         else:
-            logging.error(f"❌ No bank rate found for loan amount: {original_loan_amount}")
+            logger.error("No bank rate found for loan amount: %s", original_loan_amount)
             return result  # 🔥 Return default result with 0s
 
-        # 3️⃣ **Calculate New Monthly Repayment**
-        new_tenure_years = original_loan_tenure
-        monthly_interest_rate = result['new_interest_rate'] / 100 / 12
-        total_payments = new_tenure_years * 12
+        # 3️⃣ **Compare the Scenarios** (memoized schedules, so repeated comparisons are cheap)
+        scenarios = compare_refinance(
+            original_loan_amount, original_loan_tenure, current_repayment, result['new_interest_rate'],
+            months_paid=months_paid, cash_out=cash_out,
+            lock_in_months=lock_in_months, lock_in_penalty_rate=lock_in_penalty_rate,
+        )
+        result['scenarios'] = scenarios
+        lower = scenarios['lower_repayment']
 
-        if monthly_interest_rate == 0:
-            new_monthly_repayment = original_loan_amount / total_payments
-        else:
-            new_monthly_repayment = original_loan_amount * (
-                monthly_interest_rate * (1 + monthly_interest_rate) ** total_payments
-            ) / ((1 + monthly_interest_rate) ** total_payments - 1)
-
-        result['new_monthly_repayment'] = round(new_monthly_repayment, 2)
-        logging.info(f"✅ New monthly repayment: {result['new_monthly_repayment']}")
-
-        # 4️⃣ **Calculate Savings**
-        monthly_savings = current_repayment - result['new_monthly_repayment']
-        
-        # ✅ **Calculate Yearly Savings**
-        yearly_savings = monthly_savings * 12  # ✅ Directly calculate yearly savings from monthly savings
-        
-        # ✅ **Calculate Lifetime Savings**
-        existing_total_cost = current_repayment * original_loan_tenure * 12
-        new_total_cost = result['new_monthly_repayment'] * original_loan_tenure * 12
-        lifetime_savings = existing_total_cost - new_total_cost
-
-        # ✅ **Store Savings in the Result**
-        result['monthly_savings'] = round(monthly_savings, 2)
-        result['yearly_savings'] = round(yearly_savings, 2)  # ✅ Save yearly savings
-        result['lifetime_savings'] = round(lifetime_savings, 2)
-        logging.info(f"✅ Savings calculated. Monthly: {result['monthly_savings']}, Yearly: {result['yearly_savings']}, Lifetime: {result['lifetime_savings']}")
-
-        # 5️⃣ **Calculate Years and Months Saved**
-        if lifetime_savings > 0 and current_repayment > 0:
-            total_months_saved = lifetime_savings / current_repayment
-            years_saved = int(total_months_saved // 12)
-            months_saved = int(total_months_saved % 12)
-        else:
-            years_saved = 0
-            months_saved = 0
+        # 4️⃣ **Lower-Repayment Savings**
+        result['new_monthly_repayment'] = lower['monthly_repayment']
+        result['monthly_savings'] = round(current_repayment - lower['monthly_repayment'], 2)
+        result['yearly_savings'] = round(result['monthly_savings'] * 12, 2)
+        result['lifetime_savings'] = lower['total_savings']
+        logger.debug("Savings calculated. Monthly: %s, Yearly: %s, Lifetime: %s",
+                     result['monthly_savings'], result['yearly_savings'], result['lifetime_savings'])
 
-        result['years_saved'] = years_saved
-        result['months_saved'] = months_saved
-        logging.info(f"✅ Years saved: {result['years_saved']}, Months saved: {result['months_saved']}")
+        # 5️⃣ **Time Saved by Keeping the Current Repayment**
+        months_saved = scenarios.get('shorten_tenure', {}).get('months_saved', 0)
+        result['years_saved'], result['months_saved'] = divmod(months_saved, 12)
+        logger.debug("Years saved: %s, Months saved: %s", result['years_saved'], result['months_saved'])
 
         return result
 
     except Exception as e:
-        logging.error(f"❌ General error in refinance calculation: {e}")
-        logging.error(f"Traceback: {traceback.format_exc()}")  # Optional for debugging
+        logger.exception("General error in refinance calculation: %s", e)
         return result  # 🔥 Return default result with 0s
@@ -0,0 +1,338 @@
+"""
+Cold archive for chat_logs, so the hot table only holds recent conversations.
+
+The scheduler's chat_archive job (backend/scheduler.py) moves rows older than
+CHAT_ARCHIVE_AFTER_DAYS into compressed segment files in CHAT_ARCHIVE_DIR:
+
+    segment-<utc start>-<pid>-<n>.jsonl.gz
+                                         append-only; one gzip member per user
+                                         and batch, holding that user's rows
+                                         as JSON lines
+    chat_log_archives                    the per-user index: segment, byte
+                                         offset and length of each member, row
+                                         count and time range (a few rows per
+                                         user instead of one per message)
+
+Batches of CHAT_ARCHIVE_BATCH_SIZE rows are taken oldest first. A batch's
+members are written and fsynced first, then its index rows are inserted and
+the archived rows deleted in one transaction. A crash in between leaves
+unreferenced bytes at the end of a segment and the rows still in
+chat_logs, so the next run simply archives them again. Concatenated gzip
+members are still a valid .gz file, so `zcat segment-*.jsonl.gz` reads a whole
+segment. A process keeps appending to its segment until CHAT_ARCHIVE_SEGMENT_MB,
+then starts a new one. A run stops after CHAT_ARCHIVE_BATCHES_PER_RUN batches so
+other jobs are not starved by a large backlog.
+
+chat_history() returns a user's full history, reading only that user's
+members from the archive. Admins read it through
+GET /api/admin/chat-history/<phone> (backend/routes/admin.py) or the CLI. Rows archived twice by overlapping runs are dropped
+by id. The directory must be durable storage (a mounted volume, not a dyno's
+ephemeral disk).
+
+Segments are never edited in place. drop_archived() (used by the retention
+job, backend/utils/retention.py) removes members by copying the ones that stay
+into a new segment, repointing their index rows and deleting the dropped ones
+in one transaction, then deleting the old file. remove_orphan_segments()
+deletes files left unreferenced by a crash in between.
+
+    flask chat-archive run --older-than-days 90
+    flask chat-archive show 60123456789
+"""
+import gzip
+import json
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import click
+import pytz
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import update
+
+from backend.extensions import db
+from backend.models import ChatLog, ChatLogArchive, User
+from backend.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+MYT = pytz.timezone('Asia/Kuala_Lumpur')
+SEGMENT_SUFFIX = '.jsonl.gz'
+
+chat_archive_cli = AppGroup('chat-archive', help='Move old chat logs to compressed cold storage.')
+
+_segment = None  # (pid, file name) of the segment this process appends to
+
+
+def _now():
+    """ Timestamps are stored as naive Malaysia time (see backend.models). """
+    return datetime.now(MYT).replace(tzinfo=None)
+
+
+def archive_directory(config=None):
+    config = config if config is not None else current_app.config
+    return config.get('CHAT_ARCHIVE_DIR') or 'chat_archive'
+
+
+def _segment_name(directory, max_bytes):
+    """ The segment this process appends to, starting a new one when it is full. """
+    global _segment
+    pid = os.getpid()
+    if _segment is not None and _segment[0] == pid:
+        path = os.path.join(directory, _segment[1])
+        if not os.path.exists(path) or os.path.getsize(path) < max_bytes:
+            return _segment[1]
+    _segment = (pid, _new_segment_name())
+    return _segment[1]
+
+
+def _new_segment_name():
+    return f"segment-{datetime.now(pytz.utc):%Y%m%d%H%M%S}-{os.getpid()}-{time.time_ns() % 10**9:09d}{SEGMENT_SUFFIX}"
+
+
+def _encode_rows(rows):
+    lines = (json.dumps({'id': row.id, 'created_at': row.created_at.isoformat(),
+                         'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+                         'message': row.message}, ensure_ascii=False)
+             for row in rows)
+    return gzip.compress(("\n".join(lines) + "\n").encode('utf-8'), compresslevel=6)
+
+
+def archive_batch(directory, cutoff, batch_size, max_bytes):
+    """
+    Archive up to batch_size chat logs created before cutoff.
+    Returns:
+        Counter: rows and users archived, bytes written (empty when nothing was left).
+    """
+    rows = (
+        db.session.query(ChatLog.id, ChatLog.user_id, ChatLog.message, ChatLog.created_at, ChatLog.updated_at)
+        .filter(ChatLog.created_at < cutoff)
+        .order_by(ChatLog.created_at, ChatLog.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        return Counter()
+    per_user = defaultdict(list)
+    for row in rows:
+        per_user[row.user_id].append(row)
+
+    os.makedirs(directory, exist_ok=True)
+    segment = _segment_name(directory, max_bytes)
+    entries = []
+    with open(os.path.join(directory, segment), 'ab') as handle:
+        for user_id, user_rows in per_user.items():
+            member = _encode_rows(user_rows)
+            entries.append(dict(user_id=user_id, segment=segment, offset=handle.tell(), length=len(member),
+                                row_count=len(user_rows), first_created_at=user_rows[0].created_at,
+                                last_created_at=user_rows[-1].created_at, created_at=_now()))
+            handle.write(member)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+    try:
+        db.session.execute(ChatLogArchive.__table__.insert(), entries)
+        deleted = (
+            db.session.query(ChatLog)
+            .filter(ChatLog.id.in_([row.id for row in rows]))
+            .delete(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if deleted != len(rows):
+        logger.warning("%d of %d archived chat logs were already gone; an overlapping run archived them",
+                       len(rows) - deleted, len(rows))
+    written = sum(entry['length'] for entry in entries)
+    metrics.inc('chat_archive_rows_total', deleted)
+    metrics.inc('chat_archive_bytes_total', written)
+    return Counter(rows=deleted, users=len(per_user), bytes=written)
+
+
+def archive_chat_logs(config, throttle=None, now=None):
+    """ Scheduler job: archive chat logs older than CHAT_ARCHIVE_AFTER_DAYS; returns outcome counts. """
+    days = float(config.get('CHAT_ARCHIVE_AFTER_DAYS', 90))
+    if days <= 0:
+        return Counter()
+    cutoff = (now or _now()) - timedelta(days=days)
+    directory = archive_directory(config)
+    batch_size = int(config.get('CHAT_ARCHIVE_BATCH_SIZE', 2000))
+    max_bytes = int(float(config.get('CHAT_ARCHIVE_SEGMENT_MB', 64)) * 1024 * 1024)
+
+    outcome = Counter()
+    started = time.perf_counter()
+    for _ in range(max(int(config.get('CHAT_ARCHIVE_BATCHES_PER_RUN', 10)), 1)):
+        batch = archive_batch(directory, cutoff, batch_size, max_bytes)
+        if not batch:
+            break
+        outcome += batch
+        outcome['batches'] += 1
+    if outcome:
+        logger.info("Archived %d chat logs of %d users (%d bytes) in %.1fs", outcome['rows'], outcome['users'],
+                    outcome['bytes'], time.perf_counter() - started)
+    return outcome
+
+
+def read_archived_chat_logs(user_id, directory=None):
+    """
+    A user's archived chat logs, oldest first.
+    Args:
+        user_id (int): The users.id the logs belong to.
+        directory (str): CHAT_ARCHIVE_DIR by default.
+    Returns:
+        list: dicts with id, created_at, updated_at (datetimes) and message.
+    """
+    directory = directory or archive_directory()
+    entries = (
+        db.session.query(ChatLogArchive.segment, ChatLogArchive.offset, ChatLogArchive.length)
+        .filter(ChatLogArchive.user_id == user_id)
+        .order_by(ChatLogArchive.segment, ChatLogArchive.offset)
+        .all()
+    )
+    per_segment = defaultdict(list)
+    for entry in entries:
+        per_segment[entry.segment].append(entry)
+
+    rows = {}
+    for segment, members in per_segment.items():
+        with open(os.path.join(directory, segment), 'rb') as handle:
+            for member in members:
+                handle.seek(member.offset)
+                for line in gzip.decompress(handle.read(member.length)).splitlines():
+                    row = json.loads(line)
+                    row['created_at'] = datetime.fromisoformat(row['created_at'])
+                    if row['updated_at']:
+                        row['updated_at'] = datetime.fromisoformat(row['updated_at'])
+                    rows[row['id']] = row
+    return sorted(rows.values(), key=lambda row: (row['created_at'], row['id']))
+
+
+def chat_history(user_id, include_archive=True):
+    """ A user's full chat history, archived and hot rows merged oldest first; archived rows are flagged. """
+    history = []
+    if include_archive:
+        history = [dict(row, archived=True) for row in read_archived_chat_logs(user_id)]
+    hot = (
+        db.session.query(ChatLog.id, ChatLog.created_at, ChatLog.updated_at, ChatLog.message)
+        .filter(ChatLog.user_id == user_id)
+        .order_by(ChatLog.created_at, ChatLog.id)
+        .all()
+    )
+    archived_ids = {row['id'] for row in history}
+    history.extend(dict(row._asdict(), archived=False) for row in hot if row.id not in archived_ids)
+    history.sort(key=lambda row: (row['created_at'], row['id']))
+    return history
+
+
+def _rewrite_segment(directory, segment, criterion):
+    """
+    Drop the members of one segment matching criterion, keeping the others in a new segment.
+    Returns:
+        Counter: members and rows dropped.
+    """
+    global _segment
+    if _segment is not None and _segment[1] == segment:
+        _segment = None  # Stop appending to a file that is about to go
+    members = (
+        db.session.query(ChatLogArchive.id, ChatLogArchive.offset, ChatLogArchive.length, ChatLogArchive.row_count,
+                         criterion.label('dropped'))
+        .filter(ChatLogArchive.segment == segment)
+        .order_by(ChatLogArchive.offset)
+        .all()
+    )
+    dropped = [member for member in members if member.dropped]
+    kept = [member for member in members if not member.dropped]
+    moves = []
+    if kept:
+        new_segment = _new_segment_name()
+        with open(os.path.join(directory, segment), 'rb') as source, \
+                open(os.path.join(directory, new_segment), 'ab') as target:
+            for member in kept:
+                source.seek(member.offset)
+                moves.append({'id': member.id, 'segment': new_segment, 'offset': target.tell()})
+                target.write(source.read(member.length))
+            target.flush()
+            os.fsync(target.fileno())
+    try:
+        if moves:
+            db.session.execute(update(ChatLogArchive), moves)
+        if dropped:
+            db.session.query(ChatLogArchive).filter(ChatLogArchive.id.in_([member.id for member in dropped])) \
+                .delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if db.session.query(ChatLogArchive.id).filter(ChatLogArchive.segment == segment).first() is None:
+        os.remove(os.path.join(directory, segment))
+    else:
+        # Another process appended meanwhile; its members stay put and the next pass moves them
+        logger.warning("Chat archive segment %s gained members while being rewritten; kept for now", segment)
+    return Counter(members=len(dropped), rows=sum(member.row_count for member in dropped))
+
+
+def drop_archived(criterion, directory=None):
+    """
+    Permanently delete archived chat logs.
+    Args:
+        criterion: SQL condition on ChatLogArchive selecting the members to drop,
+            e.g. ChatLogArchive.user_id == 42.
+        directory (str): CHAT_ARCHIVE_DIR by default.
+    Returns:
+        Counter: members and rows dropped, segments rewritten.
+    """
+    directory = directory or archive_directory()
+    segments = [segment for segment, in
+                db.session.query(ChatLogArchive.segment).filter(criterion).distinct().order_by(ChatLogArchive.segment)]
+    outcome = Counter()
+    for segment in segments:
+        outcome += _rewrite_segment(directory, segment, criterion)
+        outcome['segments'] += 1
+    return outcome
+
+
+def remove_orphan_segments(directory=None, grace_seconds=3600):
+    """ Delete segment files no index row points at (left by a crash), once untouched for grace_seconds. """
+    directory = directory or archive_directory()
+    if not os.path.isdir(directory):
+        return 0
+    referenced = {segment for segment, in db.session.query(ChatLogArchive.segment).distinct()}
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if (name.startswith('segment-') and name.endswith(SEGMENT_SUFFIX) and name not in referenced
+                and time.time() - os.path.getmtime(path) > grace_seconds):
+            os.remove(path)
+            removed += 1
+    if removed:
+        logger.info("Removed %d unreferenced chat archive segments", removed)
+    return removed
+
+
+@chat_archive_cli.command('run')
+@click.option('--older-than-days', type=float, help='Overrides CHAT_ARCHIVE_AFTER_DAYS.')
+@click.option('--batches', type=int, help='Overrides CHAT_ARCHIVE_BATCHES_PER_RUN.')
+def run_command(older_than_days, batches):
+    """ Archive old chat logs now. """
+    config = dict(current_app.config)
+    if older_than_days is not None:
+        config['CHAT_ARCHIVE_AFTER_DAYS'] = older_than_days
+    if batches is not None:
+        config['CHAT_ARCHIVE_BATCHES_PER_RUN'] = batches
+    outcome = archive_chat_logs(config)
+    click.echo(f"Archived {outcome['rows']} chat logs of {outcome['users']} users "
+               f"({outcome['bytes']} bytes) into {archive_directory(config)}.")
+
+
+@chat_archive_cli.command('show')
+@click.argument('phone_number')
+def show_command(phone_number):
+    """ Print a user's full chat history, archive included. """
+    user = User.query.filter_by(phone_number=phone_number).first()
+    if not user:
+        raise click.ClickException(f"No user with phone number {phone_number}")
+    for row in chat_history(user.id):
+        click.echo(f"[{row['created_at']:%Y-%m-%d %H:%M}]{' (archived)' if row['archived'] else ''} {row['message']}")
@@ -0,0 +1,193 @@
+"""
+Inbound debouncing: a burst of short messages from one user is handled as one.
+
+Users often type a question as three or four quick messages. Handled one by
+one, each fragment costs a model call and a reply in query mode, and fails
+validation with an error reply in flow mode. With INBOUND_DEBOUNCE_MS set,
+the webhook buffers each message and answers 200 straight away; the messages
+are handled together, joined by spaces, once the user has been quiet for
+INBOUND_DEBOUNCE_MS:
+
+    10:00:00.0  "hi i have a question"    buffered, timer for #1
+    10:00:00.8  "what is the lock in"     buffered, timer for #2 (#1 fires, sees #2, does nothing)
+    10:00:01.5  "period for refinancing"  buffered, timer for #3 (#2 fires, sees #3, does nothing)
+    10:00:03.0                            #3 fires: handles "hi i have a question what is ... refinancing"
+
+A user who never pauses is handled at the latest INBOUND_DEBOUNCE_MAX_WAIT_MS
+after their first buffered message.
+
+Across workers the buffer lives in Redis: a list of messages per phone
+number and a sequence counter, changed only by Lua scripts. Whichever worker
+received the newest message handles the burst, and the buffer is taken
+atomically, so a burst is handled exactly once whichever workers its
+messages landed on. Without Redis the buffer is per process, which is only
+correct with a single worker. If Redis fails while buffering, the message is
+handled immediately as before.
+
+Timers are daemon threads in the worker that received the message. A
+worker shutting down handles its pending bursts at exit. A burst orphaned by
+a crashed worker stays in Redis (for up to four times the max wait) and is
+picked up with the user's next message.
+"""
+import atexit
+import itertools
+import json
+import logging
+import threading
+import time
+
+from backend.extensions import get_redis, registry
+from backend.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'finzo:inbound'
+BATCH_BUCKETS = (1, 2, 3, 4, 6, 10)
+
+# KEYS: buffer, sequence. ARGV: message, ttl ms. Returns the new sequence number and the oldest buffered message.
+_BUFFER_SCRIPT = """
+redis.call('rpush', KEYS[1], ARGV[1])
+local seq = redis.call('incr', KEYS[2])
+redis.call('pexpire', KEYS[1], ARGV[2])
+redis.call('pexpire', KEYS[2], ARGV[2])
+return {seq, redis.call('lindex', KEYS[1], 0)}
+"""
+
+# KEYS: buffer, sequence. ARGV: our sequence, force, now ms, max wait ms.
+# Takes the whole buffer if our message is still the newest, the oldest one has waited long enough, or forced.
+_CLAIM_SCRIPT = """
+local items = redis.call('lrange', KEYS[1], 0, -1)
+if #items == 0 then return {} end
+if ARGV[2] ~= '1' and redis.call('get', KEYS[2]) ~= ARGV[1] then
+    local oldest = cjson.decode(items[1])
+    if tonumber(ARGV[3]) - oldest['t'] < tonumber(ARGV[4]) then return {} end
+end
+redis.call('del', KEYS[1])
+return items
+"""
+
+_local_buffers = {}  # phone number -> {'seq': int, 'items': [message dicts]} while a burst waits, when Redis is not configured
+_local_seq = itertools.count(1)  # Shared by every number, so a stale timer never matches a later burst
+_local_lock = threading.Lock()
+_pending = {}  # (phone number, seq) -> (Timer, app, process) scheduled by this process
+_pending_lock = threading.Lock()
+_atexit_registered = False
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _settings():
+    config = registry.config
+    window_ms = float(config.get('INBOUND_DEBOUNCE_MS', 0))
+    max_wait_ms = max(float(config.get('INBOUND_DEBOUNCE_MAX_WAIT_MS', 5000)), window_ms)
+    return window_ms, max_wait_ms
+
+
+def _keys(phone_number):
+    return f'{REDIS_KEY_PREFIX}:{phone_number}:buffer', f'{REDIS_KEY_PREFIX}:{phone_number}:seq'
+
+
+def _append(phone_number, message, max_wait_ms):
+    """ Add a message to the phone number's buffer; returns (our sequence number, oldest message). """
+    client = get_redis()
+    if client is None:
+        with _local_lock:
+            buffer = _local_buffers.setdefault(phone_number, {'seq': 0, 'items': []})
+            buffer['seq'] = next(_local_seq)
+            buffer['items'].append(message)
+            return buffer['seq'], buffer['items'][0]
+    seq, oldest = client.eval(_BUFFER_SCRIPT, 2, *_keys(phone_number), json.dumps(message), int(max_wait_ms * 4) + 60000)
+    return int(seq), json.loads(oldest)
+
+
+def _claim(phone_number, seq, max_wait_ms, force=False):
+    """ Take the buffered messages if this sequence number should handle them; returns them or []. """
+    client = get_redis()
+    if client is None:
+        with _local_lock:
+            buffer = _local_buffers.get(phone_number)
+            if not buffer or not buffer['items']:
+                return []
+            if not force and buffer['seq'] != seq and _now_ms() - buffer['items'][0]['t'] < max_wait_ms:
+                return []
+            # Drop the entry, as the Redis script deletes its key: numbers that went quiet keep nothing
+            del _local_buffers[phone_number]
+            return buffer['items']
+    items = client.eval(_CLAIM_SCRIPT, 2, *_keys(phone_number), seq, '1' if force else '0', _now_ms(), int(max_wait_ms))
+    return [json.loads(item) for item in items]
+
+
+def _fire(phone_number, seq, app, process, force=False):
+    with _pending_lock:
+        _pending.pop((phone_number, seq), None)
+    try:
+        _, max_wait_ms = _settings()
+        items = _claim(phone_number, seq, max_wait_ms, force)
+    except Exception as e:
+        logger.error("Could not read buffered messages for %s: %s", phone_number, e)
+        return
+    if not items:
+        return
+    metrics.observe('inbound_debounce_batch_size', len(items), BATCH_BUCKETS)
+    if len(items) > 1:
+        metrics.inc('inbound_messages_merged_total', len(items) - 1)
+    text = " ".join(item['text'] for item in items)
+    with app.app_context():
+        from backend.extensions import db
+
+        try:
+            process(phone_number, text)
+        except Exception as e:
+            logger.exception("Error handling buffered messages from %s: %s", phone_number, e)
+        finally:
+            db.session.remove()
+
+
+def flush_pending():
+    """ Handle every burst this process is still waiting on, right away (at shutdown). """
+    with _pending_lock:
+        pending = list(_pending.items())
+        _pending.clear()
+    for (phone_number, seq), (timer, app, process) in pending:
+        timer.cancel()
+        _fire(phone_number, seq, app, process, force=True)
+
+
+def buffer_message(phone_number, text, process):
+    """
+    Buffer an inbound message when debouncing is on.
+    Args:
+        phone_number (str): The sender.
+        text (str): The message body.
+        process (callable): process(phone_number, combined_text), called in a timer thread
+            inside an app context once the burst is over.
+    Returns:
+        bool: True if the message was buffered; False if the caller should handle it now.
+    """
+    global _atexit_registered
+    window_ms, max_wait_ms = _settings()
+    if window_ms <= 0:
+        return False
+    from flask import current_app
+
+    now = _now_ms()
+    try:
+        seq, oldest = _append(phone_number, {'t': now, 'text': text}, max_wait_ms)
+    except Exception as e:
+        logger.warning("Inbound debounce unavailable, handling the message now: %s", e)
+        return False
+
+    delay_ms = max(min(window_ms, oldest['t'] + max_wait_ms - now), 0)
+    timer = threading.Timer(delay_ms / 1000, _fire,
+                            args=(phone_number, seq, current_app._get_current_object(), process))
+    timer.daemon = True
+    with _pending_lock:
+        _pending[(phone_number, seq)] = (timer, timer.args[2], process)
+        if not _atexit_registered:
+            atexit.register(flush_pending)
+            _atexit_registered = True
+    timer.start()
+    metrics.inc('inbound_messages_buffered_total')
+    return True
@@ -0,0 +1,43 @@
+"""
+Funnel instrumentation for the STEP_CONFIG state machine.
+
+Each step reports entries (the user was prompted for it), exits (valid input
+accepted), validation failures and time-in-step. Drop-off for a step is
+entries - exits. All calls are a few dict operations on the per-process
+metrics registry, so they are cheap enough for every message.
+"""
+from datetime import datetime, timedelta, timezone
+
+from backend.utils import metrics
+
+# Malaysia has no DST, so a fixed +08:00 offset matches pytz's Asia/Kuala_Lumpur
+# for current dates and is ~3x cheaper to evaluate on every message.
+MYT = timezone(timedelta(hours=8))
+
+# Time-in-step buckets in seconds: quick replies up to a user returning next day.
+STEP_DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 900, 3600, 21600, 86400)
+
+
+def step_entered(step):
+    """ The user has just been prompted for step. """
+    metrics.inc('funnel_step_entries_total', step=step)
+
+
+def step_failed(step):
+    """ The user's answer for step failed validation. """
+    metrics.inc('funnel_step_validation_failures_total', step=step)
+
+
+def step_exited(step, entered_at=None):
+    """
+    The user's answer for step was accepted.
+    Args:
+        step (str): The step being left.
+        entered_at (datetime): When the step was entered (ChatflowTemp.updated_at), naive MYT.
+    """
+    metrics.inc('funnel_step_exits_total', step=step)
+    if entered_at is not None:
+        if entered_at.tzinfo is not None:
+            entered_at = entered_at.astimezone(MYT).replace(tzinfo=None)
+        elapsed = (datetime.now(MYT).replace(tzinfo=None) - entered_at).total_seconds()
+        metrics.observe('funnel_step_seconds', max(elapsed, 0.0), STEP_DURATION_BUCKETS, step=step)
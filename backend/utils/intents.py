@@ -0,0 +1,88 @@
+"""
+Keyword intent matcher for incoming messages.
+
+All intent phrases are compiled into one regular expression with a named
+group per intent, so a message is classified in a single scan instead of a
+substring test per keyword per language. Latin-script phrases must stand
+alone as words: "hi" matches "Hi there" but not "this", "which" or "shift".
+CJK has no spaces between words, so CJK phrases match anywhere in the text.
+Greetings only count at the start of a message and restart commands only
+when they are the whole message, so "can you help me compare banks" or
+"what if I restart my loan" leave the conversation alone.
+
+    detect_intents("Hello!")                  -> frozenset({'greeting'})
+    detect_intents("who do you work for?")    -> frozenset({'creator'})
+"""
+import re
+
+GREETING = 'greeting'
+RESTART = 'restart'
+CONTACT_ADMIN = 'contact_admin'
+IDENTITY = 'identity'
+CREATOR = 'creator'
+
+# Phrases are regex fragments; a space means "one or more whitespace characters".
+GREETING_PHRASES = {
+    'en': ('hi', 'hey', 'hello', 'start', 'begin', 'help'),
+    'ms': ('hai', 'apa khabar', 'selamat', 'mula', 'tolong'),
+    'zh': ('你好', '哈罗', '开始', '帮助'),
+}
+RESTART_PHRASES = ('restart', 'start over', 'start again', 'reset', 'mula semula', 'mula lagi', '重新开始', '重来')
+CONTACT_ADMIN_PHRASES = (
+    'admin', 'contact', 'talk to (?:a |an )?(?:human|agent|person)', 'speak to (?:a |an )?(?:human|agent|person)',
+    'hubungi', '管理员', '联系', '人工客服',
+)
+IDENTITY_PHRASES = (
+    'your name', 'who are you', 'what are you', 'nama (?:awak|anda|kamu)', 'siapa (?:awak|anda|kamu)',
+    '你是谁', '你叫什么',
+)
+CREATOR_PHRASES = (
+    r'who\b.*\bwork(?:s|ing|ed)?', 'who (?:made|created|built|owns|developed) you', 'siapa (?:buat|cipta|bina)',
+    '谁(?:开发|创造|制作)了?你', '你为谁工作',
+)
+
+_CJK = re.compile(r'[぀-ヿ㐀-鿿豈-﫿]')
+
+
+def _phrase(phrase):
+    body = phrase.replace(' ', r'\s+')
+    if _CJK.search(phrase):
+        return body
+    return rf'(?<!\w){body}(?!\w)'
+
+
+def _alternation(phrases):
+    return '|'.join(_phrase(phrase) for phrase in phrases)
+
+
+def compile_matcher():
+    """ Build the combined pattern; anchored intents use \\A / \\Z so they only match in place. """
+    greetings = [phrase for phrases in GREETING_PHRASES.values() for phrase in phrases]
+    pattern = '|'.join((
+        rf'(?P<{RESTART}>\A[\W_]*(?:{_alternation(RESTART_PHRASES)})[\W_]*\Z)',
+        rf'(?P<{GREETING}>\A[\W_]*(?:{_alternation(greetings)}))',
+        rf'(?P<{CREATOR}>{_alternation(CREATOR_PHRASES)})',
+        rf'(?P<{CONTACT_ADMIN}>{_alternation(CONTACT_ADMIN_PHRASES)})',
+        rf'(?P<{IDENTITY}>{_alternation(IDENTITY_PHRASES)})',
+    ))
+    return re.compile(pattern, re.IGNORECASE | re.DOTALL)
+
+
+_MATCHER = compile_matcher()
+
+
+def detect_intents(text):
+    """
+    Return the set of intents present in text.
+    Args:
+        text (str): The raw incoming message.
+    Returns:
+        frozenset: Zero or more of GREETING, RESTART, CONTACT_ADMIN, IDENTITY, CREATOR.
+    """
+    if not text:
+        return frozenset()
+    return frozenset(match.lastgroup for match in _MATCHER.finditer(text.strip()))
+
+
+def has_intent(text, intent):
+    return intent in detect_intents(text)
@@ -0,0 +1,163 @@
+"""
+Language auto-detection for the first message of a conversation.
+
+New users used to go through the numbered language menu before anything
+else. When the opening message says enough about its language, the flow now
+skips the menu and starts at the name step in that language:
+
+    Han characters      -> 'zh', no model needed
+    Latin script        -> langdetect, restricted to English and Indonesian
+                           (standing in for Malay, which langdetect has no
+                           profile for), with a fixed seed so the same text
+                           always gets the same answer
+
+The restricted model is confident about almost anything, including "hi", so
+the confidence is scaled down for messages with fewer than
+LANGUAGE_DETECTION_MIN_LETTERS letters. Below LANGUAGE_DETECTION_MIN_CONFIDENCE
+the menu is shown as before. The profiles are loaded once through the
+registry, in the gunicorn master before fork (backend.warmup).
+
+A returning user who greets again is not asked twice: the language stored
+on their chatflow row is used once they are past the menu, and languages are
+also remembered per phone number in a bounded in-process LRU, both when
+detected and when picked from the menu.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from backend.extensions import registry
+from backend.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_LANGUAGES = ('en', 'ms', 'zh')
+
+# langdetect profile -> our language code
+PROFILE_LANGUAGES = {'en': 'en', 'id': 'ms'}
+
+
+def _is_han(char):
+    return '㐀' <= char <= '鿿' or '豈' <= char <= '﫿'
+
+
+def _create_language_detector(config):
+    if not config.get('LANGUAGE_DETECTION_ENABLED', True):
+        return None
+    try:
+        import os
+
+        from langdetect.detector_factory import PROFILES_DIRECTORY, DetectorFactory
+    except ImportError as e:
+        logger.warning("langdetect unavailable, only detecting Chinese by script: %s", e)
+        return None
+    factory = DetectorFactory()
+    profiles = []
+    for profile in PROFILE_LANGUAGES:
+        with open(os.path.join(PROFILES_DIRECTORY, profile), encoding='utf-8') as f:
+            profiles.append(f.read())
+    factory.load_json_profile(profiles)
+    factory.set_seed(int(config.get('LANGUAGE_DETECTION_SEED', 0)))
+    return factory
+
+
+registry.register('language_detector', _create_language_detector)
+
+
+class LanguageCache:
+    """ Thread-safe LRU of phone number -> language code. """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, phone_number):
+        with self._lock:
+            language_code = self._entries.get(phone_number)
+            if language_code is not None:
+                self._entries.move_to_end(phone_number)
+            return language_code
+
+    def set(self, phone_number, language_code):
+        with self._lock:
+            self._entries[phone_number] = language_code
+            self._entries.move_to_end(phone_number)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+registry.register('language_cache', lambda config: LanguageCache(int(config.get('LANGUAGE_CACHE_SIZE', 10000))))
+
+
+def detect_language(text):
+    """
+    Guess the language of a message.
+    Args:
+        text (str): The raw incoming message.
+    Returns:
+        tuple: (language code or None, confidence between 0 and 1).
+    """
+    letters = [char for char in text or '' if char.isalpha()]
+    if not letters:
+        return None, 0.0
+    han = sum(1 for char in letters if _is_han(char))
+    if han * 2 >= len(letters):
+        return 'zh', han / len(letters)
+    latin = sum(1 for char in letters if char < 'ɐ')
+    if latin < 0.8 * len(letters):
+        return None, 0.0  # Another script (Tamil, Thai...); let the user pick
+
+    detector_factory = registry.get('language_detector')
+    if detector_factory is None:
+        return None, 0.0
+    from langdetect.lang_detect_exception import LangDetectException
+    detector = detector_factory.create()
+    detector.append(text)
+    try:
+        best = detector.get_probabilities()[0]
+    except (LangDetectException, IndexError):
+        return None, 0.0
+    min_letters = int(registry.config.get('LANGUAGE_DETECTION_MIN_LETTERS', 10))
+    return PROFILE_LANGUAGES.get(best.lang), best.prob * min(1.0, len(letters) / min_letters)
+
+
+def remember_language(phone_number, language_code):
+    """ Record the language a user is known to use (detected or chosen from the menu). """
+    if language_code in SUPPORTED_LANGUAGES:
+        registry.get('language_cache').set(phone_number, language_code)
+
+
+def resolve_language(phone_number, message, user_data=None):
+    """
+    Language to start a conversation in, or None to show the language menu.
+    Args:
+        phone_number (str): The user's phone number.
+        message (str): Their opening message, to detect the language from.
+        user_data (ChatflowTemp): The user's existing chatflow row, if any.
+    Returns:
+        str: The language stored on a row that got past the menu, else the cached one, else the detected one.
+    """
+    stored = getattr(user_data, 'language_code', None)
+    if stored in SUPPORTED_LANGUAGES and getattr(user_data, 'current_step', None) not in (None, 'choose_language'):
+        # Kept in the database, so it holds whichever worker the message lands on
+        metrics.inc('language_resolved_total', source='stored')
+        remember_language(phone_number, stored)
+        return stored
+
+    language_code = registry.get('language_cache').get(phone_number)
+    if language_code is not None:
+        metrics.inc('language_resolved_total', source='cache')
+        return language_code
+
+    language_code, confidence = detect_language(message)
+    if language_code is None or confidence < float(registry.config.get('LANGUAGE_DETECTION_MIN_CONFIDENCE', 0.8)):
+        metrics.inc('language_resolved_total', source='menu')
+        logger.debug("Language of %r unclear (%s, %.2f); showing the menu", message, language_code, confidence)
+        return None
+    metrics.inc('language_resolved_total', source='detected', language=language_code)
+    remember_language(phone_number, language_code)
+    return language_code
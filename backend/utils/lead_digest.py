@@ -0,0 +1,146 @@
+"""
+Batched admin notifications for new leads.
+
+Instead of one full WhatsApp message per completed lead, the scheduler's
+lead_digest job (backend/scheduler.py) sends the admin a compact digest of
+the leads saved since the last one:
+
+    📋 *NEW LEADS* (3, 14:05-14:31)
+    • John Tan · wa.me/60123456789 · RM 350,000 / 25y · saves RM 412/mo
+    • ⭐ Lim Wei Ling · wa.me/60198765432 · RM 900,000 / 30y · saves RM 1,250/mo
+    ...
+
+A digest goes out once LEAD_DIGEST_MAX_LEADS leads are waiting, or once the
+oldest waiting lead is LEAD_DIGEST_INTERVAL_MINUTES old; the scheduler checks
+every SCHEDULER_INTERVAL_SECONDS. Leads are read in id order after the cursor
+kept in scheduler_cursors, stopping at the first lead younger than
+LEAD_DIGEST_COMMIT_GRACE_SECONDS: ids are taken when a message's changes are
+flushed but only become visible at its commit, so with several workers a
+lower id can appear after a higher one. Once every lead before a given one is
+older than the grace period, none of them can still be uncommitted.
+
+Digests are claimed in outreach_log per lead-id range and attempt, so a
+re-run after a crash never repeats one. The cursor only moves past a digest
+once it was sent (or claimed by another scheduler); after a failed send the
+same leads are retried on the next run as a new attempt.
+
+Leads saving at least LEAD_ALERT_MIN_MONTHLY_SAVINGS a month still get the
+full, immediate message (send_new_lead_to_admin in backend/routes/chatbot.py).
+That message is sent after the commit by a background thread, so the user's
+request never waits for it. Those leads are starred in the next digest too,
+which doubles as the safety net if an immediate alert was lost.
+"""
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytz
+
+from backend.extensions import db
+from backend.models import Lead, OutreachLog
+from backend.utils.outbox import pack_messages
+from backend.utils.outreach import get_cursor, send_batch, set_cursor
+
+logger = logging.getLogger(__name__)
+
+MYT = pytz.timezone('Asia/Kuala_Lumpur')
+JOB = 'lead_digest'
+
+
+def _now():
+    """ Timestamps are stored as naive Malaysia time (see backend.models). """
+    return datetime.now(MYT).replace(tzinfo=None)
+
+
+def admin_lead_recipient():
+    """ Where lead notifications go (ADMIN_PHONE_NUMBER), or None when it is not configured. """
+    return os.getenv('ADMIN_PHONE_NUMBER') or None
+
+
+def is_high_value(monthly_savings, config):
+    """ Whether a lead is worth an immediate alert rather than waiting for the digest. """
+    threshold = float(config.get('LEAD_ALERT_MIN_MONTHLY_SAVINGS', 500))
+    return (monthly_savings or 0.0) >= threshold
+
+
+def format_digest(leads, config):
+    """ One line per lead under a header; returns the digest texts (split if they exceed a WhatsApp message). """
+    first, last = leads[0].created_at, leads[-1].created_at
+    lines = [f"📋 *NEW LEADS* ({len(leads)}, {first:%H:%M}-{last:%H:%M})"]
+    for lead in leads:
+        star = "⭐ " if is_high_value(lead.monthly_savings, config) else ""
+        lines.append(
+            f"• {star}{lead.name} · wa.me/{lead.phone_number} · "
+            f"RM {lead.original_loan_amount or 0:,.0f} / {lead.original_loan_tenure or 0}y · "
+            f"saves RM {lead.monthly_savings or 0:,.0f}/mo"
+        )
+    lines.append(f"Total potential savings: RM {sum(lead.monthly_savings or 0 for lead in leads):,.0f}/mo")
+    return pack_messages(lines, separator="\n")
+
+
+def _attempt(reference):
+    """ A fresh attempt number for a digest: earlier attempts' claims stay in outreach_log, so they need new references. """
+    return (
+        db.session.query(OutreachLog.id)
+        .filter(OutreachLog.kind == 'lead_digest', OutreachLog.status == 'failed',
+                OutreachLog.reference.like(f"{reference}|%"))
+        .count()
+    )
+
+
+def send_lead_digest(config, throttle, now=None):
+    """ Scheduler job: send a digest of new leads when enough are waiting or the oldest is due; returns outcome counts. """
+    now = now or _now()
+    interval = timedelta(minutes=float(config.get('LEAD_DIGEST_INTERVAL_MINUTES', 30)))
+    settled = now - timedelta(seconds=float(config.get('LEAD_DIGEST_COMMIT_GRACE_SECONDS', 120)))
+    max_leads = max(int(config.get('LEAD_DIGEST_MAX_LEADS', 20)), 1)
+    recipient = admin_lead_recipient()
+    if recipient is None:
+        return Counter()
+
+    position = get_cursor(JOB)
+    if position is None:
+        # First run: start with leads from the last interval rather than the whole history
+        previous = (
+            db.session.query(Lead.id)
+            .filter(Lead.created_at < now - interval)
+            .order_by(Lead.id.desc())
+            .first()
+        )
+        position = str(previous.id if previous else 0)
+        set_cursor(JOB, position)
+
+    outcome = Counter()
+    while True:
+        rows = (
+            db.session.query(Lead.id, Lead.name, Lead.phone_number, Lead.original_loan_amount,
+                             Lead.original_loan_tenure, Lead.monthly_savings, Lead.created_at)
+            .filter(Lead.id > int(position))
+            .order_by(Lead.id)
+            .limit(max_leads)
+            .all()
+        )
+        # Never past a lead that is still within the grace period: a lower id may not be committed yet
+        leads = []
+        for lead in rows:
+            if lead.created_at > settled:
+                break
+            leads.append(lead)
+        if not leads or (len(leads) < max_leads and leads[0].created_at > now - interval):
+            return outcome
+        reference = f"leads:{leads[0].id}-{leads[-1].id}"
+        reference = f"{reference}|{_attempt(reference)}"
+        texts = format_digest(leads, config)
+        messages = [(recipient, reference if index == 0 else f"{reference}:{index}", text)
+                    for index, text in enumerate(texts)]
+        sent = send_batch('lead_digest', messages, throttle)
+        outcome += sent
+        if sent['failed']:
+            # Keep the cursor: these leads reach the admin only through the digest, so retry them next run
+            logger.warning("Lead digest %s failed; will retry", reference)
+            return outcome
+        outcome['leads'] += len(leads)
+        position = str(leads[-1].id)
+        set_cursor(JOB, position)
+        logger.info("Lead digest of %d leads sent (%s)", len(leads), reference)
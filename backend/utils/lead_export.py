@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import logging
+
+from backend.extensions import db
+from backend.models import Lead
+
+logger = logging.getLogger(__name__)
+
+# Only the columns the admin API actually returns; selecting these instead of
+# full ORM entities keeps rows as lightweight tuples with no identity map.
+LEAD_EXPORT_COLUMNS = (
+    Lead.id,
+    Lead.user_id,
+    Lead.phone_number,
+    Lead.name,
+    Lead.original_loan_amount,
+    Lead.original_loan_tenure,
+    Lead.current_repayment,
+    Lead.new_repayment,
+    Lead.monthly_savings,
+    Lead.yearly_savings,
+    Lead.total_savings,
+    Lead.years_saved,
+    Lead.created_at,
+    Lead.updated_at,
+)
+LEAD_EXPORT_FIELDS = tuple(column.key for column in LEAD_EXPORT_COLUMNS)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+
+def _serialize_value(value):
+    """ Convert datetimes to ISO strings so rows are JSON/CSV friendly. """
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def lead_row_to_dict(row):
+    """ Convert a selected lead row tuple into a plain dict. """
+    return {field: _serialize_value(value) for field, value in zip(LEAD_EXPORT_FIELDS, row)}
+
+
+def fetch_leads_page(after_id=0, limit=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one keyset page of leads ordered by id.
+    Args:
+        after_id (int): Only leads with an id greater than this are returned.
+        limit (int): Maximum number of leads, capped at MAX_PAGE_SIZE.
+    Returns:
+        tuple: (list of lead dicts, next_after_id or None when exhausted).
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    rows = (
+        db.session.query(*LEAD_EXPORT_COLUMNS)
+        .filter(Lead.id > after_id)
+        .order_by(Lead.id)
+        .limit(limit)
+        .all()
+    )
+    leads = [lead_row_to_dict(row) for row in rows]
+    next_after_id = rows[-1].id if len(rows) == limit else None
+    return leads, next_after_id
+
+
+def iter_lead_rows(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream lead rows ordered by id without loading the table into memory.
+    yield_per makes SQLAlchemy fetch in batches (a server-side cursor on Postgres).
+    """
+    query = (
+        db.session.query(*LEAD_EXPORT_COLUMNS)
+        .order_by(Lead.id)
+        .execution_options(yield_per=batch_size)
+    )
+    exported = 0
+    try:
+        for row in query:
+            exported += 1
+            yield row
+    except Exception as e:
+        # Streamed responses have already sent a 200, so the log is the only trace of a cut-short export
+        logger.error("Lead export failed after %d rows: %s", exported, e)
+        raise
+    logger.info("Lead export finished: %d rows", exported)
+
+
+def iter_leads_ndjson(batch_size=EXPORT_BATCH_SIZE):
+    """ Yield NDJSON chunks of roughly batch_size leads each. """
+    buffer = []
+    for row in iter_lead_rows(batch_size):
+        buffer.append(json.dumps(lead_row_to_dict(row), separators=(',', ':')))
+        if len(buffer) >= batch_size:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
+
+
+def iter_leads_csv(batch_size=EXPORT_BATCH_SIZE):
+    """ Yield CSV chunks (header first) of roughly batch_size leads each. """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(LEAD_EXPORT_FIELDS)
+    pending = 0
+    for row in iter_lead_rows(batch_size):
+        writer.writerow([_serialize_value(value) for value in row])
+        pending += 1
+        if pending >= batch_size:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            pending = 0
+    remainder = output.getvalue()
+    if remainder:
+        yield remainder
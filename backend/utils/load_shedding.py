@@ -0,0 +1,210 @@
+"""
+Adaptive load shedding: under overload, query mode gives way to flow mode.
+
+Free-form questions wait on OpenAI; flow steps (name, loan amount, tenure,
+repayment) and handle_process_completion are quick database work that turns
+a conversation into a lead. Under overload both compete for the same worker
+threads, so a surge of questions would starve users about to become leads.
+The admission controller sits in front of every handled message and tracks
+three signals, each as a ratio to its target:
+
+    saturation   utilization of the worker: messages in flight, averaged over
+                 the last LOAD_SHED_UTILIZATION_WINDOW_SECONDS, per thread
+                 (LOAD_SHED_MAX_IN_FLIGHT) / LOAD_SHED_UTILIZATION_TARGET
+    queue        moving average of the time requests waited in the router
+                 before reaching the worker (X-Request-Start header)
+                 / LOAD_SHED_QUEUE_TARGET_MS
+    upstream     worst model-route p95 latency (backend.utils.query_router)
+                 / LOAD_SHED_UPSTREAM_P95_MS
+
+From the worst ratio it picks a shedding level:
+
+    0  normal      everything is handled as usual
+    1  degraded    worst ratio above 1: query-mode questions that need a model
+                   get a "busy" reply instead, except LOAD_SHED_PROBE_RATE of
+                   them, which go through so the upstream latency window stays
+                   current
+    2  shedding    saturation or queue at LOAD_SHED_CRITICAL_RATIO or more:
+                   every question that needs a model gets the "busy" reply,
+                   with no probes
+
+At every level, questions the query router answers locally (contact,
+identity, presets and confident FAQ matches) are still answered: routing is
+a lookup that takes microseconds, so only the model call is shed.
+
+Flow steps, greetings, restarts and process completion are never shed. The
+level rises as soon as a signal crosses its threshold and only falls after
+the signals have stayed below it for LOAD_SHED_COOLDOWN_SECONDS, so it does
+not flap. Upstream latency alone never reaches level 2: it is measured only
+by the calls level 1 still lets through.
+
+Saturation is averaged over time rather than sampled: a request always sees
+itself in flight, so an instantaneous count can only say "all threads are
+busy right now", while a worker busy for most of the last few seconds is
+one whose requests have started to queue. Debounce timers handle messages
+outside the request threads, so utilization can go above 1.
+
+The controller is per worker, like the query router's latency windows.
+
+    load_shedding_level               gauge, the current level
+    load_shedding_pressure{signal}    gauge, each signal's ratio
+    load_shed_messages_total{level}   busy replies given instead of a model call
+"""
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.extensions import registry
+from backend.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+NORMAL, DEGRADED, SHEDDING = 0, 1, 2
+QUEUE_SMOOTHING = 0.2  # Weight of the newest queue-wait sample in the moving average
+
+BUSY_MESSAGES = {
+    'en': "⏳ We're handling a lot of questions right now. Please ask again in a few minutes, "
+          "or contact our admin directly: wa.me/60126181683",
+    'ms': "⏳ Kami sedang menerima banyak soalan sekarang. Sila tanya semula dalam beberapa minit, "
+          "atau hubungi admin kami terus: wa.me/60126181683",
+    'zh': "⏳ 目前咨询量较大，请几分钟后再提问，或直接联系我们的管理员：wa.me/60126181683",
+}
+
+
+def busy_message(language_code):
+    """ The reply given instead of an answer while query mode is shed. """
+    return BUSY_MESSAGES.get(language_code) or BUSY_MESSAGES['en']
+
+
+def parse_request_start(value, now=None):
+    """
+    Seconds a request waited before reaching the worker, from an X-Request-Start header.
+    Args:
+        value (str): Epoch time in ms (Heroku) or "t=<microseconds>" (nginx), or None.
+        now (float): Current epoch time; time.time() by default.
+    Returns:
+        float: The wait in seconds, or None when the header is missing or unreadable.
+    """
+    if not value:
+        return None
+    try:
+        started = float(value.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    # Tell the units apart by magnitude: microseconds, milliseconds or seconds since the epoch
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max((now or time.time()) - started, 0.0)
+
+
+class AdmissionController:
+    """ Tracks this worker's load and decides how much query-mode work to shed. """
+
+    def __init__(self, config):
+        self.enabled = bool(config.get('LOAD_SHED_ENABLED', True))
+        self.max_in_flight = max(int(config.get('LOAD_SHED_MAX_IN_FLIGHT', 1)), 1)
+        self.utilization_target = float(config.get('LOAD_SHED_UTILIZATION_TARGET', 0.9))
+        self.utilization_window = max(float(config.get('LOAD_SHED_UTILIZATION_WINDOW_SECONDS', 2)), 0.1)
+        self.queue_target = float(config.get('LOAD_SHED_QUEUE_TARGET_MS', 1000)) / 1000
+        self.upstream_target = float(config.get('LOAD_SHED_UPSTREAM_P95_MS', 8000)) / 1000
+        self.critical_ratio = float(config.get('LOAD_SHED_CRITICAL_RATIO', 2.0))
+        self.cooldown = float(config.get('LOAD_SHED_COOLDOWN_SECONDS', 10))
+        self.probe_rate = float(config.get('LOAD_SHED_PROBE_RATE', 0.1))
+        self.level = NORMAL
+        self._in_flight = 0
+        self._busy = 0.0  # Time-weighted moving average of _in_flight
+        self._busy_at = time.monotonic()
+        self._queue_wait = 0.0
+        self._calm_since = None  # When the signals last dropped below the current level
+        self._lock = threading.Lock()
+
+    def observe_queue_wait(self, seconds):
+        """ Feed in how long a request waited before this worker picked it up. """
+        if seconds is None:
+            return
+        with self._lock:
+            self._queue_wait += QUEUE_SMOOTHING * (seconds - self._queue_wait)
+
+    def _track_busy(self, now, change):
+        """ Fold the time since the last change into the busy average, then apply change to _in_flight (under the lock). """
+        decay = math.exp(-max(now - self._busy_at, 0.0) / self.utilization_window)
+        self._busy = self._busy * decay + self._in_flight * (1 - decay)
+        self._busy_at = now
+        self._in_flight += change
+
+    def utilization(self, now=None):
+        """ Average fraction of the worker's threads busy over the recent window (above 1 when oversubscribed). """
+        with self._lock:
+            self._track_busy(now or time.monotonic(), 0)
+            return self._busy / self.max_in_flight
+
+    def pressure(self, now=None):
+        """ Each signal as a ratio to its target: {'saturation': ..., 'queue': ..., 'upstream': ...}. """
+        from backend.utils.query_router import get_query_router
+
+        return {
+            'saturation': self.utilization(now) / self.utilization_target if self.utilization_target > 0 else 0.0,
+            'queue': self._queue_wait / self.queue_target if self.queue_target > 0 else 0.0,
+            'upstream': get_query_router().latency_p95() / self.upstream_target if self.upstream_target > 0 else 0.0,
+        }
+
+    def _update(self, now):
+        pressure = self.pressure(now)
+        target = NORMAL
+        if max(pressure.values()) > 1:
+            target = DEGRADED
+        if max(pressure['saturation'], pressure['queue']) >= self.critical_ratio:
+            target = SHEDDING
+        with self._lock:
+            if target >= self.level:
+                self._calm_since = None
+                if target > self.level:
+                    logger.warning("Load shedding level %d -> %d (%s)", self.level, target,
+                                   ", ".join(f"{signal} {ratio:.2f}" for signal, ratio in pressure.items()))
+                    self.level = target
+            elif self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.cooldown:
+                logger.info("Load shedding level %d -> %d", self.level, target)
+                self.level = target
+                self._calm_since = None
+        metrics.set_gauge('load_shedding_level', self.level)
+        for signal, ratio in pressure.items():
+            metrics.set_gauge('load_shedding_pressure', round(ratio, 3), signal=signal)
+
+    @contextmanager
+    def admit(self):
+        """ Count a message as in flight while it is handled; the level is updated on the way in. """
+        now = time.monotonic()
+        if self.enabled:
+            self._update(now)
+        with self._lock:
+            self._track_busy(now, 1)
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._track_busy(time.monotonic(), -1)
+
+    def shed_model_call(self):
+        """ Whether a question that needs a model call gets the busy reply instead (all but probes when degraded, all when shedding). """
+        if not self.enabled or self.level < DEGRADED:
+            return False
+        if self.level < SHEDDING and random.random() < self.probe_rate:
+            return False
+        metrics.inc('load_shed_messages_total', level=str(self.level))
+        return True
+
+
+# Per worker: in-flight counts and the level are process state, so the controller is never built before fork
+registry.register('admission_controller', AdmissionController)
+
+
+def get_admission_controller():
+    """ Return this worker's AdmissionController. """
+    return registry.get('admission_controller')
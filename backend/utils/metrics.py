@@ -0,0 +1,179 @@
+"""
+Low-overhead per-process metrics with optional cross-worker aggregation.
+
+Counters, histograms and gauges live in plain dicts owned by the worker
+process. Gunicorn sync workers are single threaded, so updates need no locks.
+Under threads the GIL keeps the dicts consistent, at worst losing a rare
+concurrent increment. Every METRICS_FLUSH_INTERVAL seconds the deltas are
+pushed to Redis in one pipelined round trip, and /metrics renders the
+aggregate of all workers in Prometheus text format. Without REDIS_URL each
+worker reports only its own numbers.
+"""
+import atexit
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+
+from backend.extensions import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_COUNTERS_KEY = 'finzo:metrics:counters'
+REDIS_GAUGES_KEY = 'finzo:metrics:gauges:{pid}'
+FLUSH_INTERVAL = 10.0  # seconds; overridden from config by configure_metrics
+
+# Latency-style buckets in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [buckets, per-bucket counts..., +Inf count, sum, count]
+_gauges = {}      # (name, labels) -> float
+_flushed = {}     # series key -> value already pushed to Redis
+_last_flush = time.monotonic()
+
+
+def configure_metrics(config):
+    """ Apply METRICS_FLUSH_INTERVAL from the app config. """
+    global FLUSH_INTERVAL
+    FLUSH_INTERVAL = float(config.get('METRICS_FLUSH_INTERVAL', FLUSH_INTERVAL))
+
+
+def inc(name, value=1, **labels):
+    """ Increment a counter. """
+    key = (name, tuple(labels.items()))
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """ Set a gauge; aggregated per worker rather than summed. """
+    _gauges[(name, tuple(labels.items()))] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """ Record one observation into a fixed-bucket histogram. """
+    key = (name, tuple(labels.items()))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = [buckets] + [0] * (len(buckets) + 1) + [0.0, 0]
+    histogram[1 + bisect_left(histogram[0], value)] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def _series():
+    """ Flatten local metrics into {(name, labels): value} counter-style series. """
+    series = dict(_counters)
+    for (name, labels), histogram in _histograms.items():
+        buckets, counts = histogram[0], histogram[1:-2]
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), counts):
+            cumulative += count
+            series[(f'{name}_bucket', labels + (('le', str(bound)),))] = cumulative
+        series[(f'{name}_sum', labels)] = histogram[-2]
+        series[(f'{name}_count', labels)] = histogram[-1]
+    return series
+
+
+def _encode_key(key):
+    name, labels = key
+    return json.dumps([name, labels], separators=(',', ':'))
+
+
+def _decode_key(field):
+    name, labels = json.loads(field)
+    return name, tuple(tuple(pair) for pair in labels)
+
+
+def flush():
+    """ Push counter deltas and current gauges to Redis in a single pipeline. """
+    global _last_flush
+    _last_flush = time.monotonic()
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        deltas = {}
+        for key, value in _series().items():
+            field = _encode_key(key)
+            delta = value - _flushed.get(field, 0)
+            if delta or field not in _flushed:
+                pipe.hincrbyfloat(REDIS_COUNTERS_KEY, field, delta)
+                deltas[field] = value
+        if _gauges:
+            gauges_key = REDIS_GAUGES_KEY.format(pid=os.getpid())
+            pipe.hset(gauges_key, mapping={_encode_key(key): value for key, value in _gauges.items()})
+            pipe.expire(gauges_key, int(FLUSH_INTERVAL * 3) + 1)
+        pipe.execute()
+        _flushed.update(deltas)
+    except Exception as e:
+        logger.warning("Metrics flush to Redis failed: %s", e)
+
+
+def maybe_flush():
+    """ Cheap per-request hook: flush only once FLUSH_INTERVAL has elapsed. """
+    if time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def collect():
+    """
+    Return (series, gauges) for rendering, aggregated across workers when
+    Redis is configured and reachable, otherwise local to this process.
+    """
+    client = get_redis()
+    if client is not None:
+        try:
+            flush()
+            series = {_decode_key(field): float(value)
+                      for field, value in client.hgetall(REDIS_COUNTERS_KEY).items()}
+            gauges = {}
+            for gauges_key in client.scan_iter(REDIS_GAUGES_KEY.format(pid='*')):
+                pid = gauges_key.rsplit(':', 1)[-1]
+                for field, value in client.hgetall(gauges_key).items():
+                    name, labels = _decode_key(field)
+                    gauges[(name, labels + (('worker', pid),))] = float(value)
+            return series, gauges
+        except Exception as e:
+            logger.warning("Reading aggregated metrics from Redis failed: %s", e)
+    return _series(), dict(_gauges)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _sort_key(item):
+    """ Order series by name and labels, with histogram buckets in ascending 'le' order. """
+    (name, labels), _ = item
+    le = next((value for key, value in labels if key == 'le'), None)
+    base_labels = tuple(pair for pair in labels if pair[0] != 'le')
+    return name, base_labels, float('inf') if le in (None, '+Inf') else float(le)
+
+
+def render_prometheus():
+    """ Render all metrics in the Prometheus text exposition format. """
+    series, gauges = collect()
+    lines = []
+    for (name, labels), value in sorted(series.items(), key=_sort_key):
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), value in sorted(gauges.items(), key=_sort_key):
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """ Local, unaggregated view of this process's metrics (for benchmarks/debugging). """
+    return {'series': _series(), 'gauges': dict(_gauges)}
+
+
+atexit.register(flush)
@@ -0,0 +1,29 @@
+import logging
+
+from backend.extensions import registry
+
+logger = logging.getLogger(__name__)
+
+
+def _create_openai(config):
+    """
+    Configure the openai module on first use.
+    Importing openai costs ~0.1s, so it is deferred until a query actually needs it.
+    """
+    api_key = config.get('OPENAI_API_KEY')
+    if not api_key:
+        raise EnvironmentError("❌ Missing OPENAI_API_KEY. Please check your environment variables.")
+
+    import openai
+    openai.api_key = api_key
+    if config.get('OPENAI_API_BASE'):
+        openai.api_base = config['OPENAI_API_BASE']
+    return openai
+
+
+registry.register('openai', _create_openai)
+
+
+def get_openai():
+    """ Return the configured openai module. """
+    return registry.get('openai')
@@ -0,0 +1,90 @@
+"""
+Coalescing of outbound WhatsApp messages within one unit of work.
+
+A message often produces several replies to the same person: the three
+summary messages on completion, or an error followed by a prompt. Each
+is a separate Graph API call counted against the throughput tier. Inside a
+unit of work (backend/utils/unit_of_work.py), queue_message() collects
+replies in an outbox instead of deferring one send per reply. After the
+commit the outbox sends each recipient's messages in order, packed into as
+few text messages as fit OUTBOUND_MAX_CHARS (WhatsApp's text body limit is
+4096 characters) and separated by a blank line:
+
+    ["Savings report...", "What's next...", "Contact us..."]  ->  one send
+
+Recipients keep their own order; a message longer than the limit on its own
+is sent as it is. Outside a unit of work, or with OUTBOUND_COALESCE_ENABLED
+off, every message is sent immediately and separately, as before.
+"""
+import logging
+from collections import defaultdict
+
+from backend.extensions import registry
+from backend.utils import metrics
+from backend.utils.unit_of_work import current_unit_of_work
+from backend.utils.whatsapp import send_whatsapp_message
+
+logger = logging.getLogger(__name__)
+
+MAX_TEXT_CHARS = 4096
+SEPARATOR = "\n\n"
+
+
+def pack_messages(messages, max_chars=MAX_TEXT_CHARS, separator=SEPARATOR):
+    """
+    Join consecutive messages into as few texts of at most max_chars as possible, keeping their order.
+    Args:
+        messages (list): Message texts for one recipient.
+        max_chars (int): Longest text WhatsApp accepts.
+        separator (str): Placed between joined messages.
+    Returns:
+        list: The texts to send.
+    """
+    packed = []
+    for message in messages:
+        if packed and len(packed[-1]) + len(separator) + len(message) <= max_chars:
+            packed[-1] = packed[-1] + separator + message
+        else:
+            packed.append(message)
+    return packed
+
+
+class Outbox:
+    """ Messages queued during one unit of work, sent per recipient after it commits. """
+    __slots__ = ('messages', 'max_chars')
+
+    def __init__(self, max_chars=MAX_TEXT_CHARS):
+        self.messages = defaultdict(list)  # recipient -> texts, in queueing order
+        self.max_chars = max_chars
+
+    def add(self, to_number, message):
+        self.messages[to_number].append(message)
+
+    def flush(self):
+        """ Send everything queued; one recipient's failure never stops the others. """
+        messages, self.messages = self.messages, defaultdict(list)
+        for to_number, texts in messages.items():
+            packed = pack_messages(texts, self.max_chars)
+            if len(packed) < len(texts):
+                metrics.inc('whatsapp_sends_coalesced_total', len(texts) - len(packed))
+            for text in packed:
+                try:
+                    send_whatsapp_message(to_number, text)
+                except Exception as e:  # Missing credentials and the like
+                    logger.error("Failed to send a queued message to %s: %s", to_number, e)
+
+
+def queue_message(to_number, message):
+    """ Send a WhatsApp message after the current unit of work commits, coalesced with the recipient's others. """
+    uow = current_unit_of_work()
+    config = registry.config
+    if uow is None or not config.get('OUTBOUND_COALESCE_ENABLED', True):
+        if uow is None:
+            return send_whatsapp_message(to_number, message)
+        uow.after_commit(send_whatsapp_message, to_number, message)
+        return None
+    if uow.outbox is None:
+        uow.outbox = Outbox(int(config.get('OUTBOUND_MAX_CHARS', MAX_TEXT_CHARS)))
+        uow.after_commit(uow.outbox.flush)
+    uow.outbox.add(to_number, message)
+    return None
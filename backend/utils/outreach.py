@@ -0,0 +1,150 @@
+"""
+Proactive outbound messages (reminders, rate-change notices) sent in throttled batches.
+
+Every message is first claimed with a row in outreach_log, unique per
+(phone number, kind, reference). Only messages whose claim was inserted by
+this batch are sent, so overlapping scheduler runs or a re-run after a crash
+never message anyone twice about the same thing. Claims are committed before
+sending and their status (sent/failed) is written in one statement after the
+batch, which keeps DB round trips per batch constant.
+
+Sends are spaced by a Throttle to stay under the WhatsApp throughput tier.
+A crash between claiming and sending leaves rows 'pending': those messages
+are dropped rather than risk a duplicate. Jobs keep their progress in
+scheduler_cursors (get_cursor/set_cursor) so they resume where they stopped.
+"""
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+
+import pytz
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from backend.extensions import db
+from backend.models import OutreachLog, SchedulerCursor
+from backend.utils import metrics
+from backend.utils.whatsapp import send_whatsapp_message
+
+logger = logging.getLogger(__name__)
+
+MYT = pytz.timezone('Asia/Kuala_Lumpur')
+MAX_ERROR_LENGTH = 200
+
+
+class Throttle:
+    """ Space successive wait() calls at least 1/rate seconds apart; rate <= 0 disables throttling. """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = self._clock()
+        if self._next is not None and now < self._next:
+            self._sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def get_cursor(job):
+    """ Stored progress of a job, or None when it has never run. """
+    cursor = db.session.get(SchedulerCursor, job)
+    return cursor.position if cursor else None
+
+
+def set_cursor(job, position):
+    """ Store (and commit) a job's progress; position None forgets it. """
+    cursor = db.session.get(SchedulerCursor, job)
+    if position is None:
+        if cursor is not None:
+            db.session.delete(cursor)
+    elif cursor is None:
+        db.session.add(SchedulerCursor(job=job, position=position))
+    else:
+        cursor.position = position
+    db.session.commit()
+
+
+def claim(kind, items):
+    """
+    Insert outreach_log claims and return the ones that were not already taken.
+    Args:
+        kind (str): Message kind, e.g. 'reminder'.
+        items (list): (phone_number, reference) pairs.
+    Returns:
+        dict: (phone_number, reference) -> outreach_log id, for newly claimed pairs only.
+    """
+    if not items:
+        return {}
+    now = datetime.now(MYT)
+    rows = [dict(phone_number=phone_number, kind=kind, reference=reference, status='pending', created_at=now)
+            for phone_number, reference in dict.fromkeys(items)]
+    table = OutreachLog.__table__
+    dialect = db.session.get_bind().dialect.name
+    claimed = {}
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = (insert(table).values(rows)
+                     .on_conflict_do_nothing(index_elements=['phone_number', 'kind', 'reference'])
+                     .returning(table.c.id, table.c.phone_number, table.c.reference))
+        for log_id, phone_number, reference in db.session.execute(statement):
+            claimed[(phone_number, reference)] = log_id
+    else:
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    log_id = db.session.execute(table.insert().values(**row)).inserted_primary_key[0]
+                claimed[(row['phone_number'], row['reference'])] = log_id
+            except IntegrityError:
+                pass
+    db.session.commit()
+    return claimed
+
+
+def send_batch(kind, messages, throttle):
+    """
+    Claim and send one batch of proactive messages, then record the outcome.
+    Args:
+        kind (str): Message kind, e.g. 'reminder'.
+        messages (list): (phone_number, reference, text) tuples.
+        throttle (Throttle): Shared across batches so the send rate holds for the whole job.
+    Returns:
+        Counter: sent, failed and skipped (already claimed) counts.
+    """
+    outcome = Counter()
+    claimed = claim(kind, [(phone_number, reference) for phone_number, reference, _ in messages])
+    outcome['skipped'] = len(messages) - len(claimed)
+
+    results = []
+    for phone_number, reference, text in messages:
+        log_id = claimed.pop((phone_number, reference), None)
+        if log_id is None:
+            continue
+        throttle.wait()
+        try:
+            result = send_whatsapp_message(phone_number, text)
+        except Exception as e:  # Missing credentials and the like; record and keep going
+            result = {'status': 'failed', 'error': str(e)}
+        ok = result.get('status') == 'success'
+        outcome['sent' if ok else 'failed'] += 1
+        results.append({
+            'id': log_id,
+            'status': 'sent' if ok else 'failed',
+            'sent_at': datetime.now(MYT) if ok else None,
+            'error': None if ok else str(result.get('error'))[:MAX_ERROR_LENGTH],
+        })
+
+    if results:
+        db.session.execute(update(OutreachLog), results)
+        db.session.commit()
+    for status in ('sent', 'failed', 'skipped'):
+        if outcome[status]:
+            metrics.inc('outreach_messages_total', outcome[status], kind=kind, status=status)
+    return outcome
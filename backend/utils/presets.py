@@ -3,6 +3,10 @@ import os
 import logging
 from difflib import get_close_matches  # Used for fuzzy matching
 
+from backend.extensions import registry
+
+logger = logging.getLogger(__name__)
+
 # Load the preset responses from presets.json
 def load_presets():
     """
@@ -15,29 +19,35 @@ def load_presets():
         base_dir = os.path.dirname(os.path.abspath(__file__))  # Directory of the current file
         presets_path = os.path.join(base_dir, 'presets.json')  # Presets are in the same folder as this file
         
-        logging.info(f"🔍 Looking for presets.json at: {presets_path}")
-        
         with open(presets_path, 'r', encoding='utf-8') as f:
-            logging.info("✅ Successfully loaded presets.json")
-            return json.load(f)
+            presets = json.load(f)
+        logger.info("Loaded presets.json from %s", presets_path)
+        return presets
     except FileNotFoundError:
-        logging.error(f"❌ presets.json file not found at path: {presets_path}")
+        logger.error("presets.json file not found at path: %s", presets_path)
     except json.JSONDecodeError as e:
-        logging.error(f"❌ Invalid JSON format in presets.json: {e}")
+        logger.error("Invalid JSON format in presets.json: %s", e)
     except Exception as e:
-        logging.error(f"❌ Unexpected error loading presets.json: {e}")
+        logger.error("Unexpected error loading presets.json: %s", e)
     return {}
 
-# Global variable to store the presets
-PRESETS = load_presets()
+# Presets are parsed on first use (or during warm-up), not at import time
+registry.register('presets', lambda config: load_presets())
+
+def get_presets():
+    """
+    Returns the loaded presets, parsing presets.json on first use.
+    """
+    return registry.get('presets')
 
 def reload_presets():
     """
     Reloads the presets from presets.json without restarting the server.
     """
-    global PRESETS
-    PRESETS = load_presets()
-    logging.info("🔄 Presets reloaded successfully.")
+    registry.reset('presets')
+    registry.reset('knowledge_index')  # Built from the presets (backend/utils/retrieval.py)
+    get_presets()
+    logger.info("Presets reloaded successfully.")
 
 def clean_question(question):
     """
@@ -67,26 +77,26 @@ def get_preset_response(question, language_code='en'):
         language_code = language_code.lower().strip()
         
         # Get the relevant language's presets
-        language_presets = PRESETS.get(language_code, {})
+        language_presets = get_presets().get(language_code, {})
         
         # Clean and normalize the user's question
         cleaned_question = clean_question(question)
         
         # Check for an exact match first
         if cleaned_question in language_presets:
-            logging.info(f"✅ Exact match found for question '{cleaned_question}' in {language_code}.")
+            logger.debug("Exact preset match for '%s' in %s", cleaned_question, language_code)
             return language_presets.get(cleaned_question)
         
         # If exact match not found, use fuzzy matching to find the closest match
         possible_matches = get_close_matches(cleaned_question, language_presets.keys(), n=1, cutoff=0.8)
         if possible_matches:
             best_match = possible_matches[0]
-            logging.info(f"🔍 Fuzzy match found: '{cleaned_question}' matched with '{best_match}' in {language_code}.")
+            logger.debug("Fuzzy preset match: '%s' matched '%s' in %s", cleaned_question, best_match, language_code)
             return language_presets.get(best_match)
         
-        logging.info(f"❌ No preset response found for question '{cleaned_question}' in {language_code}.")
+        logger.debug("No preset response for '%s' in %s", cleaned_question, language_code)
         return None
 
     except Exception as e:
-        logging.error(f"❌ Error while fetching preset response: {e}")
+        logger.error("Error while fetching preset response: %s", e)
         return None
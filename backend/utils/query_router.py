@@ -0,0 +1,217 @@
+"""
+Latency-aware routing of query-mode questions.
+
+Every question used to go to gpt-3.5-turbo with max_tokens=150. The router
+classifies it on-box first, in microseconds, and picks where it goes:
+
+    local     answered without a model: contact/identity shortcuts
+              (backend.utils.intents) and questions whose best BM25 hit is
+              a preset FAQ entry with confidence of at least
+              RETRIEVAL_ANSWER_MIN_CONFIDENCE (backend.utils.retrieval)
+    short     a few words, one question          -> QUERY_MODEL_FAST
+    standard  everything else                     -> QUERY_MODEL_FAST
+    complex   long, several questions, or asks to compare or calculate
+                                                  -> QUERY_MODEL_STRONG
+
+max_tokens comes from QUERY_MAX_TOKENS per route, and the prompt asks for an
+answer that fits, so answers are short rather than cut off. Model routes
+carry the retrieved passages above RETRIEVAL_CONTEXT_MIN_CONFIDENCE as
+context, so the model answers from our FAQ and policies instead of guessing.
+
+Each model route keeps a sliding window of its last QUERY_LATENCY_WINDOW
+latencies. While a route's p95 is above QUERY_LATENCY_SLO_MS it is degraded:
+it uses the fast model and max_tokens shrinks in proportion to the overshoot
+(generation time grows with output length), until the window recovers.
+Windows are per worker; latency, tokens and route choices go to metrics:
+
+    query_routes_total{route, model, degraded}
+    query_latency_seconds{route}           histogram
+    query_tokens_total{route, model, kind} prompt / completion tokens
+    query_latency_p95_seconds{route}       gauge
+    retrieval_outcomes_total{outcome}      answered / context / none
+"""
+import logging
+import re
+import threading
+from collections import deque, namedtuple
+
+from backend.extensions import registry
+from backend.logging_config import parse_mapping
+from backend.utils import metrics
+from backend.utils.intents import CONTACT_ADMIN, CREATOR, IDENTITY, detect_intents
+from backend.utils.retrieval import context_block, retrieve
+
+logger = logging.getLogger(__name__)
+
+LOCAL, SHORT, STANDARD, COMPLEX = 'local', 'short', 'standard', 'complex'
+MODEL_ROUTES = (SHORT, STANDARD, COMPLEX)
+
+DEFAULT_MAX_TOKENS = {SHORT: 80, STANDARD: 150, COMPLEX: 300}
+MIN_MAX_TOKENS = 60
+MIN_SAMPLES = 20  # Latencies needed before a route's p95 is trusted
+SHORT_QUESTION_WORDS = 8
+LONG_QUESTION_WORDS = 30
+WORDS_PER_TOKEN = 0.6
+
+LOCAL_ANSWERS = {
+    CONTACT_ADMIN: "You can contact our admin directly at wa.me/60126181683",
+    IDENTITY: "I am FinZo AI, your refinancing assistant.",
+    CREATOR: "I am FinZo AI, created to help with refinancing and home loan queries.",
+}
+
+# Asking to weigh options or work out numbers needs the stronger model and a longer answer
+_COMPLEX_MARKERS = re.compile(
+    r'\b(?:compare|comparison|calculate|calculation|difference|versus|vs|better|worth|pros|cons|'
+    r'bandingkan|perbandingan|kira|beza|berbaloi)\b|比较|计算|区别|哪个|值得',
+    re.IGNORECASE,
+)
+_WORD = re.compile(r'[^\W\d_]+|\d+(?:[.,]\d+)*')
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)*')
+
+Route = namedtuple('Route', 'name model max_tokens answer degraded context')
+
+
+def question_words(question):
+    """ Rough word count; Chinese is counted as one word per two characters. """
+    count = 0
+    for word in _WORD.findall(question):
+        han = sum(1 for char in word if '一' <= char <= '鿿')
+        count += (han + 1) // 2 if han else 1
+    return count
+
+
+def classify(question):
+    """ The model route for a question that has no local answer: short, standard or complex. """
+    words = question_words(question)
+    if (words >= LONG_QUESTION_WORDS or question.count('?') + question.count('？') > 1
+            or len(_NUMBER.findall(question)) >= 2 or _COMPLEX_MARKERS.search(question)):
+        return COMPLEX
+    if words <= SHORT_QUESTION_WORDS:
+        return SHORT
+    return STANDARD
+
+
+class LatencyWindow:
+    """ The last `size` latencies of a route, for a rolling p95. """
+
+    def __init__(self, size):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+class QueryRouter:
+    """ Chooses a route per question and learns each route's latency from record(). """
+
+    def __init__(self, config):
+        self.enabled = bool(config.get('QUERY_ROUTING_ENABLED', True))
+        self.fast_model = config.get('QUERY_MODEL_FAST') or 'gpt-3.5-turbo'
+        self.strong_model = config.get('QUERY_MODEL_STRONG') or self.fast_model
+        self.slo_seconds = float(config.get('QUERY_LATENCY_SLO_MS', 4000)) / 1000
+        self.retrieval_enabled = bool(config.get('RETRIEVAL_ENABLED', True))
+        self.answer_confidence = float(config.get('RETRIEVAL_ANSWER_MIN_CONFIDENCE', 0.65))
+        self.context_confidence = float(config.get('RETRIEVAL_CONTEXT_MIN_CONFIDENCE', 0.25))
+        self.top_k = int(config.get('RETRIEVAL_TOP_K', 3))
+        self.context_chars = int(config.get('RETRIEVAL_CONTEXT_CHARS', 1200))
+        overrides = parse_mapping(config.get('QUERY_MAX_TOKENS'))
+        self.max_tokens = {route: int(overrides.get(route, tokens)) for route, tokens in DEFAULT_MAX_TOKENS.items()}
+        window = int(config.get('QUERY_LATENCY_WINDOW', 200))
+        self.windows = {route: LatencyWindow(window) for route in MODEL_ROUTES}
+
+    def route(self, question, language_code='en'):
+        """
+        Decide how to answer a query-mode question.
+        Args:
+            question (str): The user's question.
+            language_code (str): The conversation language, for preset matching.
+        Returns:
+            Route: answer is set for local routes; otherwise model, max_tokens and context to call with.
+        """
+        intents = detect_intents(question)
+        for intent, answer in LOCAL_ANSWERS.items():
+            if intent in intents:
+                return self._chosen(Route(LOCAL, None, 0, answer, False, None))
+
+        if not self.enabled:
+            return self._chosen(Route(STANDARD, self.fast_model, DEFAULT_MAX_TOKENS[STANDARD], None, False, None))
+
+        context = None
+        if self.retrieval_enabled:
+            hits = retrieve(question, language_code or 'en', self.top_k)
+            if hits and hits[0].passage.answer and hits[0].confidence >= self.answer_confidence:
+                metrics.inc('retrieval_outcomes_total', outcome='answered')
+                return self._chosen(Route(LOCAL, None, 0, hits[0].passage.answer, False, None))
+            relevant = [hit for hit in hits if hit.confidence >= self.context_confidence]
+            metrics.inc('retrieval_outcomes_total', outcome='context' if relevant else 'none')
+            context = context_block(relevant, self.context_chars) or None
+
+        name = classify(question)
+        model = self.strong_model if name == COMPLEX else self.fast_model
+        max_tokens = self.max_tokens[name]
+        window = self.windows[name]
+        p95 = window.percentile(95) if len(window) >= MIN_SAMPLES else 0.0
+        if p95 > self.slo_seconds:
+            # Over the SLO: cheaper model and shorter answers until the window recovers
+            return self._chosen(Route(name, self.fast_model,
+                                      max(MIN_MAX_TOKENS, int(max_tokens * self.slo_seconds / p95)), None, True,
+                                      context))
+        return self._chosen(Route(name, model, max_tokens, None, False, context))
+
+    def record(self, route, seconds, usage=None):
+        """ Feed back the latency (and token usage, when known) of a model call made for route. """
+        window = self.windows.get(route.name)
+        if window is None:
+            return
+        window.add(seconds)
+        metrics.observe('query_latency_seconds', seconds, route=route.name)
+        metrics.set_gauge('query_latency_p95_seconds', window.percentile(95), route=route.name)
+        for kind in ('prompt', 'completion'):
+            tokens = (usage or {}).get(f'{kind}_tokens')
+            if tokens:
+                metrics.inc('query_tokens_total', tokens, route=route.name, model=route.model, kind=kind)
+
+    def latency_p95(self):
+        """ The worst p95 latency in seconds over model routes with enough samples (0 when none has). """
+        return max((window.percentile(95) for window in self.windows.values() if len(window) >= MIN_SAMPLES),
+                   default=0.0)
+
+    @staticmethod
+    def _chosen(route):
+        metrics.inc('query_routes_total', route=route.name, model=route.model or 'none',
+                    degraded=str(route.degraded).lower())
+        return route
+
+
+def answer_length_hint(route):
+    """ Prompt line asking for an answer that fits the route's max_tokens. """
+    return f"Keep the answer under {int(route.max_tokens * WORDS_PER_TOKEN)} words."
+
+
+def context_prompt(route):
+    """ System message grounding the model in the retrieved passages, or None without context. """
+    if not route.context:
+        return None
+    return ("Reference material from FinZo's FAQ and policies. Base your answer on it when it is relevant, "
+            "and do not contradict it:\n\n" + route.context)
+
+
+# Per worker: latency windows are mutable, so the router is never built before fork
+registry.register('query_router', QueryRouter)
+
+
+def get_query_router():
+    """ Return this worker's QueryRouter. """
+    return registry.get('query_router')
@@ -0,0 +1,141 @@
+"""
+Re-notify past leads when a cheaper bank rate appears.
+
+The scheduler's rate_changes job calls renotify_leads() for every bank rate
+added or changed since its last run. Leads whose loan amount the rate covers
+are streamed newest first in keyset chunks of RATE_RENOTIFY_CHUNK_SIZE, and
+each chunk is evaluated column-wise: loan tenures take a handful of values, so
+the annuity factor (1 + r)^n is computed once per distinct tenure instead of
+once per lead, and a new repayment is one multiplication.
+
+A lead is told about the rate when it is now the best rate for its amount and
+the repayment drops by at least RATE_RENOTIFY_MIN_GAIN a month against what we
+quoted it. Messages are localized from the lead's conversation and go through
+the throttled outbound sender, claimed once per phone number and rate
+(backend.utils.outreach).
+
+Progress is checkpointed in scheduler_cursors after every chunk. A crash or
+deploy resumes at the next chunk, and a run stops after
+RATE_RENOTIFY_CHUNKS_PER_RUN chunks so other jobs are not starved by a large
+backlog.
+"""
+import logging
+from collections import Counter, namedtuple
+
+from backend.extensions import db
+from backend.models import ChatflowTemp, Lead
+from backend.utils.amortization import payment_factor
+from backend.utils.outreach import get_cursor, send_batch, set_cursor
+
+logger = logging.getLogger(__name__)
+
+RENOTIFY_MESSAGES = {
+    'en': "📉 Rates just dropped! {bank_name} now offers {interest_rate:.2f}%.\n\n"
+          "For your RM {loan_amount:,.0f} loan, your repayment could be RM {new_repayment:,.2f} a month, "
+          "RM {gain:,.2f} less than we quoted you.\n\nType 'restart' to recalculate your savings.",
+    'ms': "📉 Kadar baru sahaja turun! {bank_name} kini menawarkan {interest_rate:.2f}%.\n\n"
+          "Untuk pinjaman RM {loan_amount:,.0f} anda, bayaran bulanan boleh menjadi RM {new_repayment:,.2f}, "
+          "RM {gain:,.2f} kurang daripada sebut harga kami.\n\nTaip 'restart' untuk mengira semula penjimatan anda.",
+    'zh': "📉 利率刚刚下调！{bank_name} 现提供 {interest_rate:.2f}% 的利率。\n\n"
+          "您 RM {loan_amount:,.0f} 的贷款每月还款可降至 RM {new_repayment:,.2f}，"
+          "比我们之前的报价少 RM {gain:,.2f}。\n\n输入 'restart' 重新计算您的节省金额。",
+}
+
+LeadQuote = namedtuple('LeadQuote', 'id phone_number loan_amount tenure current_repayment quoted_repayment language_code')
+Renotification = namedtuple('Renotification', 'phone_number language_code loan_amount new_repayment gain')
+
+
+def annuity_factors(annual_rate, tenures):
+    """ Monthly repayment per ringgit borrowed, for each distinct tenure in years. """
+    return {tenure: payment_factor(annual_rate, int(tenure * 12)) for tenure in set(tenures)}
+
+
+def monthly_repayments(loan_amounts, tenures, annual_rate):
+    """ New monthly repayments for parallel sequences of loan amounts and tenures at annual_rate. """
+    factors = annuity_factors(annual_rate, tenures)
+    return [round(amount * factors[tenure], 2) for amount, tenure in zip(loan_amounts, tenures)]
+
+
+def evaluate_chunk(leads, rate, index, min_gain):
+    """
+    Pick the leads in one chunk worth telling about rate.
+    Args:
+        leads (list): LeadQuote rows, newest first.
+        rate: The new or changed BankRate.
+        index (BankRateIndex): Current rates, to skip amounts another bank still beats.
+        min_gain (float): Minimum drop in monthly repayment versus the quoted one.
+    Returns:
+        list: Renotification tuples, at most one per phone number (its newest lead).
+    """
+    repayments = monthly_repayments([lead.loan_amount for lead in leads], [lead.tenure for lead in leads],
+                                    rate.interest_rate)
+    selected = {}
+    for lead, new_repayment in zip(leads, repayments):
+        if lead.phone_number in selected:
+            continue
+        best = index.best_rate(lead.loan_amount)
+        if best is not None and best.interest_rate < rate.interest_rate:
+            continue
+        quoted = lead.quoted_repayment or lead.current_repayment
+        gain = quoted - new_repayment
+        if gain >= min_gain and new_repayment < lead.current_repayment:
+            selected[lead.phone_number] = Renotification(lead.phone_number, lead.language_code, lead.loan_amount,
+                                                         new_repayment, round(gain, 2))
+    return list(selected.values())
+
+
+def fetch_lead_chunk(rate, before_id, chunk_size):
+    """ Up to chunk_size leads covered by rate with ids below before_id, newest first. """
+    query = (
+        db.session.query(Lead.id, Lead.phone_number, Lead.original_loan_amount, Lead.original_loan_tenure,
+                         Lead.current_repayment, Lead.new_repayment, ChatflowTemp.language_code)
+        .outerjoin(ChatflowTemp, ChatflowTemp.phone_number == Lead.phone_number)
+        .filter(Lead.original_loan_amount >= rate.min_amount, Lead.original_loan_amount <= rate.max_amount)
+    )
+    if before_id is not None:
+        query = query.filter(Lead.id < before_id)
+    return [LeadQuote(*row) for row in query.order_by(Lead.id.desc()).limit(chunk_size)]
+
+
+def _message(renotification, rate):
+    language_code = renotification.language_code if renotification.language_code in RENOTIFY_MESSAGES else 'en'
+    return RENOTIFY_MESSAGES[language_code].format(
+        bank_name=rate.bank_name, interest_rate=rate.interest_rate, loan_amount=renotification.loan_amount,
+        new_repayment=renotification.new_repayment, gain=renotification.gain)
+
+
+def renotify_leads(rate, config, throttle, index):
+    """
+    Run (or resume) the re-notification pipeline for one bank rate.
+    Returns:
+        tuple: (Counter of sent/failed/skipped, True once every lead has been considered).
+    """
+    job = f'rate_renotify:{rate.id}'
+    rate_key = f'{rate.interest_rate:.4f}'
+    reference = f'rate:{rate.id}:{rate_key}'
+    chunk_size = int(config.get('RATE_RENOTIFY_CHUNK_SIZE', 1000))
+    chunks_per_run = int(config.get('RATE_RENOTIFY_CHUNKS_PER_RUN', 10))
+    min_gain = float(config.get('RATE_RENOTIFY_MIN_GAIN', 50))
+
+    before_id = None
+    checkpoint = get_cursor(job)
+    if checkpoint:
+        checkpoint_rate, _, last_id = checkpoint.partition('|')
+        if checkpoint_rate == rate_key:  # A rate changed again mid-run starts over
+            before_id = int(last_id)
+
+    outcome = Counter()
+    for _ in range(chunks_per_run):
+        leads = fetch_lead_chunk(rate, before_id, chunk_size)
+        if not leads:
+            set_cursor(job, None)
+            logger.info("Re-notified leads about %s at %s%%", rate.bank_name, rate.interest_rate,
+                        extra={'outcome': dict(outcome)})
+            return outcome, True
+        selected = evaluate_chunk(leads, rate, index, min_gain)
+        outcome['considered'] += len(leads)
+        outcome += send_batch('rate_change', [(item.phone_number, reference, _message(item, rate)) for item in selected],
+                              throttle)
+        before_id = leads[-1].id
+        set_cursor(job, f'{rate_key}|{before_id}')
+    return outcome, False
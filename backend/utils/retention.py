@@ -0,0 +1,310 @@
+"""
+Retention and erasure, enforcing deletion-policy.txt.
+
+The scheduler's retention job (backend/scheduler.py) does two things each run:
+
+    erasure    Pending erasure_requests that are due (RETENTION_ERASURE_DELAY_DAYS
+               after the request): everything tied to the phone number is
+               deleted. That covers the user's chat logs (hot and archived),
+               leads, chatflow state, outreach log and finally the user.
+               The request is kept as an audit record with the phone number
+               replaced by its SHA-256.
+    age        Per-table policies from RETENTION_DAYS ("chat_logs=365,..."; 0
+               keeps a table forever): rows older than the limit are deleted.
+               A user goes once nothing of theirs is left. Off by default:
+               the policy promises to act on deletion requests, not that
+               all data expires, so operators opt each table in.
+
+Lead rollups are aggregates without personal data and are kept, as the policy
+allows.
+
+Nothing is deleted with one large statement. Rows are selected in keyset
+order (primary key, or (timestamp, id) where an index supports it) and
+deleted by id in batches of RETENTION_BATCH_SIZE, each its own short
+transaction. Only the rows being deleted are locked, and never for long, so
+the chatbot's writes to the same tables are not blocked. A WriteBudget
+sleeps between batches to hold deletes to RETENTION_ROWS_PER_SECOND. A run
+stops after RETENTION_MAX_ROWS_PER_RUN rows, and the next run carries on:
+expired rows are still expired, and unfinished erasures are still pending.
+
+    flask retention erase 60123456789          # record an erasure request
+    flask retention erase 60123456789 --now    # ...and process it immediately
+    flask retention run                        # one pass with progress output
+"""
+import hashlib
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+import pytz
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import exists, or_, tuple_
+
+from backend.extensions import db
+from backend.logging_config import parse_mapping
+from backend.models import ChatflowTemp, ChatLog, ChatLogArchive, ErasureRequest, Lead, OutreachLog, User
+from backend.utils import metrics
+from backend.utils.chat_archive import drop_archived, remove_orphan_segments
+
+logger = logging.getLogger(__name__)
+
+MYT = pytz.timezone('Asia/Kuala_Lumpur')
+
+# Days each table is kept (0 = forever); operators opt tables in through RETENTION_DAYS
+DEFAULT_RETENTION_DAYS = {
+    'chatflow_temp': 0,
+    'chat_logs': 0,
+    'leads': 0,
+    'outreach_log': 0,
+    'users': 0,
+}
+
+retention_cli = AppGroup('retention', help='Purge expired data and process erasure requests.')
+
+
+def _now():
+    """ Timestamps are stored as naive Malaysia time (see backend.models). """
+    return datetime.now(MYT).replace(tzinfo=None)
+
+
+class WriteBudget:
+    """ Caps deletes at rows_per_second (sleeping between batches) and max_rows per run. """
+
+    def __init__(self, rows_per_second, max_rows, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rows_per_second if rows_per_second and rows_per_second > 0 else 0.0
+        self.remaining = max_rows
+        self._clock = clock
+        self._sleep = sleep
+        self._next = None
+
+    @property
+    def exhausted(self):
+        return self.remaining <= 0
+
+    def spend(self, rows):
+        """ Account for rows just deleted and wait until the budget allows the next batch. """
+        self.remaining -= rows
+        if not self.interval:
+            return
+        now = self._clock()
+        self._next = max(self._next or now, now) + rows * self.interval
+        if self._next > now:
+            self._sleep(self._next - now)
+
+
+def delete_in_batches(model, criteria, budget, batch_size, table, order_by=None, progress=None):
+    """
+    Delete the rows of model matching criteria, batch by batch in keyset order.
+    Args:
+        model: The model class; its primary key must be `id`.
+        criteria (list): SQL conditions selecting the rows.
+        budget (WriteBudget): Shared by the whole run.
+        batch_size (int): Rows per delete statement and transaction.
+        table (str): Name used in metrics and progress.
+        order_by: An indexed column to walk (with id as tie-breaker); the primary key alone by default.
+        progress (callable): Called with (table, rows deleted so far) after every batch.
+    Returns:
+        tuple: (rows deleted, True if no matching rows are left).
+    """
+    columns = (order_by, model.id) if order_by is not None else (model.id,)
+    deleted = 0
+    position = None
+    while not budget.exhausted:
+        query = db.session.query(*columns).filter(*criteria)
+        if position is not None:
+            query = query.filter(tuple_(*columns) > tuple_(*position) if len(columns) > 1 else model.id > position[0])
+        rows = query.order_by(*columns).limit(max(min(batch_size, budget.remaining), 1)).all()
+        if not rows:
+            return deleted, True
+        count = (
+            db.session.query(model)
+            .filter(model.id.in_([row.id for row in rows]))
+            .delete(synchronize_session=False)
+        )
+        db.session.commit()
+        position = tuple(rows[-1])
+        deleted += count
+        metrics.inc('retention_rows_deleted_total', count, table=table)
+        if progress:
+            progress(table, deleted)
+        budget.spend(count)
+    return deleted, False
+
+
+def _user_owns_nothing():
+    return [
+        ~exists().where(ChatLog.user_id == User.id),
+        ~exists().where(ChatLogArchive.user_id == User.id),
+        ~exists().where(Lead.user_id == User.id),
+        ~exists().where(or_(ChatflowTemp.user_id == User.id, ChatflowTemp.phone_number == User.phone_number)),
+    ]
+
+
+def _expired(table, cutoff):
+    """ (model, criteria, keyset column) selecting a table's rows older than cutoff. """
+    if table == 'chatflow_temp':
+        return ChatflowTemp, [ChatflowTemp.updated_at < cutoff], None
+    if table == 'chat_logs':
+        return ChatLog, [ChatLog.created_at < cutoff], ChatLog.created_at  # ix_chat_logs_created_at_id
+    if table == 'leads':
+        return Lead, [Lead.updated_at < cutoff], None
+    if table == 'outreach_log':
+        return OutreachLog, [OutreachLog.created_at < cutoff], None
+    if table == 'users':
+        return User, [User.created_at < cutoff, *_user_owns_nothing()], None
+    raise ValueError(f"No retention policy for table {table}")
+
+
+def retention_days(config):
+    """ Days kept per table, from DEFAULT_RETENTION_DAYS and RETENTION_DAYS. """
+    overrides = parse_mapping(config.get('RETENTION_DAYS'))
+    return {table: float(overrides.get(table, days)) for table, days in DEFAULT_RETENTION_DAYS.items()}
+
+
+def request_erasure(phone_number, delay_days=0, now=None):
+    """ Record (and commit) a request to delete everything tied to phone_number; returns the request. """
+    now = now or _now()
+    request = ErasureRequest(phone_number=str(phone_number), status='pending', due_at=now + timedelta(days=delay_days),
+                             created_at=now)
+    db.session.add(request)
+    db.session.commit()
+    logger.info("Erasure request %s recorded, due %s", request.id, request.due_at)
+    return request
+
+
+def erase_phone_number(phone_number, budget, batch_size, progress=None):
+    """
+    Delete everything tied to one phone number, children before the user.
+    Returns:
+        tuple: (rows deleted, True when finished; False when the budget ran out first).
+    """
+    user = User.query.filter_by(phone_number=phone_number).first()
+    if user is None:
+        steps = [
+            (ChatflowTemp, [ChatflowTemp.phone_number == phone_number], 'chatflow_temp'),
+            (Lead, [Lead.phone_number == phone_number], 'leads'),
+        ]
+    else:
+        steps = [
+            (ChatLog, [ChatLog.user_id == user.id], 'chat_logs'),
+            (ChatflowTemp, [or_(ChatflowTemp.phone_number == phone_number, ChatflowTemp.user_id == user.id)],
+             'chatflow_temp'),
+            (Lead, [or_(Lead.phone_number == phone_number, Lead.user_id == user.id)], 'leads'),
+        ]
+    steps.append((OutreachLog, [OutreachLog.phone_number == phone_number], 'outreach_log'))
+
+    total = 0
+    if user is not None:
+        archived = drop_archived(ChatLogArchive.user_id == user.id)
+        total += archived['rows']
+        if archived['rows']:
+            metrics.inc('retention_rows_deleted_total', archived['rows'], table='chat_log_archives')
+        budget.spend(archived['members'])
+    for model, criteria, table in steps:
+        deleted, finished = delete_in_batches(model, criteria, budget, batch_size, table, progress=progress)
+        total += deleted
+        if not finished:
+            return total, False
+    if user is not None:
+        if budget.exhausted:
+            return total, False
+        deleted, _ = delete_in_batches(User, [User.id == user.id], budget, batch_size, 'users', progress=progress)
+        total += deleted
+    return total, True
+
+
+def process_erasure_requests(budget, batch_size, now=None, progress=None):
+    """ Work through due erasure requests, oldest first, until done or out of budget; returns outcome counts. """
+    outcome = Counter()
+    now = now or _now()
+    while not budget.exhausted:
+        request = (
+            ErasureRequest.query
+            .filter(ErasureRequest.status == 'pending', ErasureRequest.due_at <= now)
+            .order_by(ErasureRequest.due_at, ErasureRequest.id)
+            .first()
+        )
+        if request is None:
+            break
+        phone_number = request.phone_number
+        deleted, finished = erase_phone_number(phone_number, budget, batch_size, progress)
+        request.rows_deleted += deleted
+        outcome['rows'] += deleted
+        if finished:
+            request.status = 'done'
+            request.processed_at = _now()
+            request.phone_number = hashlib.sha256(phone_number.encode('utf-8')).hexdigest()
+            outcome['erased'] += 1
+            metrics.inc('retention_erasures_total')
+        db.session.commit()
+        if not finished:
+            break
+    return outcome
+
+
+def purge_expired(config, budget, batch_size, now=None, progress=None):
+    """ Delete rows past their table's retention; returns rows deleted per table. """
+    now = now or _now()
+    outcome = Counter()
+    days = retention_days(config)
+    if days['chat_logs'] > 0:
+        # Archived chat logs expire by their newest message, a whole member at a time
+        archived = drop_archived(ChatLogArchive.last_created_at < now - timedelta(days=days['chat_logs']))
+        if archived['rows']:
+            outcome['chat_log_archives'] += archived['rows']
+            metrics.inc('retention_rows_deleted_total', archived['rows'], table='chat_log_archives')
+        budget.spend(archived['members'])
+        remove_orphan_segments()
+    # Users last, after what they own
+    for table in ('chatflow_temp', 'chat_logs', 'leads', 'outreach_log', 'users'):
+        if days[table] <= 0 or budget.exhausted:
+            continue
+        model, criteria, order_by = _expired(table, now - timedelta(days=days[table]))
+        deleted, _ = delete_in_batches(model, criteria, budget, batch_size, table, order_by, progress)
+        if deleted:
+            outcome[table] += deleted
+    return outcome
+
+
+def run_retention(config, throttle=None, now=None, progress=None):
+    """ Scheduler job: due erasure requests first, then age-based purges, within the write budget. """
+    started = time.perf_counter()
+    budget = WriteBudget(float(config.get('RETENTION_ROWS_PER_SECOND', 200)),
+                         int(config.get('RETENTION_MAX_ROWS_PER_RUN', 20000)))
+    batch_size = int(config.get('RETENTION_BATCH_SIZE', 200))
+    outcome = process_erasure_requests(budget, batch_size, now, progress)
+    outcome += purge_expired(config, budget, batch_size, now, progress)
+    if outcome:
+        logger.info("Retention pass finished in %.1fs", time.perf_counter() - started,
+                    extra={'outcome': dict(outcome), 'budget_exhausted': budget.exhausted})
+    return outcome
+
+
+def _echo_progress(table, deleted):
+    click.echo(f"  {table}: {deleted} rows deleted")
+
+
+@retention_cli.command('run')
+def run_command():
+    """ Run one retention pass now, printing progress. """
+    outcome = run_retention(current_app.config, progress=_echo_progress)
+    click.echo(f"Done: {dict(outcome) or 'nothing to delete'}")
+
+
+@retention_cli.command('erase')
+@click.argument('phone_number')
+@click.option('--now', 'immediately', is_flag=True, help='Process the request right away instead of at its due date.')
+def erase_command(phone_number, immediately):
+    """ Record a request to delete all data tied to a phone number. """
+    delay = 0 if immediately else float(current_app.config.get('RETENTION_ERASURE_DELAY_DAYS', 0))
+    request = request_erasure(phone_number, delay_days=delay)
+    click.echo(f"Erasure request {request.id} due {request.due_at:%Y-%m-%d %H:%M}.")
+    if immediately:
+        config = current_app.config
+        budget = WriteBudget(float(config.get('RETENTION_ROWS_PER_SECOND', 200)), float('inf'))
+        outcome = process_erasure_requests(budget, int(config.get('RETENTION_BATCH_SIZE', 200)),
+                                           progress=_echo_progress)
+        click.echo(f"Erased {outcome['erased']} request(s), {outcome['rows']} rows.")
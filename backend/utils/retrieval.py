@@ -0,0 +1,257 @@
+"""
+Local BM25 retrieval over what FinZo already knows: the preset FAQ
+(backend/utils/presets.json) and the privacy, terms-of-service and
+deletion policies at the project root.
+
+The index is built once at startup (in the gunicorn master before fork, see
+backend/warmup.py) and is read-only afterwards:
+
+    passages   one per preset question/answer pair (per language), and the
+               policies split into their numbered sections, long sections
+               cut into chunks of about CHUNK_WORDS words
+    postings   compressed-sparse-row layout in array.array: for term id t,
+               doc_ids[offsets[t]:offsets[t + 1]] and the matching term
+               frequencies in tfs. No per-posting Python objects, so the
+               whole index is a few hundred KB and shares cleanly after fork
+
+A query scores only the postings of its own terms with BM25 (k1=1.2,
+b=0.75). Preset questions are indexed three times over (QUESTION_WEIGHT) so a
+question that paraphrases a preset beats a passage that merely mentions the
+same words. Confidence is the top score divided by the best score the query
+could get (every term matched at saturation), with words the index has never
+seen counted at the highest idf, so off-topic questions stay unconfident.
+
+handle_gpt_query (through backend.utils.query_router) answers with a preset
+directly when confidence reaches RETRIEVAL_ANSWER_MIN_CONFIDENCE, and
+otherwise passes the top RETRIEVAL_TOP_K passages above
+RETRIEVAL_CONTEXT_MIN_CONFIDENCE to the model as a short reference block.
+"""
+import logging
+import math
+import os
+import re
+import time
+from array import array
+from collections import Counter, namedtuple
+
+from backend.extensions import registry
+from backend.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Policy documents (file name, title); English, but retrieved for every language
+POLICY_DOCUMENTS = (
+    ('privacy-policy.txt', 'Privacy Policy'),
+    ('terms-of-service.txt', 'Terms of Service'),
+    ('deletion-policy.txt', 'Data Deletion Policy'),
+)
+
+# Sections of presets.json holding {language: {question: answer}}
+PRESET_SECTIONS = ('faq', 'contact_queries')
+
+K1 = 1.2
+B = 0.75
+QUESTION_WEIGHT = 3
+CHUNK_WORDS = 120
+SEARCH_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+# Words that carry no meaning for matching
+STOPWORDS = frozenset(
+    'a an and are as at be by can could do does for from has have how i if in is it me my of on or should so '
+    'that the their them there this to was we what when where which who why will with you your '
+    'ada adakah apa bagaimana boleh dan di ini itu ke saya untuk yang'.split()
+)
+
+_WORD = re.compile(r'[^\W\d_]+|\d+(?:\.\d+)?')
+_NUMBERING = re.compile(r'^\s*\d+\.\s*')
+_HEADING = re.compile(r'^\s*(?:\d+\.|\d️?⃣)\s+\S')
+
+Passage = namedtuple('Passage', 'kind language title text answer')
+Hit = namedtuple('Hit', 'passage score confidence')
+
+
+def stem(word):
+    """ Strip common English inflections so refinance, refinanced and refinancing match. """
+    if len(word) > 5 and word.endswith('ing'):
+        word = word[:-3]
+    elif len(word) > 4 and word.endswith('ed'):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+    if len(word) > 4 and word.endswith('e'):
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Lowercased, stemmed words without stopwords; Chinese, which has no spaces,
+    becomes overlapping character pairs.
+    """
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if any('一' <= char <= '鿿' for char in word):
+            terms.extend(word[i:i + 2] for i in range(max(len(word) - 1, 1)))
+        elif word not in STOPWORDS:
+            terms.append(stem(word))
+    return terms
+
+
+def preset_passages(presets):
+    """ One answerable passage per preset question, per language. """
+    for section in PRESET_SECTIONS:
+        for language_code, entries in (presets.get(section) or {}).items():
+            for question, answer in entries.items():
+                question = _NUMBERING.sub('', question)
+                yield Passage('preset', language_code, question, f"{question}\n{answer}", answer)
+
+
+def policy_passages(path, title):
+    """ A policy split into its numbered sections, each cut into chunks of about CHUNK_WORDS words. """
+    with open(path, encoding='utf-8') as f:
+        paragraphs = [line.strip() for line in f if line.strip()]
+    sections, heading, body = [], title, []
+    for paragraph in paragraphs:
+        if _HEADING.match(paragraph) and len(paragraph) < 100:
+            if body:
+                sections.append((heading, body))
+            heading, body = f"{title}: {paragraph}", []
+        else:
+            body.append(paragraph)
+    if body:
+        sections.append((heading, body))
+
+    for heading, body in sections:
+        chunk, words = [], 0
+        for paragraph in body:
+            chunk.append(paragraph)
+            words += len(paragraph.split())
+            if words >= CHUNK_WORDS:
+                yield Passage('policy', None, heading, f"{heading}\n" + "\n".join(chunk), None)
+                chunk, words = [], 0
+        if chunk:
+            yield Passage('policy', None, heading, f"{heading}\n" + "\n".join(chunk), None)
+
+
+class BM25Index:
+    """ Immutable BM25 index with array-backed postings. """
+
+    def __init__(self, passages):
+        self.passages = list(passages)
+        vocabulary = {}
+        per_term = []  # term id -> [(doc id, tf)]
+        lengths = array('I')
+        for doc_id, passage in enumerate(self.passages):
+            terms = tokenize(passage.text)
+            if passage.kind == 'preset':
+                terms += tokenize(passage.title) * (QUESTION_WEIGHT - 1)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                if term_id == len(per_term):
+                    per_term.append([])
+                per_term[term_id].append((doc_id, tf))
+
+        self.vocabulary = vocabulary
+        self.offsets = array('I', [0])
+        self.doc_ids = array('I')
+        self.tfs = array('H')
+        for postings in per_term:
+            for doc_id, tf in postings:
+                self.doc_ids.append(doc_id)
+                self.tfs.append(min(tf, 0xFFFF))
+            self.offsets.append(len(self.doc_ids))
+
+        count = max(len(self.passages), 1)
+        average = (sum(lengths) / count) or 1.0
+        # Per-document BM25 length normalisation, precomputed
+        self.norms = array('d', (K1 * (1 - B + B * length / average) for length in lengths))
+        self.idf = array('d', (math.log(1 + (count - len(p) + 0.5) / (len(p) + 0.5)) for p in per_term))
+        self.max_idf = math.log(1 + (count + 0.5) / 0.5)
+        self.languages = [passage.language for passage in self.passages]
+
+    @property
+    def nbytes(self):
+        """ Size of the postings and per-document arrays. """
+        return sum(a.itemsize * len(a) for a in (self.offsets, self.doc_ids, self.tfs, self.norms, self.idf))
+
+    def search(self, text, language_code=None, k=3):
+        """
+        Top-k passages for text.
+        Args:
+            text (str): The query.
+            language_code (str): Restrict to passages in this language plus language-neutral ones.
+            k (int): Number of hits.
+        Returns:
+            list: Hit tuples, best first.
+        """
+        terms = Counter(tokenize(text))
+        if not terms:
+            return []
+        scores = {}
+        ceiling = 0.0
+        for term, query_tf in terms.items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                ceiling += self.max_idf * (K1 + 1) * query_tf
+                continue
+            idf = self.idf[term_id]
+            ceiling += idf * (K1 + 1) * query_tf
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            for doc_id, tf in zip(self.doc_ids[start:end], self.tfs[start:end]):
+                scores[doc_id] = scores.get(doc_id, 0.0) + query_tf * idf * tf * (K1 + 1) / (tf + self.norms[doc_id])
+
+        if language_code is not None:
+            languages = self.languages
+            scores = {doc_id: score for doc_id, score in scores.items()
+                      if languages[doc_id] in (language_code, None)}
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [Hit(self.passages[doc_id], score, min(score / ceiling, 1.0)) for doc_id, score in best]
+
+
+def _create_knowledge_index(config):
+    from backend.utils.presets import get_presets
+
+    started = time.perf_counter()
+    passages = list(preset_passages(get_presets()))
+    for file_name, title in POLICY_DOCUMENTS:
+        path = os.path.join(PROJECT_ROOT, file_name)
+        try:
+            passages.extend(policy_passages(path, title))
+        except OSError as e:
+            logger.warning("Policy document %s not indexed: %s", path, e)
+    index = BM25Index(passages)
+    logger.info("Indexed %d passages, %d terms (%d bytes of postings) in %.1fms", len(index.passages),
+                len(index.vocabulary), index.nbytes, (time.perf_counter() - started) * 1000)
+    return index
+
+
+registry.register('knowledge_index', _create_knowledge_index)
+
+
+def get_knowledge_index():
+    """ Return the shared BM25Index, building it on first use. """
+    return registry.get('knowledge_index')
+
+
+def retrieve(question, language_code='en', k=3):
+    """ Top-k passages for a user question, in its language or language-neutral. """
+    started = time.perf_counter()
+    hits = get_knowledge_index().search(question, language_code, k)
+    metrics.observe('retrieval_seconds', time.perf_counter() - started, SEARCH_BUCKETS)
+    return hits
+
+
+def context_block(hits, max_chars):
+    """ Reference text for the model prompt from the given hits, at most max_chars long. """
+    parts, used = [], 0
+    for hit in hits:
+        text = hit.passage.text[:max(max_chars - used, 0)]
+        if not text:
+            break
+        parts.append(text)
+        used += len(text)
+    return "\n\n".join(parts)
+
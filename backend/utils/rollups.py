@@ -0,0 +1,194 @@
+import logging
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+import pytz
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+
+from backend.extensions import db
+from backend.models import ChatflowTemp, Lead, LeadRollup
+
+logger = logging.getLogger(__name__)
+
+MYT = pytz.timezone('Asia/Kuala_Lumpur')
+
+# Upper bounds (exclusive) of each loan-amount band; anything above the last goes to '1m+'.
+LOAN_BUCKET_BOUNDS = (200000, 500000, 1000000)
+LOAN_BUCKET_LABELS = ('<200k', '200k-500k', '500k-1m', '1m+')
+SUPPORTED_LANGUAGES = ('en', 'ms', 'zh')
+COUNTER_COLUMNS = ('conversation_count', 'lead_count', 'monthly_savings_total', 'lifetime_savings_total')
+KEY_COLUMNS = ('day', 'language_code', 'loan_bucket')
+
+rollups_cli = AppGroup('rollups', help='Maintain pre-aggregated lead analytics.')
+
+
+def loan_bucket(loan_amount):
+    """ Map a loan amount to its reporting band label. """
+    return LOAN_BUCKET_LABELS[bisect_right(LOAN_BUCKET_BOUNDS, loan_amount or 0)]
+
+
+def _normalize_language(language_code):
+    return language_code if language_code in SUPPORTED_LANGUAGES else 'en'
+
+
+def _rollup_day(when=None):
+    """ Rollups are bucketed by Malaysia calendar day. """
+    when = when or datetime.now(MYT)
+    if when.tzinfo is not None:
+        when = when.astimezone(MYT)
+    return when.date()
+
+
+def _increment(day, language_code, bucket, **deltas):
+    """
+    Atomically add deltas to one rollup row, creating it if needed.
+    Runs in the caller's transaction inside a savepoint so a rollup failure
+    never takes the lead insert down with it.
+    """
+    table = LeadRollup.__table__
+    values = {column: deltas.get(column, 0) for column in COUNTER_COLUMNS}
+    values.update(day=day, language_code=language_code, loan_bucket=bucket, updated_at=datetime.now(MYT))
+
+    dialect = db.session.get_bind().dialect.name
+    try:
+        with db.session.begin_nested():
+            if dialect in ('postgresql', 'sqlite'):
+                insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                statement = insert(table).values(**values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=list(KEY_COLUMNS),
+                    set_={
+                        **{column: table.c[column] + statement.excluded[column] for column in COUNTER_COLUMNS},
+                        'updated_at': statement.excluded.updated_at,
+                    },
+                )
+                db.session.execute(statement)
+            else:
+                rollup = LeadRollup.query.filter_by(day=day, language_code=language_code, loan_bucket=bucket).first()
+                if not rollup:
+                    rollup = LeadRollup(day=day, language_code=language_code, loan_bucket=bucket,
+                                        **{column: 0 for column in COUNTER_COLUMNS})
+                    db.session.add(rollup)
+                for column in COUNTER_COLUMNS:
+                    setattr(rollup, column, getattr(rollup, column) + values[column])
+    except Exception as e:
+        logger.error("Failed to update lead rollup %s/%s/%s: %s", day, language_code, bucket, e)
+
+
+def record_conversation(language_code, loan_amount, when=None):
+    """ Count a user who entered a loan amount (the conversion denominator). """
+    _increment(_rollup_day(when), _normalize_language(language_code), loan_bucket(loan_amount),
+               conversation_count=1)
+
+
+def record_lead(language_code, loan_amount, monthly_savings, lifetime_savings, when=None):
+    """ Count a completed lead and its savings. """
+    _increment(_rollup_day(when), _normalize_language(language_code), loan_bucket(loan_amount),
+               lead_count=1,
+               monthly_savings_total=monthly_savings or 0.0,
+               lifetime_savings_total=lifetime_savings or 0.0)
+
+
+def rebuild_rollups(batch_size=1000):
+    """
+    Recompute every rollup row from Lead and ChatflowTemp.
+    ChatflowTemp keeps one row per phone number, so conversations that were
+    later restarted are counted once; incremental counts are more complete.
+    Returns:
+        int: The number of rollup rows written.
+    """
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+
+    conversations = (
+        db.session.query(ChatflowTemp.created_at, ChatflowTemp.language_code, ChatflowTemp.original_loan_amount)
+        .filter(ChatflowTemp.original_loan_amount.isnot(None))
+        .execution_options(yield_per=batch_size)
+    )
+    for created_at, language_code, loan_amount in conversations:
+        key = (_rollup_day(created_at), _normalize_language(language_code), loan_bucket(loan_amount))
+        totals[key]['conversation_count'] += 1
+
+    leads = (
+        db.session.query(Lead.created_at, ChatflowTemp.language_code, Lead.original_loan_amount,
+                         Lead.monthly_savings, Lead.total_savings)
+        .outerjoin(ChatflowTemp, ChatflowTemp.phone_number == Lead.phone_number)
+        .execution_options(yield_per=batch_size)
+    )
+    for created_at, language_code, loan_amount, monthly_savings, total_savings in leads:
+        counters = totals[(_rollup_day(created_at), _normalize_language(language_code), loan_bucket(loan_amount))]
+        counters['lead_count'] += 1
+        counters['monthly_savings_total'] += monthly_savings or 0.0
+        counters['lifetime_savings_total'] += total_savings or 0.0
+
+    now = datetime.now(MYT)
+    rows = [
+        dict(zip(KEY_COLUMNS, key), updated_at=now, **counters)
+        for key, counters in totals.items()
+    ]
+    db.session.query(LeadRollup).delete()
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(LeadRollup.__table__.insert(), rows[start:start + batch_size])
+    db.session.commit()
+    return len(rows)
+
+
+def _rate(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else 0.0
+
+
+def _average(total, count):
+    return round(total / count, 2) if count else 0.0
+
+
+def summarize_rollups(days=30, today=None):
+    """
+    Answer dashboard queries from rollups only (GET /api/admin/analytics/leads).
+    The rows read are bounded by days x languages x loan bands, independent of lead volume.
+    Returns:
+        dict: per_day, by_language and by_loan_bucket summaries.
+    """
+    end_day = today or _rollup_day()
+    start_day = end_day - timedelta(days=max(1, days) - 1)
+    rollups = (
+        db.session.query(LeadRollup.day, LeadRollup.language_code, LeadRollup.loan_bucket,
+                         LeadRollup.conversation_count, LeadRollup.lead_count,
+                         LeadRollup.monthly_savings_total, LeadRollup.lifetime_savings_total)
+        .filter(LeadRollup.day >= start_day, LeadRollup.day <= end_day)
+        .all()
+    )
+
+    per_day = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+    by_language = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+    by_bucket = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+    for row in rollups:
+        for group in (per_day[row.day], by_language[row.language_code], by_bucket[row.loan_bucket]):
+            for column in COUNTER_COLUMNS:
+                group[column] += getattr(row, column)
+
+    def _describe(counters):
+        return {
+            'conversations': counters['conversation_count'],
+            'leads': counters['lead_count'],
+            'conversion_rate': _rate(counters['lead_count'], counters['conversation_count']),
+            'avg_monthly_savings': _average(counters['monthly_savings_total'], counters['lead_count']),
+            'avg_lifetime_savings': _average(counters['lifetime_savings_total'], counters['lead_count']),
+        }
+
+    return {
+        'start_day': start_day.isoformat(),
+        'end_day': end_day.isoformat(),
+        'per_day': [dict(day=day.isoformat(), **_describe(per_day[day])) for day in sorted(per_day)],
+        'by_language': {language: _describe(counters) for language, counters in sorted(by_language.items())},
+        'by_loan_bucket': {bucket: _describe(by_bucket[bucket]) for bucket in LOAN_BUCKET_LABELS if bucket in by_bucket},
+    }
+
+
+@rollups_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched/inserted per batch.')
+def rebuild_command(batch_size):
+    """ Drop and recompute all lead rollups from source tables. """
+    written = rebuild_rollups(batch_size=batch_size)
+    click.echo(f"Rebuilt {written} rollup rows.")
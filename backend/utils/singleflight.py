@@ -0,0 +1,148 @@
+"""
+Singleflight: identical concurrent calls share one execution.
+
+During broadcast campaigns many users ask the same question within seconds.
+coalesce(name, key_parts, fn) makes sure only one of them runs fn (the OpenAI
+call) while the others wait for and share its result:
+
+    in-process    the first caller for a key is the leader; threads arriving
+                  while it runs wait on an Event and get the same result or
+                  exception
+    cross-worker  with Redis configured, the process leader takes a lock key
+                  (SET NX PX). Leaders in other workers that lose the race poll
+                  for the winner's result, which is stored for
+                  SINGLEFLIGHT_RESULT_TTL seconds (so it also answers identical
+                  questions arriving just after the call finished)
+
+Waiting is bounded by SINGLEFLIGHT_WAIT_SECONDS. If the remote leader dies or
+times out, or Redis misbehaves, the caller simply runs fn itself, so
+coalescing can delay an answer but never lose one. Results shared across
+workers must be JSON-serializable.
+
+singleflight_calls_total{call, role} counts leaders, in-process followers and
+remote followers; followers are the upstream calls saved.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+
+from backend.extensions import get_redis, registry
+from backend.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'finzo:singleflight'
+
+# Delete the lock only if we still own it
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def normalize_text(text):
+    """ Case- and punctuation-insensitive form of a question; keeps non-Latin scripts intact. """
+    return re.sub(r'[\W_]+', ' ', (text or '').casefold()).strip()
+
+
+def _digest(name, key_parts):
+    raw = json.dumps([name, *key_parts], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def coalesce(name, key_parts, fn):
+    """
+    Run fn() once for all concurrent callers with the same name and key_parts.
+    Args:
+        name (str): What is being coalesced, used in Redis keys and metrics (e.g. 'openai_answer').
+        key_parts (tuple): JSON-serializable parts identifying identical calls.
+        fn (callable): The expensive call; its result is returned to every caller.
+    Returns:
+        The result of fn(), computed by this caller or shared by another.
+    """
+    config = registry.config
+    wait_seconds = float(config.get('SINGLEFLIGHT_WAIT_SECONDS', 20))
+    key = _digest(name, key_parts)
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        metrics.inc('singleflight_calls_total', call=name, role='follower')
+        if call.done.wait(wait_seconds):
+            if call.error is not None:
+                raise call.error
+            return call.value
+        logger.warning("Singleflight %s: leader still running after %ss, calling directly", name, wait_seconds)
+        return fn()
+
+    try:
+        call.value = _run_across_workers(name, key, fn, config, wait_seconds)
+        return call.value
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+def _run_across_workers(name, key, fn, config, wait_seconds):
+    client = get_redis()
+    if client is None:
+        metrics.inc('singleflight_calls_total', call=name, role='leader')
+        return fn()
+
+    result_key = f'{REDIS_KEY_PREFIX}:{name}:{key}:result'
+    lock_key = f'{REDIS_KEY_PREFIX}:{name}:{key}:lock'
+    result_ttl_ms = int(float(config.get('SINGLEFLIGHT_RESULT_TTL', 5)) * 1000)
+    poll_seconds = float(config.get('SINGLEFLIGHT_POLL_MS', 50)) / 1000
+    token = uuid.uuid4().hex
+    try:
+        shared = client.get(result_key)
+        if shared is None and not client.set(lock_key, token, nx=True, px=int(wait_seconds * 1000)):
+            deadline = time.monotonic() + wait_seconds
+            while shared is None and time.monotonic() < deadline:
+                time.sleep(poll_seconds)
+                shared = client.get(result_key)
+                if shared is None and not client.exists(lock_key):
+                    shared = client.get(result_key)  # The leader may have finished between the two reads
+                    break
+        if shared is not None:
+            metrics.inc('singleflight_calls_total', call=name, role='remote_follower')
+            return json.loads(shared)
+    except Exception as e:
+        logger.warning("Singleflight %s: Redis unavailable, calling directly: %s", name, e)
+        metrics.inc('singleflight_calls_total', call=name, role='leader')
+        return fn()
+
+    metrics.inc('singleflight_calls_total', call=name, role='leader')
+    try:
+        value = fn()
+        try:
+            client.set(result_key, json.dumps(value), px=max(result_ttl_ms, 1))
+        except Exception as e:
+            logger.warning("Singleflight %s: could not share result: %s", name, e)
+        return value
+    finally:
+        try:
+            client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+        except Exception:
+            pass
@@ -0,0 +1,186 @@
+"""
+Per-request SQL auditing: counts, timing, commits, repeats and N+1 patterns.
+
+Every statement executed while a request is active is recorded via
+SQLAlchemy cursor events into a per-request RequestAudit:
+
+    queries   statements executed
+    seconds   time spent in the driver
+    commits   COMMITs issued (each one is a round trip and an fsync)
+    repeated  statements re-run with identical parameters (pure waste)
+    n_plus_one  statements run SQL_N_PLUS_ONE_THRESHOLD+ times with different parameters
+
+The numbers go to metrics on every request (histograms labelled by
+endpoint), to X-SQL-* response headers when SQL_AUDIT_HEADERS is set, and are checked
+against per-route budgets. Budgets come from @query_budget on the view or
+SQL_QUERY_BUDGETS in config. Over budget is a warning in production and an
+exception when SQL_AUDIT_STRICT is set (the testing config), so a route that
+regresses fails loudly.
+"""
+import logging
+import time
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+
+from backend.logging_config import parse_mapping
+from backend.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+COMMIT_BUCKETS = (0, 1, 2, 3, 5, 8)
+MAX_REPORTED_STATEMENT = 200
+
+_current_audit = ContextVar('finzo_sql_audit', default=None)
+_audited_engines = weakref.WeakSet()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """ A request ran more SQL statements or commits than its route allows (SQL_AUDIT_STRICT). """
+
+
+class RequestAudit:
+    __slots__ = ('queries', 'seconds', 'commits', 'executions', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.commits = 0
+        self.executions = Counter()  # (statement, parameters) -> count
+        self.statements = Counter()  # statement -> count
+
+    def record(self, statement, parameters, elapsed):
+        self.queries += 1
+        self.seconds += elapsed
+        self.statements[statement] += 1
+        try:
+            self.executions[(statement, repr(parameters))] += 1
+        except Exception:
+            pass
+
+    @property
+    def repeated(self):
+        """ Number of executions that exactly repeated an earlier statement and parameters. """
+        return sum(count - 1 for count in self.executions.values() if count > 1)
+
+    def repeated_statements(self):
+        return [(statement[:MAX_REPORTED_STATEMENT], count)
+                for (statement, _), count in self.executions.most_common() if count > 1]
+
+    def n_plus_one(self, threshold):
+        return [(statement[:MAX_REPORTED_STATEMENT], count)
+                for statement, count in self.statements.most_common() if count >= threshold]
+
+
+def current_audit():
+    return _current_audit.get()
+
+
+def query_budget(max_queries, max_commits=None):
+    """ Declare the SQL budget of a view function; checked by the audit after each request. """
+    def decorator(fn):
+        fn._sql_budget = (max_queries, max_commits)
+        return fn
+    return decorator
+
+
+def instrument_engine(engine):
+    """ Record every statement and commit on engine into the active request's audit. """
+    from sqlalchemy import event
+
+    if engine in _audited_engines:
+        return
+    _audited_engines.add(engine)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current_audit.get() is not None:
+            conn.info['_sql_audit_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        audit = _current_audit.get()
+        started = conn.info.pop('_sql_audit_started', None)
+        if audit is not None and started is not None:
+            audit.record(statement, parameters, time.perf_counter() - started)
+
+    @event.listens_for(engine, 'commit')
+    def _commit(conn):
+        audit = _current_audit.get()
+        if audit is not None:
+            audit.commits += 1
+
+
+def _budget_for(app, endpoint, budgets):
+    if endpoint in budgets:
+        return int(budgets[endpoint]), None
+    view = app.view_functions.get(endpoint)
+    return getattr(view, '_sql_budget', (None, None))
+
+
+def init_sql_audit(app):
+    """ Install the per-request SQL audit on app (no-op when SQL_AUDIT_ENABLED is false). """
+    if not app.config.get('SQL_AUDIT_ENABLED', True):
+        return
+    from flask import g, request
+
+    from backend.extensions import db
+
+    with app.app_context():
+        instrument_engine(db.engine)
+
+    budgets = parse_mapping(app.config.get('SQL_QUERY_BUDGETS'))
+    strict = bool(app.config.get('SQL_AUDIT_STRICT', False))
+    headers = bool(app.config.get('SQL_AUDIT_HEADERS', False))
+    threshold = int(app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+
+    @app.before_request
+    def _start_sql_audit():
+        g._sql_audit_token = _current_audit.set(RequestAudit())
+
+    @app.after_request
+    def _finish_sql_audit(response):
+        audit = _current_audit.get()
+        if audit is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        repeated = audit.repeated
+        suspects = audit.n_plus_one(threshold)
+
+        metrics.observe('sql_queries_per_request', audit.queries, QUERY_BUCKETS, endpoint=endpoint)
+        metrics.observe('sql_seconds_per_request', audit.seconds, endpoint=endpoint)
+        metrics.observe('sql_commits_per_request', audit.commits, COMMIT_BUCKETS, endpoint=endpoint)
+        if repeated:
+            metrics.inc('sql_repeated_queries_total', repeated, endpoint=endpoint)
+            logger.info("Repeated identical SQL in %s", endpoint, extra={
+                'sql_repeated': audit.repeated_statements()[:3], 'sample_rate': 0.1})
+        if suspects:
+            metrics.inc('sql_n_plus_one_total', endpoint=endpoint)
+            logger.info("Possible N+1 in %s", endpoint, extra={'sql_n_plus_one': suspects[:3], 'sample_rate': 0.1})
+
+        if headers:
+            response.headers['X-SQL-Queries'] = str(audit.queries)
+            response.headers['X-SQL-Time-ms'] = f'{audit.seconds * 1000:.2f}'
+            response.headers['X-SQL-Commits'] = str(audit.commits)
+            response.headers['X-SQL-Repeated'] = str(repeated)
+
+        max_queries, max_commits = _budget_for(app, endpoint, budgets)
+        over = []
+        if max_queries is not None and audit.queries > max_queries:
+            over.append(f"{audit.queries} queries > budget {max_queries}")
+        if max_commits is not None and audit.commits > max_commits:
+            over.append(f"{audit.commits} commits > budget {max_commits}")
+        if over:
+            metrics.inc('sql_budget_exceeded_total', endpoint=endpoint)
+            message = f"SQL budget exceeded in {endpoint}: {', '.join(over)}"
+            if strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'sql_repeated': audit.repeated_statements()[:3]})
+        return response
+
+    @app.teardown_request
+    def _reset_sql_audit(error=None):
+        token = g.pop('_sql_audit_token', None)
+        if token is not None:
+            _current_audit.reset(token)
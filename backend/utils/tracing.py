@@ -0,0 +1,328 @@
+"""
+Lightweight request tracing with OTLP/JSON export.
+
+A root span is opened per HTTP request and child spans are created by
+@traced functions and by the SQLAlchemy / requests auto-instrumentation.
+The active span is held in a contextvar so nesting follows the call stack.
+
+Sampling is head-based (TRACE_SAMPLE_RATE) with a tail override: a trace
+whose root span runs longer than TRACE_SLOW_MS is always exported, so slow
+outliers are never sampled away. Finished traces are handed to a background
+thread that appends OTLP/JSON lines to TRACE_EXPORT_PATH and/or POSTs them
+to an OTLP/HTTP collector at TRACE_OTLP_ENDPOINT. Tracing is off unless one
+of those destinations is set in the app config (read by init_tracing).
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Defaults; init_tracing overrides them from the app config.
+SERVICE_NAME = 'finzo-chatbot'
+EXPORT_PATH = None
+OTLP_ENDPOINT = None
+SAMPLE_RATE = 0.1
+SLOW_MS = 2000.0
+ENABLED = False
+
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+MAX_STATEMENT_LENGTH = 300
+
+_current_span = ContextVar('finzo_current_span', default=None)
+_export_queue = queue.Queue(maxsize=1000)
+_exporter_thread = None
+_exporter_pid = None
+_instrumented_engines = weakref.WeakSet()
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes', 'status', 'message')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = STATUS_UNSET
+        self.message = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.status = STATUS_ERROR
+        self.message = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    __slots__ = ('trace_id', 'sampled', 'spans')
+
+    def __init__(self, sampled):
+        self.trace_id = '%032x' % random.getrandbits(128)
+        self.sampled = sampled
+        self.spans = []
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name, **attributes):
+    """
+    Open a span as a child of the current one (or a new trace root) and make it current.
+    Returns (span, token); pass both to finish_span. Returns (None, None) when tracing is off.
+    """
+    if not ENABLED:
+        return None, None
+    parent = _current_span.get()
+    if parent is _SUPPRESSED:
+        return None, None
+    if parent is None:
+        span = Span(Trace(sampled=random.random() < SAMPLE_RATE), name, attributes=attributes)
+    else:
+        span = Span(parent.trace, name, parent_id=parent.span_id, attributes=attributes)
+    return span, _current_span.set(span)
+
+
+def finish_span(span, token, error=None):
+    """ Close a span opened by start_span and export the trace when its root ends. """
+    if span is None:
+        return
+    if error is not None:
+        span.set_error(error)
+    span.end()
+    _current_span.reset(token)
+    if span.parent_id is None and (span.trace.sampled or span.duration_ms >= SLOW_MS):
+        _enqueue(span.trace)
+
+
+@contextmanager
+def span(name, **attributes):
+    """ Context manager form of start_span/finish_span. """
+    active, token = start_span(name, **attributes)
+    try:
+        yield active
+    except Exception as e:
+        finish_span(active, token, error=e)
+        raise
+    else:
+        finish_span(active, token)
+
+
+def traced(name=None):
+    """ Decorator that wraps each call of the function in a span. """
+    def decorator(fn):
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(trace):
+    """ Encode a finished trace as an OTLP/JSON ExportTraceServiceRequest. """
+    spans = []
+    for item in trace.spans:
+        encoded = {
+            'traceId': trace.trace_id,
+            'spanId': item.span_id,
+            'name': item.name,
+            'kind': 2 if item.parent_id is None else 1,  # SERVER for roots, INTERNAL otherwise
+            'startTimeUnixNano': str(item.start_ns),
+            'endTimeUnixNano': str(item.end_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in item.attributes.items()],
+            'status': {'code': item.status, **({'message': item.message} if item.message else {})},
+        }
+        if item.parent_id:
+            encoded['parentSpanId'] = item.parent_id
+        spans.append(encoded)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+        }]
+    }
+
+
+def _export(trace):
+    payload = to_otlp(trace)
+    if EXPORT_PATH:
+        with open(EXPORT_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(payload, separators=(',', ':')) + '\n')
+    if OTLP_ENDPOINT:
+        import requests
+        # Suppress instrumentation so exporting doesn't trace itself.
+        token = _current_span.set(_SUPPRESSED)
+        try:
+            requests.post(OTLP_ENDPOINT, json=payload, timeout=2)
+        finally:
+            _current_span.reset(token)
+
+
+def _exporter_loop():
+    while True:
+        trace = _export_queue.get()
+        if trace is None:
+            return
+        try:
+            _export(trace)
+        except Exception as e:
+            logger.warning("Trace export failed: %s", e)
+
+
+def _enqueue(trace):
+    global _exporter_thread, _exporter_pid
+    # Threads don't survive fork, so (re)start the exporter lazily in each worker.
+    if _exporter_pid != os.getpid() or _exporter_thread is None or not _exporter_thread.is_alive():
+        _exporter_pid = os.getpid()
+        _exporter_thread = threading.Thread(target=_exporter_loop, name='trace-exporter', daemon=True)
+        _exporter_thread.start()
+    try:
+        _export_queue.put_nowait(trace)
+    except queue.Full:
+        logger.warning("Trace export queue full; dropping trace %s", trace.trace_id)
+
+
+def flush(timeout=2.0):
+    """ Wait briefly for queued traces to be written (used at exit and by benchmarks). """
+    deadline = time.monotonic() + timeout
+    while not _export_queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+# A sentinel "current span" that stops auto-instrumentation from recording.
+_SUPPRESSED = object()
+
+
+def _instrumented_parent():
+    parent = _current_span.get()
+    return parent if parent is not None and parent is not _SUPPRESSED else None
+
+
+def instrument_sqlalchemy(engine):
+    """ Record a span for every SQL statement executed on engine. """
+    from sqlalchemy import event
+
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _instrumented_parent() is None:
+            return
+        active, token = start_span('db.query', **{
+            'db.system': engine.dialect.name,
+            'db.statement': statement[:MAX_STATEMENT_LENGTH],
+        })
+        conn.info.setdefault('_finzo_spans', []).append((active, token))
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get('_finzo_spans')
+        if stack:
+            active, token = stack.pop()
+            active.set_attribute('db.rows', cursor.rowcount)
+            finish_span(active, token)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(exception_context):
+        connection = exception_context.connection
+        stack = connection.info.get('_finzo_spans') if connection is not None else None
+        if stack:
+            active, token = stack.pop()
+            finish_span(active, token, error=exception_context.original_exception)
+
+
+def instrument_requests():
+    """ Record a span for every outbound HTTP call made through requests (WhatsApp and OpenAI). """
+    import requests
+
+    original_send = requests.Session.send
+    if getattr(original_send, '_finzo_traced', False):
+        return
+
+    @functools.wraps(original_send)
+    def send(self, request, **kwargs):
+        if _instrumented_parent() is None:
+            return original_send(self, request, **kwargs)
+        url = request.url.split('?', 1)[0]
+        with span(f"HTTP {request.method} {url.split('/')[2] if '://' in url else url}",
+                  **{'http.method': request.method, 'http.url': url}) as active:
+            response = original_send(self, request, **kwargs)
+            active.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                active.status = STATUS_ERROR
+            return response
+
+    send._finzo_traced = True
+    requests.Session.send = send
+
+
+def init_tracing(app):
+    """ Configure tracing from app.config and install request spans and auto-instrumentation. """
+    global SERVICE_NAME, EXPORT_PATH, OTLP_ENDPOINT, SAMPLE_RATE, SLOW_MS, ENABLED
+    SERVICE_NAME = app.config.get('TRACE_SERVICE_NAME', SERVICE_NAME)
+    EXPORT_PATH = app.config.get('TRACE_EXPORT_PATH')
+    OTLP_ENDPOINT = app.config.get('TRACE_OTLP_ENDPOINT')
+    SAMPLE_RATE = float(app.config.get('TRACE_SAMPLE_RATE', SAMPLE_RATE))
+    SLOW_MS = float(app.config.get('TRACE_SLOW_MS', SLOW_MS))
+    ENABLED = bool(EXPORT_PATH or OTLP_ENDPOINT)
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    from backend.extensions import db
+
+    with app.app_context():
+        instrument_sqlalchemy(db.engine)
+    instrument_requests()
+
+    @app.before_request
+    def _start_request_span():
+        g._trace_span = start_span(f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+                                   **{'http.method': request.method, 'http.route': request.path})
+
+    @app.teardown_request
+    def _finish_request_span(error=None):
+        active, token = g.pop('_trace_span', (None, None))
+        finish_span(active, token, error=error)
+
+    atexit.register(flush)
+    logger.info("Tracing enabled (sample rate %s, slow threshold %sms)", SAMPLE_RATE, SLOW_MS)
@@ -0,0 +1,227 @@
+"""
+Capture of production webhook traffic for replay (benchmarks/replay.py).
+
+With TRAFFIC_CAPTURE_DIR set, every POST /webhook is recorded after its
+response: arrival time, how long the app took, the status code and the raw
+payload. Phone numbers are pseudonymized first. They are replaced by HMAC
+digits keyed by TRAFFIC_CAPTURE_SALT, so the same user keeps the same
+pseudonym and conversations replay intact, but the real number cannot be
+recovered from the log. The salt must be a dedicated secret: capture stays
+off without it. Profile names are dropped, and long digit runs in
+message text (phone or IC numbers typed by users) are pseudonymized the same
+way. Everything else is kept byte for byte, typos and all.
+
+Records are msgspec Structs encoded as msgpack arrays and framed with a
+4-byte length. They are written by a background thread, so the request
+path only pays for pseudonymization and a queue put. Each worker writes its
+own file, capture-<pid>-<start>.msgpack:
+- A file is closed once it reaches TRAFFIC_CAPTURE_MAX_FILE_MB.
+- Files beyond TRAFFIC_CAPTURE_MAX_FILES are deleted, oldest first.
+
+read_capture() merges a directory back into arrival order.
+TRAFFIC_CAPTURE_SAMPLE_RATE records only a fraction of requests.
+"""
+import atexit
+import glob
+import hashlib
+import heapq
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import re
+import struct
+import threading
+import time
+
+import msgspec
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b'FZCAP1\n'
+FILE_PATTERN = 'capture-*.msgpack'
+_FRAME = struct.Struct('>I')
+_LONG_DIGITS = re.compile(r'\d{9,}')
+
+
+class CapturedRequest(msgspec.Struct, array_like=True):
+    """ One recorded webhook call. """
+    ts: float  # Arrival, seconds since the epoch
+    duration_ms: float  # Time the app took to answer
+    status: int
+    path: str
+    body: bytes  # Pseudonymized JSON payload
+
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(CapturedRequest)
+
+# Defaults; init_traffic_capture overrides them from the app config.
+CAPTURE_DIR = None
+SAMPLE_RATE = 1.0
+MAX_FILE_BYTES = 64 * 1024 * 1024
+MAX_FILES = 20
+_salt = b''
+
+_write_queue = queue.Queue(maxsize=10000)
+_writer_thread = None
+_writer_pid = None
+
+
+def pseudonymize_number(number):
+    """ Stable stand-in for a phone number: same length, Malaysian prefix, digits from an HMAC. """
+    digest = hmac.new(_salt, number.encode('utf-8'), hashlib.sha256).hexdigest()
+    digits = str(int(digest, 16))
+    return ('60' + digits)[:max(len(number), 10)]
+
+
+def pseudonymize_payload(data):
+    """ Copy of a WhatsApp webhook payload with phone numbers replaced and profile names dropped. """
+    data = json.loads(json.dumps(data))
+    for entry in data.get('entry', []) or []:
+        for change in entry.get('changes', []) or []:
+            value = change.get('value') or {}
+            for contact in value.get('contacts', []) or []:
+                if contact.get('wa_id'):
+                    contact['wa_id'] = pseudonymize_number(str(contact['wa_id']))
+                if isinstance(contact.get('profile'), dict):
+                    contact['profile']['name'] = 'Captured User'
+            for message in value.get('messages', []) or []:
+                if message.get('from'):
+                    message['from'] = pseudonymize_number(str(message['from']))
+                text = message.get('text')
+                if isinstance(text, dict) and isinstance(text.get('body'), str):
+                    text['body'] = _LONG_DIGITS.sub(lambda match: pseudonymize_number(match.group()), text['body'])
+    return data
+
+
+def _writer_loop():
+    handle, written = None, 0
+    try:
+        while True:
+            record = _write_queue.get()
+            if record is None:
+                return
+            try:
+                if handle is None or written >= MAX_FILE_BYTES:
+                    if handle is not None:
+                        handle.close()
+                    handle, written = _open_capture_file(), len(FILE_MAGIC)
+                payload = _encoder.encode(record)
+                handle.write(_FRAME.pack(len(payload)) + payload)
+                handle.flush()
+                written += _FRAME.size + len(payload)
+            except Exception as e:
+                logger.warning("Traffic capture write failed: %s", e)
+            finally:
+                _write_queue.task_done()
+    finally:
+        if handle is not None:
+            handle.close()
+
+
+def _open_capture_file():
+    os.makedirs(CAPTURE_DIR, exist_ok=True)
+    existing = sorted(glob.glob(os.path.join(CAPTURE_DIR, FILE_PATTERN)), key=os.path.getmtime)
+    for stale in existing[:max(len(existing) - MAX_FILES + 1, 0)]:
+        os.remove(stale)
+    path = os.path.join(CAPTURE_DIR, f'capture-{os.getpid()}-{time.time_ns()}.msgpack')
+    handle = open(path, 'ab')
+    handle.write(FILE_MAGIC)
+    logger.info("Capturing webhook traffic to %s", path)
+    return handle
+
+
+def record(ts, duration_ms, status, path, data):
+    """ Queue one webhook call for writing; drops it (with a warning) if the writer falls behind. """
+    global _writer_thread, _writer_pid
+    # Threads don't survive fork, so (re)start the writer lazily in each worker.
+    if _writer_pid != os.getpid() or _writer_thread is None or not _writer_thread.is_alive():
+        _writer_pid = os.getpid()
+        _writer_thread = threading.Thread(target=_writer_loop, name='traffic-capture', daemon=True)
+        _writer_thread.start()
+    body = json.dumps(pseudonymize_payload(data), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    try:
+        _write_queue.put_nowait(CapturedRequest(ts, duration_ms, status, path, body))
+    except queue.Full:
+        logger.warning("Traffic capture queue full; dropping a request")
+
+
+def flush(timeout=2.0):
+    """ Wait briefly for queued records to be written (used at exit and by benchmarks). """
+    deadline = time.monotonic() + timeout
+    while _write_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def read_file(path):
+    """ Yield the CapturedRequest records of one capture file; a truncated last record is ignored. """
+    with open(path, 'rb') as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a traffic capture file")
+        while True:
+            header = f.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                return
+            payload = f.read(_FRAME.unpack(header)[0])
+            try:
+                yield _decoder.decode(payload)
+            except msgspec.DecodeError:
+                return
+
+
+def read_capture(path):
+    """
+    Iterate over captured webhook calls in arrival order.
+    Args:
+        path (str): A capture file, or a directory of them (all workers' files are merged).
+    Returns:
+        iterator: CapturedRequest records sorted by ts.
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, FILE_PATTERN)))
+    else:
+        files = [path]
+    return heapq.merge(*(read_file(name) for name in files), key=lambda captured: captured.ts)
+
+
+def init_traffic_capture(app):
+    """ Record POST /webhook calls when TRAFFIC_CAPTURE_DIR and TRAFFIC_CAPTURE_SALT are set. """
+    global CAPTURE_DIR, SAMPLE_RATE, MAX_FILE_BYTES, MAX_FILES, _salt
+    CAPTURE_DIR = app.config.get('TRAFFIC_CAPTURE_DIR')
+    if not CAPTURE_DIR:
+        return
+    salt = app.config.get('TRAFFIC_CAPTURE_SALT')
+    if not salt:
+        # Malaysian numbers are few enough to brute-force, so a guessable key would make the pseudonyms reversible
+        logger.error("Traffic capture disabled: TRAFFIC_CAPTURE_DIR is set but TRAFFIC_CAPTURE_SALT is not")
+        CAPTURE_DIR = None
+        return
+    SAMPLE_RATE = float(app.config.get('TRAFFIC_CAPTURE_SAMPLE_RATE', SAMPLE_RATE))
+    MAX_FILE_BYTES = int(float(app.config.get('TRAFFIC_CAPTURE_MAX_FILE_MB', 64)) * 1024 * 1024)
+    MAX_FILES = max(int(app.config.get('TRAFFIC_CAPTURE_MAX_FILES', MAX_FILES)), 1)
+    _salt = salt.encode('utf-8')
+    from flask import g, request
+
+    @app.before_request
+    def _start_capture():
+        if request.method == 'POST' and request.endpoint == 'webhook' and random.random() < SAMPLE_RATE:
+            g._capture_started = (time.time(), time.perf_counter())
+
+    @app.after_request
+    def _finish_capture(response):
+        started = g.pop('_capture_started', None)
+        if started is not None:
+            try:
+                data = request.get_json(silent=True)
+                if isinstance(data, dict):
+                    record(started[0], (time.perf_counter() - started[1]) * 1000, response.status_code,
+                           request.path, data)
+            except Exception as e:
+                logger.warning("Traffic capture failed: %s", e)
+        return response
+
+    atexit.register(flush)
+    logger.info("Traffic capture enabled in %s (sample rate %s)", CAPTURE_DIR, SAMPLE_RATE)
@@ -0,0 +1,89 @@
+"""
+Unit of work for message processing: one transaction, one commit per message.
+
+Everything a message changes (chatflow state, users, leads, chat logs,
+rollups) is added to the session while the message is handled, then
+committed exactly once when the unit of work exits. Side effects that must
+not happen unless the data is saved (outbound WhatsApp messages, admin
+notifications, funnel metrics) are queued with defer() and run only after
+the commit succeeds. On any exception the transaction is rolled back and the
+queued side effects are dropped, so the user never hears about state that
+wasn't persisted. Replies queued with backend.utils.outbox.queue_message()
+are sent the same way, coalesced per recipient.
+
+    with unit_of_work():
+        user_data.current_step = 'get_name'
+        defer(send_whatsapp_message, phone_number, prompt)
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from backend.extensions import db
+
+logger = logging.getLogger(__name__)
+
+_current_uow = ContextVar('finzo_unit_of_work', default=None)
+
+
+class UnitOfWork:
+    __slots__ = ('session', '_after_commit', 'outbox')
+
+    def __init__(self, session):
+        self.session = session
+        self._after_commit = []
+        self.outbox = None  # backend.utils.outbox.Outbox, created by the first queued reply
+
+    def after_commit(self, fn, *args, **kwargs):
+        """ Queue fn(*args, **kwargs) to run once this unit of work has committed. """
+        self._after_commit.append((fn, args, kwargs))
+
+    def discard(self):
+        self._after_commit.clear()
+        self.outbox = None
+
+    def run_after_commit(self):
+        """ Run queued side effects in order; one failing never stops the rest. """
+        callbacks, self._after_commit = self._after_commit, []
+        for fn, args, kwargs in callbacks:
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.exception("After-commit action %s failed: %s", getattr(fn, '__name__', fn), e)
+
+
+def current_unit_of_work():
+    return _current_uow.get()
+
+
+@contextmanager
+def unit_of_work(session=None):
+    """
+    Commit everything done inside the block in a single transaction.
+    Nested calls join the outermost unit of work instead of committing early.
+    """
+    outer = _current_uow.get()
+    if outer is not None:
+        yield outer
+        return
+
+    uow = UnitOfWork(session or db.session)
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+        uow.session.commit()
+    except BaseException:
+        uow.discard()
+        uow.session.rollback()
+        raise
+    finally:
+        _current_uow.reset(token)
+    uow.run_after_commit()
+
+
+def defer(fn, *args, **kwargs):
+    """ Run fn after the current unit of work commits, or immediately when there is none. """
+    uow = _current_uow.get()
+    if uow is None:
+        return fn(*args, **kwargs)
+    uow.after_commit(fn, *args, **kwargs)
@@ -1,35 +1,70 @@
-import os
+import atexit
 import logging
+import os
+import queue
+import threading
+import time
+
 import requests
 
+from backend.extensions import registry
+from backend.utils.tracing import traced
+
 # Configure logging for this module
 logger = logging.getLogger(__name__)
 
-# Load WhatsApp API credentials from environment variables
-WHATSAPP_API_URL = os.getenv('WHATSAPP_API_URL')
-WHATSAPP_API_TOKEN = os.getenv('WHATSAPP_API_TOKEN')
-WHATSAPP_PHONE_NUMBER_ID = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
-ADMIN_WHATSAPP_NUMBERS = [num.strip() for num in os.getenv('ADMIN_WHATSAPP_NUMBERS', '').split(',') if num.strip()]
-
-# Validate environment variables
-missing_vars = []
-if not WHATSAPP_API_URL:
-    missing_vars.append("WHATSAPP_API_URL")
-if not WHATSAPP_API_TOKEN:
-    missing_vars.append("WHATSAPP_API_TOKEN")
-if not WHATSAPP_PHONE_NUMBER_ID:
-    missing_vars.append("WHATSAPP_PHONE_NUMBER_ID")
-
-if missing_vars:
-    raise EnvironmentError(f"❌ Missing essential WhatsApp API credentials: {', '.join(missing_vars)}. Please check your environment variables.")
-
-def get_headers() -> dict:
+REQUEST_TIMEOUT = 10  # seconds
+
+# Messages sent by a background thread, off the request path (admin notifications)
+_background_queue = queue.Queue(maxsize=1000)
+_background_thread = None
+_background_pid = None
+
+
+class WhatsAppClient:
+    """ WhatsApp Graph API credentials plus a keep-alive HTTP session, built on first use. """
+
+    def __init__(self, api_url, api_token, phone_number_id, admin_numbers):
+        self.api_url = api_url
+        self.api_token = api_token
+        self.phone_number_id = phone_number_id
+        self.admin_numbers = admin_numbers
+        self.session = requests.Session()
+        self.session.headers.update(get_headers(api_token))
+
+
+def _create_whatsapp_client(config):
+    """ Validate WhatsApp credentials lazily so importing this module never fails. """
+    missing_vars = [key for key in ('WHATSAPP_API_URL', 'WHATSAPP_API_TOKEN', 'WHATSAPP_PHONE_NUMBER_ID')
+                    if not config.get(key)]
+    if missing_vars:
+        raise EnvironmentError(f"❌ Missing essential WhatsApp API credentials: {', '.join(missing_vars)}. Please check your environment variables.")
+
+    admin_numbers = [num.strip() for num in (config.get('ADMIN_WHATSAPP_NUMBERS') or '').split(',') if num.strip()]
+    return WhatsAppClient(
+        config['WHATSAPP_API_URL'],
+        config['WHATSAPP_API_TOKEN'],
+        config['WHATSAPP_PHONE_NUMBER_ID'],
+        admin_numbers
+    )
+
+
+registry.register('whatsapp', _create_whatsapp_client)
+
+
+def get_whatsapp_client() -> WhatsAppClient:
+    return registry.get('whatsapp')
+
+
+def get_headers(api_token: str = None) -> dict:
     return {
-        'Authorization': f'Bearer {WHATSAPP_API_TOKEN}',
+        'Authorization': f'Bearer {api_token or get_whatsapp_client().api_token}',
         'Content-Type': 'application/json'
     }
 
+@traced()
 def send_whatsapp_message(to_number: str, message: str) -> dict:
+    client = get_whatsapp_client()  # Raises EnvironmentError when credentials are missing
     try:
         payload = {
             "messaging_product": "whatsapp",
@@ -38,22 +73,59 @@ def send_whatsapp_message(to_number: str, message: str) -> dict:
             "text": {"body": message}
         }
         
-        response = requests.post(WHATSAPP_API_URL, headers=get_headers(), json=payload)
+        response = client.session.post(client.api_url, json=payload, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
 
         response_data = response.json()
-        logger.info(f"✅ Message sent successfully to {to_number}. Response: {response_data}")
+        logger.info("Message sent to %s", to_number, extra={'wa_message_ids': [m.get('id') for m in response_data.get('messages', [])]})
         return {"status": "success", "response": response_data}
     
     except requests.exceptions.HTTPError as e:
-        logger.error(f"❌ HTTPError: {e.response.status_code} - {e.response.text}")
+        logger.error("WhatsApp HTTPError %s for %s: %s", e.response.status_code, to_number, e.response.text)
         return {"status": "failed", "error": f"HTTPError: {e.response.status_code}"}
     
     except Exception as e:
-        logger.error(f"❌ An unexpected error occurred while sending message to {to_number}: {str(e)}")
+        logger.error("Unexpected error while sending message to %s: %s", to_number, e)
         return {"status": "failed", "error": str(e)}
 
+
+def _background_sender():
+    while True:
+        to_number, message = _background_queue.get()
+        try:
+            send_whatsapp_message(to_number, message)
+        except Exception as e:  # Missing credentials and the like
+            logger.error("Background message to %s failed: %s", to_number, e)
+        finally:
+            _background_queue.task_done()
+
+
+def flush_background(timeout: float = 5.0) -> None:
+    """ Wait briefly for queued background messages to go out (at exit). """
+    deadline = time.monotonic() + timeout
+    while _background_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def send_in_background(to_number: str, message: str) -> None:
+    """ Queue a message for the background sender; sends inline if the queue is full. """
+    global _background_thread, _background_pid
+    # Threads don't survive fork, so (re)start the sender lazily in each worker
+    if _background_pid != os.getpid() or _background_thread is None or not _background_thread.is_alive():
+        if _background_pid is None:
+            atexit.register(flush_background)
+        _background_pid = os.getpid()
+        _background_thread = threading.Thread(target=_background_sender, name='whatsapp-background', daemon=True)
+        _background_thread.start()
+    try:
+        _background_queue.put_nowait((to_number, message))
+    except queue.Full:
+        logger.warning("Background send queue full; sending to %s inline", to_number)
+        send_whatsapp_message(to_number, message)
+
+
 def send_message_to_admin(message: str) -> None:
-    for admin_number in ADMIN_WHATSAPP_NUMBERS:
+    """ Notify every ADMIN_WHATSAPP_NUMBERS recipient without waiting for the sends. """
+    for admin_number in get_whatsapp_client().admin_numbers:
         if admin_number:
-            send_whatsapp_message(admin_number, message)
+            send_in_background(admin_number, message)
@@ -0,0 +1,98 @@
+"""
+Worker warm-up for preforked servers (see gunicorn.conf.py).
+
+warm_up() runs once in the gunicorn master after the app is preloaded. It
+builds the read-only state every worker needs: presets, the FAQ and policy
+retrieval index, the bank-rate index, the language-detection profiles,
+SQLAlchemy mapper configuration and the OpenAI module. It then freezes the GC
+generations so those objects stay shared copy-on-write after fork instead of
+being touched (and copied) by each worker's collector.
+
+init_worker() runs in each worker right after fork. It drops anything holding
+sockets inherited from the master (DB pool, Redis, HTTP sessions) and opens
+fresh pooled DB connections, so the first webhook doesn't pay for connection
+setup.
+"""
+import gc
+import logging
+import time
+
+from backend.extensions import db, registry
+
+logger = logging.getLogger(__name__)
+
+# Read-only services safe to build before fork.
+SHARED_SERVICES = ('presets', 'knowledge_index', 'bank_rates', 'openai', 'language_detector')
+
+# Services that hold sockets or sessions and must be rebuilt in each worker.
+PER_WORKER_SERVICES = ('redis', 'whatsapp')
+
+
+def warm_up(app):
+    """ Build shared caches in the master process, then freeze them for copy-on-write sharing. """
+    started = time.perf_counter()
+    with app.app_context():
+        from sqlalchemy.orm import configure_mappers
+        configure_mappers()
+        registry.warm(*SHARED_SERVICES)
+        _prime_statement_cache()
+        # Nothing the workers inherit may keep a connection from the master.
+        db.session.remove()
+        db.engine.dispose()
+    gc.collect()
+    gc.freeze()
+    logger.info("Warm-up finished in %.0fms (%d objects frozen)",
+                (time.perf_counter() - started) * 1000, gc.get_freeze_count())
+
+
+def _prime_statement_cache():
+    """
+    Run the per-message SELECTs once so SQLAlchemy's compiled-statement cache, which
+    lives on the engine and survives dispose(), is already filled when workers fork.
+    The INSERTs and UPDATE of a first message are only compiled, never executed: the
+    master must not write to (or take sequence values and row locks in) the live
+    database on every boot. Compiling them still loads the DML compiler paths.
+    """
+    from sqlalchemy import insert, update
+
+    from backend.models import ChatflowTemp, ChatLog, User
+
+    try:
+        db.session.query(ChatflowTemp).filter_by(phone_number='').first()
+        User.query.filter_by(wa_id='').first()
+        User.query.filter_by(phone_number='').first()
+        dialect = db.engine.dialect
+        for model in (User, ChatflowTemp, ChatLog):
+            insert(model).compile(dialect=dialect)
+        update(ChatflowTemp).where(ChatflowTemp.id == 0).values(current_step='').compile(dialect=dialect)
+    except Exception as e:
+        logger.warning("Could not prime the statement cache: %s", e)
+    finally:
+        db.session.rollback()
+
+
+def init_worker(app, connections=1):
+    """
+    Prepare a freshly forked worker.
+    Args:
+        app (Flask): The preloaded application.
+        connections (int): Pooled DB connections to open up front, e.g. the gunicorn thread count.
+    """
+    for name in PER_WORKER_SERVICES:
+        registry.reset(name)
+    with app.app_context():
+        # Drop pooled connections copied from the master without closing the master's sockets.
+        db.engine.dispose(close=False)
+        pool_size = getattr(db.engine.pool, 'size', lambda: 1)()
+        opened = []
+        try:
+            for _ in range(max(1, min(connections, pool_size))):
+                connection = db.engine.connect()
+                connection.exec_driver_sql('SELECT 1')
+                opened.append(connection)
+        except Exception as e:
+            logger.warning("Could not pre-open database connections: %s", e)
+        finally:
+            for connection in opened:
+                connection.close()  # Returned to the pool, still open
+    registry.warm(*PER_WORKER_SERVICES)
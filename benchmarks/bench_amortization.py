@@ -0,0 +1,58 @@
+"""
+Cost of refinance scenario comparisons with and without the schedule cache.
+
+A user comparing options re-runs compare_refinance with the same loan and a
+few different inputs (months paid, cash-out); schedules are memoized by
+(principal, rate, months), so only the first comparison builds them:
+
+    python -m benchmarks.bench_amortization
+    python -m benchmarks.bench_amortization --number 20000
+"""
+import argparse
+import timeit
+
+from backend.utils import amortization
+from backend.utils.amortization import amortization_schedule, compare_refinance
+
+# One user trying several options on the same loan
+OPTIONS = (
+    {},
+    {'cash_out': 50_000},
+    {'months_paid': 36},
+    {'months_paid': 36, 'cash_out': 100_000, 'lock_in_months': 60, 'lock_in_penalty_rate': 2.0},
+)
+
+
+def _clear_caches():
+    amortization._cached_schedule.cache_clear()
+    amortization.payment_factor.cache_clear()
+    amortization.implied_annual_rate.cache_clear()
+
+
+def compare_all():
+    return [compare_refinance(450_000, 30, 2_400, 3.55, **option) for option in OPTIONS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=5000)
+    args = parser.parse_args()
+
+    def cold():
+        _clear_caches()
+        compare_all()
+
+    cases = {
+        'compare (cold caches)': cold,
+        'compare (cached)': compare_all,
+        'schedule rows (360)': lambda: list(amortization_schedule(450_000, 3.55, 360).rows()),
+    }
+    per_call = {'compare (cold caches)': len(OPTIONS), 'compare (cached)': len(OPTIONS)}
+    compare_all()
+    for label, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.number, repeat=3))
+        print(f"{label:<24} {seconds / (args.number * per_call.get(label, 1)) * 1e6:9.2f} us/call")
+
+
+if __name__ == '__main__':
+    main()
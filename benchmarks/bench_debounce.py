@@ -0,0 +1,142 @@
+"""
+Inbound debouncing (backend.utils.debounce) for users who type in bursts.
+
+Users already in query mode each send questions split over several quick
+messages, through /webhook against the local WhatsApp/OpenAI stand-ins, with
+debouncing off and on:
+
+    python -m benchmarks.bench_debounce
+    python -m benchmarks.bench_debounce --users 40 --gap-ms 300 --window-ms 1200
+
+Prints, per mode, the inputs the chatbot handled, model calls, WhatsApp sends
+and the delay from a burst's last fragment to its last reply. Debouncing
+trades that delay (about one window) for fewer calls and replies.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeUpstreamServer
+from benchmarks.load_test import make_app, webhook_payload
+
+# Questions as bursty typists send them
+BURSTS = (
+    ('Can I refinance', 'if my loan', 'is only 2 years old?'),
+    ('how long', 'does refinancing take'),
+    ('Is there a lock-in period?', 'and what is the penalty', 'if I sell early'),
+    ('what documents', 'do i need', 'for refinancing', 'as a salaried employee'),
+    ('Can I cash out', 'from refinancing?'),
+    ('Do banks accept', 'commission earners?'),
+)
+
+
+def _percentile(ordered, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def run_mode(app, users, bursts_per_user, gap_ms, seed):
+    """ Send every user's bursts; returns (inputs handled, sorted ms from a burst's last fragment to its handling). """
+    from backend.extensions import db
+    from backend.models import ChatflowTemp
+    from backend.routes import chatbot
+    from backend.utils import debounce
+
+    phones = [f'6017{index:07d}' for index in range(users)]
+    with app.app_context():
+        db.session.add_all(ChatflowTemp(phone_number=phone, current_step='process_completion', language_code='en',
+                                        mode='query') for phone in phones)
+        db.session.commit()
+
+    lock = threading.Lock()
+    handled = []  # (phone, finished at)
+    in_flight = [0]
+    original = chatbot.process_text
+
+    def counting_process_text(phone_number, message_body):
+        with lock:
+            in_flight[0] += 1
+        try:
+            return original(phone_number, message_body)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+                handled.append((phone_number, time.perf_counter()))
+
+    chatbot.process_text = counting_process_text
+    bursts = []  # (phone, first fragment sent, last fragment sent)
+
+    def user(phone):
+        rng = random.Random(f'{seed}:{phone}')
+        client = app.test_client()
+        for _ in range(bursts_per_user):
+            fragments = rng.choice(BURSTS)
+            first = None
+            for index, text in enumerate(fragments):
+                if index:
+                    time.sleep(gap_ms / 1000 * rng.uniform(0.5, 1.5))
+                first = first or time.perf_counter()
+                client.post('/webhook', json=webhook_payload(phone, text, rng))
+            with lock:
+                bursts.append((phone, first, time.perf_counter()))
+            time.sleep(3.0)  # Reads the answer before the next question
+
+    try:
+        with ThreadPoolExecutor(min(users, 32)) as pool:
+            list(pool.map(user, phones))
+        while True:
+            with lock:
+                busy = in_flight[0]
+            if not debounce._pending and not busy:
+                break
+            time.sleep(0.05)
+    finally:
+        chatbot.process_text = original
+
+    # A burst is answered when the last input handled for it finishes (bursts of a user are 3s apart)
+    delays = []
+    for phone, first, last in bursts:
+        finished = [at for handled_phone, at in handled if handled_phone == phone and first <= at < last + 2.9]
+        if finished:
+            delays.append(max(max(finished) - last, 0.0) * 1000)
+    return len(handled), sorted(delays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--bursts', type=int, default=2, help='Questions per user.')
+    parser.add_argument('--gap-ms', type=float, default=400.0, help='Mean pause between fragments of a burst.')
+    parser.add_argument('--window-ms', type=float, default=1500.0, help='INBOUND_DEBOUNCE_MS when on.')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Upstream latency of the stand-ins.')
+    parser.add_argument('--seed', default='debounce')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('ADMIN_PHONE_NUMBER', '60100000000')
+    upstream = FakeUpstreamServer(args.latency_ms).start()
+    tmpdir = tempfile.mkdtemp(prefix='debounce_bench_')
+    try:
+        for mode, window_ms in (('off', 0), ('on', args.window_ms)):
+            app = make_app(f"sqlite:///{os.path.join(tmpdir, f'{mode}.db')}", upstream, INBOUND_DEBOUNCE_MS=window_ms,
+                           SQL_AUDIT_ENABLED=False, LOAD_SHED_ENABLED=False,
+                           SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60})
+            upstream.requests.clear()
+            inputs, delays = run_mode(app, args.users, args.bursts, args.gap_ms, args.seed)
+            calls = {name: sum(count for (upstream_name, _), count in upstream.requests.items() if upstream_name == name)
+                     for name in ('openai', 'whatsapp')}
+            print(f"{mode:<4} window {window_ms:>6.0f} ms: {inputs:>4} inputs handled, {calls['openai']:>4} model calls, "
+                  f"{calls['whatsapp']:>4} WhatsApp sends, last fragment -> handled p50 "
+                  f"{_percentile(delays, 50):7.0f} ms  p95 {_percentile(delays, 95):7.0f} ms")
+    finally:
+        upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Per-message overhead of the funnel instrumentation.
+
+A flow message costs at most one step_exited (counter + histogram) and one
+step_entered (counter); the target is a few microseconds in total:
+
+    python -m benchmarks.bench_funnel_metrics
+"""
+import timeit
+from datetime import datetime, timedelta
+
+import pytz
+
+from backend.utils import funnel
+
+MYT = pytz.timezone('Asia/Kuala_Lumpur')
+
+
+def main(number=200000):
+    entered_at = datetime.now(MYT).replace(tzinfo=None) - timedelta(seconds=42)
+    cases = {
+        'step_entered': lambda: funnel.step_entered('get_loan_amount'),
+        'step_failed': lambda: funnel.step_failed('get_loan_amount'),
+        'step_exited': lambda: funnel.step_exited('get_loan_amount', entered_at),
+        'per_message (exit + enter)': lambda: (
+            funnel.step_exited('get_loan_amount', entered_at), funnel.step_entered('get_loan_tenure')
+        ),
+    }
+    for label, case in cases.items():
+        seconds = min(timeit.repeat(case, number=number, repeat=3))
+        print(f"{label:<28} {seconds / number * 1e6:8.3f} us/call")
+
+
+if __name__ == '__main__':
+    main()
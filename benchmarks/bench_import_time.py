@@ -0,0 +1,107 @@
+"""
+Startup benchmark: how long a fresh interpreter takes to import the app and run create_app().
+
+Runs `python -X importtime` in clean subprocesses with no credentials set, which
+also proves that importing the app has no side effects that need them:
+
+    python -m benchmarks.bench_import_time               # print a summary
+    python -m benchmarks.bench_import_time --record      # also append to benchmarks/results/import_time.jsonl
+
+The recorded history (one JSON line per run, tagged with the git commit) is how
+boot time is tracked over time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'import_time.jsonl')
+
+IMPORT_SNIPPET = 'import backend.app'
+CREATE_APP_SNIPPET = (
+    'import time; t0 = time.perf_counter(); import backend.app; '
+    "app = backend.app.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}); "
+    'print(f"CREATE_APP_MS={(time.perf_counter() - t0) * 1000:.1f}")'
+)
+
+
+def _clean_env():
+    env = {key: os.environ[key] for key in ('PATH', 'HOME', 'LANG') if key in os.environ}
+    env['PYTHONPATH'] = ROOT
+    env['LOG_LEVEL'] = 'WARNING'
+    return env
+
+
+def measure_imports():
+    """ Return (total_us, {module: cumulative_us}) for importing backend.app. """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_SNIPPET],
+        capture_output=True, text=True, cwd=ROOT, env=_clean_env(), check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative_us, name = (part.strip() for part in line.split(':', 1)[1].split('|'))
+        modules[name] = int(cumulative_us)
+    return modules.get('backend.app', 0), modules
+
+
+def measure_create_app():
+    result = subprocess.run(
+        [sys.executable, '-c', CREATE_APP_SNIPPET],
+        capture_output=True, text=True, cwd=ROOT, env=_clean_env(), check=True,
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith('CREATE_APP_MS='):
+            return float(line.split('=', 1)[1])
+    return None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=ROOT, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Show the N slowest top-level imports.')
+    parser.add_argument('--record', action='store_true', help=f'Append the result to {HISTORY_PATH}.')
+    args = parser.parse_args()
+
+    import_samples, create_samples, modules = [], [], {}
+    for _ in range(args.runs):
+        total_us, modules = measure_imports()
+        import_samples.append(total_us / 1000)
+        create_samples.append(measure_create_app())
+
+    record = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'import_ms_median': round(statistics.median(import_samples), 1),
+        'create_app_ms_median': round(statistics.median(create_samples), 1),
+        'heavy_modules_loaded': sorted(name for name in ('openai', 'alembic', 'flask_migrate') if name in modules),
+    }
+    print(json.dumps(record))
+
+    print(f"\nSlowest imports (cumulative ms, last run):")
+    for name, cumulative_us in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+    if args.record:
+        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+        with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Intent classifier benchmark: accuracy and speed of backend.utils.intents
+against the substring checks it replaced.
+
+Every corpus line is a message with the intents it should (and should not)
+trigger, in English, Malay and Chinese, including the traps the old substring
+scan fell into ("this" contains "hi", "shift" contains "hi", "can you help me"
+reset the conversation mid-flow):
+
+    python -m benchmarks.bench_intents
+    python -m benchmarks.bench_intents --number 20000
+
+Prints per-intent precision/recall for both matchers and the cost per
+message. Exits 1 if the new matcher gets any corpus case wrong, so it doubles
+as the regression check for the phrase tables.
+"""
+import argparse
+import sys
+import timeit
+
+from backend.utils.intents import CONTACT_ADMIN, CREATOR, GREETING, IDENTITY, RESTART, detect_intents
+
+INTENTS = (GREETING, RESTART, CONTACT_ADMIN, IDENTITY, CREATOR)
+
+CORPUS = (
+    # Greetings
+    ('hi', {GREETING}),
+    ('Hi!', {GREETING}),
+    ('Hello there', {GREETING}),
+    ('hey, I want to refinance', {GREETING}),
+    ('  HELLO  ', {GREETING}),
+    ('👋 hey', {GREETING}),
+    ('help', {GREETING}),
+    ('start', {GREETING}),
+    ('hai', {GREETING}),
+    ('Selamat pagi', {GREETING}),
+    ('apa khabar?', {GREETING}),
+    ('tolong saya', {GREETING}),
+    ('你好', {GREETING}),
+    ('你好吗', {GREETING}),
+    ('开始', {GREETING}),
+    ('hello, how do I contact admin?', {GREETING, CONTACT_ADMIN}),
+    # Not greetings: substrings, names and flow answers
+    ('this', set()),
+    ('which bank is cheapest', set()),
+    ('shift', set()),
+    ('Hiroshi Tanaka', set()),
+    ('Chiew Mei Ling', set()),
+    ('Philip', set()),
+    ('John Tan', set()),
+    ('300000', set()),
+    ('1', set()),
+    ('can you help me compare banks', set()),
+    ('when does the new rate start', set()),
+    ('othello', set()),
+    ('what is refinancing?', set()),
+    ('我想再融资', set()),
+    ('', set()),
+    # Restart
+    ('restart', {RESTART}),
+    ('Restart!', {RESTART}),
+    ('start over', {RESTART}),
+    ('reset', {RESTART}),
+    ('mula semula', {RESTART}),
+    ('重新开始', {RESTART}),
+    ('what if I restart my loan', set()),
+    ('restarted', set()),
+    # Contact admin
+    ('How do I contact the admin?', {CONTACT_ADMIN}),
+    ('can I talk to a human', {CONTACT_ADMIN}),
+    ('speak to an agent please', {CONTACT_ADMIN}),
+    ('boleh hubungi admin?', {CONTACT_ADMIN}),
+    ('管理员在哪', {CONTACT_ADMIN}),
+    ('administration fee?', set()),
+    ('contactless payment', set()),
+    # Identity
+    ('what is your name', {IDENTITY}),
+    ('who are you?', {IDENTITY}),
+    ('siapa awak', {IDENTITY}),
+    ('你是谁', {IDENTITY}),
+    ('is the name on the loan yours', set()),
+    # Creator
+    ('who do you work for?', {CREATOR}),
+    ('who works there', {CREATOR}),
+    ('who made you', {CREATOR}),
+    ('does refinancing work for me', set()),
+    ('whose homework is this', set()),
+)
+
+LEGACY_GREETINGS = ('hi', 'hey', 'hello', 'start', 'begin', 'help', 'hai', 'apa khabar', 'selamat', 'mula', 'tolong',
+                    '你好', '哈罗', '开始', '帮助')
+
+
+def legacy_intents(text):
+    """ The substring checks previously inlined in backend.routes.chatbot. """
+    lower = text.lower().strip()
+    found = set()
+    if any(greeting in lower for greeting in LEGACY_GREETINGS):
+        found.add(GREETING)
+    if text.lower() == 'restart':
+        found.add(RESTART)
+    if 'admin' in lower or 'contact' in lower:
+        found.add(CONTACT_ADMIN)
+    elif 'your name' in lower:
+        found.add(IDENTITY)
+    elif 'who' in lower and 'work' in lower:
+        found.add(CREATOR)
+    return found
+
+
+def score(classify):
+    """ Return ({intent: (precision, recall)}, [(text, expected, got)] mistakes). """
+    counts = {intent: [0, 0, 0] for intent in INTENTS}  # true positives, false positives, false negatives
+    mistakes = []
+    for text, expected in CORPUS:
+        got = set(classify(text))
+        if got != expected:
+            mistakes.append((text, sorted(expected), sorted(got)))
+        for intent in INTENTS:
+            if intent in got and intent in expected:
+                counts[intent][0] += 1
+            elif intent in got:
+                counts[intent][1] += 1
+            elif intent in expected:
+                counts[intent][2] += 1
+    stats = {}
+    for intent, (tp, fp, fn) in counts.items():
+        stats[intent] = (tp / (tp + fp) if tp + fp else 1.0, tp / (tp + fn) if tp + fn else 1.0)
+    return stats, mistakes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=5000, help='Corpus passes per timing repeat.')
+    args = parser.parse_args()
+
+    matchers = {'substring (old)': legacy_intents, 'intents (new)': detect_intents}
+    failures = []
+    print(f"{len(CORPUS)} labelled messages")
+    print(f"{'matcher':<16} {'intent':<14} {'precision':>9} {'recall':>7}")
+    for label, classify in matchers.items():
+        stats, mistakes = score(classify)
+        for intent, (precision, recall) in stats.items():
+            print(f"{label:<16} {intent:<14} {precision:>9.2f} {recall:>7.2f}")
+        print(f"{label:<16} {'misclassified':<14} {len(mistakes):>9}")
+        if classify is detect_intents:
+            failures = mistakes
+
+    for label, classify in matchers.items():
+        seconds = min(timeit.repeat(lambda: [classify(text) for text, _ in CORPUS], number=args.number, repeat=3))
+        print(f"{label:<16} {seconds / (args.number * len(CORPUS)) * 1e6:8.3f} us/message")
+
+    for text, expected, got in failures:
+        print(f"MISCLASSIFIED {text!r}: expected {expected}, got {got}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Memory and latency benchmark for the admin lead listing/export paths.
+
+Seeds a SQLite database with N leads (1M by default) and runs each mode in a
+fresh subprocess so peak RSS is attributable to that mode alone:
+
+    python -m benchmarks.bench_lead_export --leads 1000000
+    python -m benchmarks.bench_lead_export --leads 200000 --modes ndjson csv keyset
+
+Modes:
+    legacy  - Lead.query.all() + list of dicts (the old get_all_leads)
+    ndjson  - streamed NDJSON export via iter_leads_ndjson
+    csv     - streamed CSV export via iter_leads_csv
+    keyset  - latency of a 100-row keyset page near the end of the table
+    offset  - latency of a 100-row OFFSET page near the end of the table
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask import Flask
+
+from backend.extensions import db
+from backend.models import Lead, User
+
+ALL_MODES = ('legacy', 'ndjson', 'csv', 'keyset', 'offset')
+SEED_CHUNK = 50000
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(db_path, lead_count):
+    app = make_app(db_path)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, wa_id='60100000000', phone_number='60100000000', name='Bench User'))
+        db.session.commit()
+        now = datetime(2026, 1, 1)
+        insert = Lead.__table__.insert()
+        for start in range(0, lead_count, SEED_CHUNK):
+            rows = [
+                {
+                    'user_id': 1,
+                    'phone_number': f'601{i:08d}',
+                    'name': f'Lead {i}',
+                    'original_loan_amount': 300000.0 + i % 500000,
+                    'original_loan_tenure': 30,
+                    'current_repayment': 1500.0 + i % 1000,
+                    'new_repayment': 1400.0,
+                    'monthly_savings': 100.0 + i % 1000,
+                    'yearly_savings': 1200.0,
+                    'total_savings': 36000.0,
+                    'years_saved': 2,
+                    'created_at': now,
+                    'updated_at': now,
+                }
+                for i in range(start, min(start + SEED_CHUNK, lead_count))
+            ]
+            db.session.execute(insert, rows)
+            db.session.commit()
+
+
+def run_mode(db_path, mode):
+    """ Run a single mode in this process and print a JSON result line. """
+    from backend.utils.lead_export import (
+        LEAD_EXPORT_COLUMNS, fetch_leads_page, iter_leads_csv, iter_leads_ndjson, lead_row_to_dict,
+    )
+
+    app = make_app(db_path)
+    with app.app_context():
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = {'mode': mode}
+        started = time.perf_counter()
+
+        if mode == 'legacy':
+            leads = Lead.query.all()
+            data = [{column.key: getattr(lead, column.key) for column in LEAD_EXPORT_COLUMNS} for lead in leads]
+            result['rows'] = len(data)
+            result['bytes'] = len(json.dumps(data, default=str))
+        elif mode in ('ndjson', 'csv'):
+            chunks = iter_leads_ndjson() if mode == 'ndjson' else iter_leads_csv()
+            total_bytes = 0
+            for chunk in chunks:
+                total_bytes += len(chunk)
+            result['bytes'] = total_bytes
+        elif mode in ('keyset', 'offset'):
+            max_id = db.session.query(db.func.max(Lead.id)).scalar() or 0
+            samples = []
+            for _ in range(50):
+                t0 = time.perf_counter()
+                if mode == 'keyset':
+                    fetch_leads_page(after_id=max_id - 150, limit=100)
+                else:
+                    rows = (
+                        db.session.query(*LEAD_EXPORT_COLUMNS)
+                        .order_by(Lead.id).offset(max_id - 150).limit(100).all()
+                    )
+                    [lead_row_to_dict(row) for row in rows]
+                samples.append((time.perf_counter() - t0) * 1000)
+            samples.sort()
+            result['p50_ms'] = round(statistics.median(samples), 3)
+            result['p95_ms'] = round(samples[int(len(samples) * 0.95) - 1], 3)
+
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['peak_rss_mb'] = round(rss_after / 1024, 1)
+        result['rss_growth_mb'] = round((rss_after - rss_before) / 1024, 1)
+        print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=1000000)
+    parser.add_argument('--modes', nargs='+', choices=ALL_MODES, default=list(ALL_MODES))
+    parser.add_argument('--db', help='Reuse an existing benchmark database instead of seeding a new one.')
+    parser.add_argument('--run-mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_mode(args.db, args.run_mode)
+        return
+
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='lead_export_bench_'), 'bench.db')
+        t0 = time.perf_counter()
+        seed(db_path, args.leads)
+        print(f"Seeded {args.leads} leads in {time.perf_counter() - t0:.1f}s at {db_path}")
+
+    for mode in args.modes:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_lead_export', '--db', db_path, '--run-mode', mode],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
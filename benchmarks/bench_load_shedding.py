@@ -0,0 +1,149 @@
+"""
+Adaptive load shedding (backend.utils.load_shedding) under a surge of questions.
+
+One simulated worker with --threads threads takes webhook requests from a
+FIFO queue, like a gthread worker behind the router. Query-mode users send
+questions at --rate per second against a slow OpenAI stand-in, while flow
+users walk the flow to completion, one step at a time. Runs with shedding
+off, on, and on without the X-Request-Start header (stamped when a request
+is queued), where only worker saturation can trigger it:
+
+    python -m benchmarks.bench_load_shedding
+    python -m benchmarks.bench_load_shedding --rate 8 --openai-ms 1200 --seconds 20
+
+Prints, per mode, flow-step latency (queued -> handled), leads completed before the surge ended,
+and how many questions went to the model or got the busy reply.
+"""
+import argparse
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+from benchmarks.fakes import FakeUpstreamServer
+from benchmarks.load_test import QUESTIONS, _percentile, conversation_script, make_app, webhook_payload
+
+# (label, LOAD_SHED_ENABLED, send X-Request-Start)
+MODES = (('off', False, True), ('on', True, True), ('on, no header', True, False))
+
+
+def serve(app, requests, threads, request_start):
+    """ Worker threads handling queued (payload, queued at, future) in order; returns them. """
+    def worker():
+        client = app.test_client()
+        while True:
+            item = requests.get()
+            if item is None:
+                return
+            payload, queued_at, future = item
+            headers = {'X-Request-Start': str(int(queued_at * 1000))} if request_start else {}
+            client.post('/webhook', json=payload, headers=headers)
+            future.set_result(time.time() - queued_at)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    return workers
+
+
+def _busy_replies():
+    from backend.utils import metrics
+
+    return sum(value for (name, _), value in metrics.snapshot()['series'].items() if name == 'load_shed_messages_total')
+
+
+def run_mode(app, args, request_start):
+    """ One surge; returns (sorted flow-step ms, leads completed, questions asked, busy replies). """
+    from backend.extensions import db
+    from backend.models import ChatflowTemp, Lead
+
+    askers = [f'6016{index:07d}' for index in range(args.askers)]
+    with app.app_context():
+        db.session.add_all(ChatflowTemp(phone_number=phone, current_step='process_completion', language_code='en',
+                                        mode='query') for phone in askers)
+        db.session.commit()
+
+    busy_before = _busy_replies()
+    requests = queue.Queue()
+    workers = serve(app, requests, args.threads, request_start)
+    deadline = time.time() + args.seconds
+    flow_ms, asked, lock = [], [0], threading.Lock()
+
+    def submit(payload):
+        future = Future()
+        requests.put((payload, time.time(), future))
+        return future
+
+    def flow_user(index):
+        rng = random.Random(f'{args.seed}:flow:{index}')
+        phone = f'6015{index:07d}'
+        time.sleep(rng.uniform(0, args.seconds / 2))
+        for _, text in conversation_script(rng, 0):
+            if time.time() > deadline:
+                return
+            waited = submit(webhook_payload(phone, text, rng)).result()
+            with lock:
+                flow_ms.append(waited * 1000)
+            time.sleep(rng.uniform(0.5, 1.5))  # Typing the next answer
+
+    def surge():
+        rng = random.Random(f'{args.seed}:surge')
+        while time.time() < deadline:
+            submit(webhook_payload(rng.choice(askers), f'{rng.choice(QUESTIONS)} ({rng.randrange(10**6)})', rng))
+            asked[0] += 1
+            time.sleep(rng.expovariate(args.rate))
+
+    users = [threading.Thread(target=flow_user, args=(index,)) for index in range(args.flow_users)]
+    users.append(threading.Thread(target=surge))
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    for _ in workers:  # Queued after everything else, so the backlog is handled first
+        requests.put(None)
+    for thread in workers:
+        thread.join()
+
+    with app.app_context():
+        leads = db.session.query(Lead).count()
+    return sorted(flow_ms), leads, asked[0], _busy_replies() - busy_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=4, help='Worker threads.')
+    parser.add_argument('--rate', type=float, default=4.0, help='Questions per second during the surge.')
+    parser.add_argument('--askers', type=int, default=200, help='Query-mode users sending the questions.')
+    parser.add_argument('--flow-users', type=int, default=15)
+    parser.add_argument('--seconds', type=float, default=15.0, help='Length of the surge.')
+    parser.add_argument('--openai-ms', type=float, default=500.0, help='OpenAI stand-in latency.')
+    parser.add_argument('--queue-target-ms', type=float, default=500.0, help='LOAD_SHED_QUEUE_TARGET_MS when on.')
+    parser.add_argument('--seed', default='shedding')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('ADMIN_PHONE_NUMBER', '60100000000')
+    upstream = FakeUpstreamServer(model_latency_ms={'gpt-3.5-turbo': args.openai_ms}).start()
+    tmpdir = tempfile.mkdtemp(prefix='shedding_bench_')
+    try:
+        for index, (mode, enabled, request_start) in enumerate(MODES):
+            app = make_app(f"sqlite:///{os.path.join(tmpdir, f'mode{index}.db')}", upstream, SQL_AUDIT_ENABLED=False,
+                           LOAD_SHED_ENABLED=enabled, LOAD_SHED_MAX_IN_FLIGHT=args.threads,
+                           LOAD_SHED_QUEUE_TARGET_MS=args.queue_target_ms, RETRIEVAL_ANSWER_MIN_CONFIDENCE=2.0,
+                           # One connection: SQLite cannot take concurrent chat-log writes, so they queue
+                           SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60})
+            upstream.requests.clear()
+            flow_ms, leads, asked, busy = run_mode(app, args, request_start)
+            model_calls = sum(count for (name, _), count in upstream.requests.items() if name == 'openai')
+            print(f"{mode:<13} flow step queued -> handled p50 {_percentile(flow_ms, 50):7.0f} ms  "
+                  f"p95 {_percentile(flow_ms, 95):7.0f} ms  {leads:>3} leads  {asked:>4} questions, "
+                  f"{model_calls:>4} model calls, {busy:>4} busy replies")
+    finally:
+        upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Query-mode routing (backend.utils.query_router) against a fake model tier.
+
+Runs a mixed corpus of query-mode questions through handle_gpt_query, with
+the local fake OpenAI endpoint standing in for a fast and a strong model
+(per-model latency plus a cost per generated token), fully offline:
+
+    python -m benchmarks.bench_model_router
+    python -m benchmarks.bench_model_router --strong-latency-ms 3000 --slo-ms 2500 --rounds 8
+
+Modes:
+    fixed   - routing disabled: every question to the fast model with max_tokens=150 (the old behaviour)
+    routed  - local answers, per-route max_tokens, complex questions to the strong model, p95 SLO enforced
+
+Prints, per mode, how questions were routed, model calls and generated
+tokens, and per-route p50/p95 latency. A route is only degraded once its
+window holds 20 calls, hence the extra rounds in the SLO example.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeUpstreamServer
+
+FAST_MODEL = 'gpt-3.5-turbo'
+STRONG_MODEL = 'gpt-4o-mini'
+
+# (question, language)
+CORPUS = (
+    ('What is refinancing?', 'en'),
+    ('How long does refinancing take?', 'en'),
+    ('Is there a lock-in period?', 'en'),
+    ('Can I cash out from refinancing?', 'en'),
+    ('what is the interest rate', 'en'),
+    ('how do i reach admin', 'en'),
+    ('who are you?', 'en'),
+    ('Can I refinance with bad credit?', 'en'),
+    ('Is MRTA compulsory?', 'en'),
+    ('Do banks accept commission earners?', 'en'),
+    ('What happens if I miss a payment?', 'en'),
+    ('Can my wife be a joint borrower on the new loan?', 'en'),
+    ('Will refinancing affect my credit score in the long run?', 'en'),
+    ('Should I take a flexi loan or a term loan if I plan to make extra payments every year?', 'en'),
+    ('Compare fixed and floating rates for a 30 year loan', 'en'),
+    ('My loan is 350k at 4.5% with 25 years left, is it worth refinancing to 3.9%?', 'en'),
+    ('What is the difference between BR and BLR and which is better for me?', 'en'),
+    ('I am self employed with irregular income. What documents do I need, how long will approval take, '
+     'and can I still get a good rate?', 'en'),
+    ('apa itu pembiayaan semula?', 'ms'),
+    ('Berapa lama proses pembiayaan semula?', 'ms'),
+    ('Bolehkah saya bandingkan kadar tetap dan terapung?', 'ms'),
+    ('什么是再融资？', 'zh'),
+    ('需要哪些文件', 'zh'),
+    ('固定利率和浮动利率哪个更好？', 'zh'),
+)
+
+
+def make_app(db_path, upstream, **config):
+    from backend.app import create_app
+    from backend.extensions import db
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'WHATSAPP_API_URL': upstream.whatsapp_url,
+        'WHATSAPP_API_TOKEN': 'bench',
+        'WHATSAPP_PHONE_NUMBER_ID': '1000000000',
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_API_BASE': upstream.openai_base,
+        'SQL_AUDIT_ENABLED': False,
+        # One connection: SQLite cannot take concurrent chat-log writes, so they queue
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60},
+        **config,
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _percentile(ordered, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def run_mode(app, rounds, concurrency):
+    """ Ask the corpus `rounds` times; returns (route counts, route -> sorted latencies in ms). """
+    from types import SimpleNamespace
+
+    from backend.extensions import db, registry
+    from backend.routes.chatbot import handle_gpt_query
+    from backend.utils.query_router import get_query_router
+
+    routes = Counter()
+    latencies = defaultdict(list)
+    chosen = threading.local()
+
+    with app.app_context():
+        registry.reset('query_router')
+        router = get_query_router()
+    choose_route = router.route
+
+    def remember_route(question, language_code='en'):
+        chosen.route = choose_route(question, language_code)
+        return chosen.route
+
+    router.route = remember_route
+
+    def ask(item):
+        index, (question, language_code) = item
+        with app.app_context():
+            started = time.perf_counter()
+            handle_gpt_query(question, SimpleNamespace(language_code=language_code), f'6018{index:07d}')
+            elapsed = (time.perf_counter() - started) * 1000
+            db.session.commit()
+            db.session.remove()
+        return chosen.route, elapsed
+
+    items = list(enumerate(CORPUS * rounds))
+    with ThreadPoolExecutor(concurrency) as pool:
+        for start in range(0, len(items), len(CORPUS)):
+            for route, elapsed in pool.map(ask, items[start:start + len(CORPUS)]):
+                routes[(route.name, route.model or 'none', route.degraded)] += 1
+                latencies[route.name].append(elapsed)
+    return routes, {name: sorted(values) for name, values in latencies.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=3, help='Times the corpus is asked.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--fast-latency-ms', type=float, default=150.0)
+    parser.add_argument('--strong-latency-ms', type=float, default=600.0)
+    parser.add_argument('--token-latency-ms', type=float, default=4.0, help='Cost of each generated token.')
+    parser.add_argument('--slo-ms', type=float, default=2500.0, help='QUERY_LATENCY_SLO_MS for the routed mode.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    upstream = FakeUpstreamServer(model_latency_ms={FAST_MODEL: args.fast_latency_ms,
+                                                    STRONG_MODEL: args.strong_latency_ms},
+                                  token_latency_ms=args.token_latency_ms).start()
+    tmpdir = tempfile.mkdtemp(prefix='router_bench_')
+    modes = {
+        'fixed': {'QUERY_ROUTING_ENABLED': False},
+        'routed': {'QUERY_ROUTING_ENABLED': True, 'QUERY_MODEL_FAST': FAST_MODEL, 'QUERY_MODEL_STRONG': STRONG_MODEL,
+                   'QUERY_LATENCY_SLO_MS': args.slo_ms},
+    }
+    try:
+        for mode, config in modes.items():
+            app = make_app(os.path.join(tmpdir, f'{mode}.db'), upstream, **config)
+            upstream.models.clear()
+            upstream.completion_tokens.clear()
+            started = time.perf_counter()
+            routes, latencies = run_mode(app, args.rounds, args.concurrency)
+            seconds = time.perf_counter() - started
+            print(f"{mode}: {sum(routes.values())} questions in {seconds:.2f}s, "
+                  f"{sum(upstream.models.values())} model calls, "
+                  f"{sum(upstream.completion_tokens.values())} completion tokens {dict(upstream.completion_tokens)}")
+            for (name, model, degraded), count in sorted(routes.items()):
+                print(f"    {name:<9} {model:<14} {'degraded' if degraded else '':<9} {count:>4}")
+            for name, values in sorted(latencies.items()):
+                print(f"    {name:<9} p50 {_percentile(values, 50):8.1f} ms   p95 {_percentile(values, 95):8.1f} ms")
+    finally:
+        upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
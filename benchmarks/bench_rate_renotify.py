@@ -0,0 +1,121 @@
+"""
+Throughput of the rate-change re-notification pipeline (backend.utils.rate_renotify).
+
+Seeds a SQLite database with N leads and measures how fast the leads a new
+rate would reach are found, without sending anything:
+
+    python -m benchmarks.bench_rate_renotify --leads 200000
+
+Modes:
+    per_lead  - one ORM Lead at a time through calculate_refinance_savings (the naive approach)
+    pipeline  - keyset chunks through evaluate_chunk (what the scheduler runs)
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from flask import Flask
+
+from backend.extensions import db, registry
+from backend.models import BankRate, Lead, User
+
+SEED_CHUNK = 50000
+TENURES = (20, 25, 30, 35)
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    registry.init_app(app)
+    return app
+
+
+def seed(app, lead_count):
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, wa_id='60100000000', phone_number='60100000000', name='Bench User'))
+        db.session.add_all([
+            BankRate(bank_name='Bank A', min_amount=0, max_amount=10_000_000, interest_rate=3.9),
+            BankRate(bank_name='Bank New', min_amount=100_000, max_amount=2_000_000, interest_rate=3.2),
+        ])
+        db.session.commit()
+        now = datetime(2026, 1, 1)
+        for start in range(0, lead_count, SEED_CHUNK):
+            db.session.execute(Lead.__table__.insert(), [
+                {
+                    'user_id': 1,
+                    'phone_number': f'601{i:08d}',
+                    'name': f'Lead {i}',
+                    'original_loan_amount': 150000.0 + (i * 7919) % 1_500_000,
+                    'original_loan_tenure': TENURES[i % len(TENURES)],
+                    'current_repayment': 1500.0 + i % 5000,
+                    'new_repayment': 1400.0 + i % 4000,
+                    'created_at': now,
+                    'updated_at': now,
+                }
+                for i in range(start, min(start + SEED_CHUNK, lead_count))
+            ])
+            db.session.commit()
+
+
+def run_per_lead(rate, min_gain):
+    from backend.utils.calculation import calculate_refinance_savings
+
+    selected = 0
+    for lead in Lead.query.filter(Lead.original_loan_amount.between(rate.min_amount, rate.max_amount)):
+        result = calculate_refinance_savings(lead.original_loan_amount, lead.original_loan_tenure,
+                                             lead.current_repayment)
+        new_repayment = result['new_monthly_repayment']
+        if (lead.new_repayment or lead.current_repayment) - new_repayment >= min_gain \
+                and new_repayment < lead.current_repayment:
+            selected += 1
+    return selected
+
+
+def run_pipeline(rate, min_gain, chunk_size):
+    from backend.utils.bank_rates import load_bank_rate_index
+    from backend.utils.rate_renotify import fetch_lead_chunk, evaluate_chunk
+
+    index = load_bank_rate_index()
+    selected = 0
+    before_id = None
+    while True:
+        leads = fetch_lead_chunk(rate, before_id, chunk_size)
+        if not leads:
+            return selected
+        selected += len(evaluate_chunk(leads, rate, index, min_gain))
+        before_id = leads[-1].id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--min-gain', type=float, default=50.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    db_path = os.path.join(tempfile.mkdtemp(prefix='renotify_bench_'), 'bench.db')
+    app = make_app(db_path)
+    seed(app, args.leads)
+
+    with app.app_context():
+        rate = BankRate.query.filter_by(bank_name='Bank New').one()
+        modes = {
+            'per_lead': lambda: run_per_lead(rate, args.min_gain),
+            'pipeline': lambda: run_pipeline(rate, args.min_gain, args.chunk_size),
+        }
+        for mode, run in modes.items():
+            started = time.perf_counter()
+            selected = run()
+            seconds = time.perf_counter() - started
+            print(f"{mode:<9} {selected:>8} leads selected in {seconds:7.2f}s ({args.leads / seconds:,.0f} leads/s)")
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
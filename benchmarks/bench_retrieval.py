@@ -0,0 +1,121 @@
+"""
+Retrieval quality and speed of the BM25 knowledge index (backend.utils.retrieval).
+
+Every corpus line is a user question with the start of the preset question
+or policy section that should come back first (None: nothing should be
+confident enough to answer directly):
+
+    python -m benchmarks.bench_retrieval
+    python -m benchmarks.bench_retrieval --number 2000
+
+Compares BM25 with difflib close matching over the preset questions (what
+get_preset_response does) on hit@1 and hit@3, counts how many questions
+would be answered without the model and whether those answers were right,
+and prints index size, build time and per-query latency. Exits 1 if a direct
+answer is wrong, so it doubles as the regression check for the threshold.
+"""
+import argparse
+import sys
+import time
+from difflib import get_close_matches
+
+from flask import Flask
+
+from backend.extensions import registry
+
+# (question, language, expected title prefix or None)
+CORPUS = (
+    ('What is refinancing?', 'en', 'what is refinancing'),
+    ('why should i refinance my house', 'en', 'what is refinancing'),
+    ('How long does refinancing take?', 'en', 'how long does the loan application'),
+    ('What documents do I need?', 'en', 'what documents do i need'),
+    ('Is there a lock-in period?', 'en', 'what is a lock-in period'),
+    ('Can I cash out from refinancing?', 'en', 'can i cash out'),
+    ('what is the typical interest rate in malaysia', 'en', 'what is the typical interest rate'),
+    ('fixed or floating rate?', 'en', 'how do interest rates work'),
+    ('what is MRTA', 'en', 'what are mrta/mlta'),
+    ('how do i check if i am eligible', 'en', 'how do i check my eligibility'),
+    ('what fees do i pay when refinancing', 'en', 'what fees should i expect'),
+    ('what is margin of financing', 'en', 'what is the typical margin of financing'),
+    ('how can I contact an agent', 'en', 'how can i contact an agent'),
+    ('how do I delete my data', 'en', 'Privacy Policy: 5. How to Request'),
+    ('how long does data deletion take', 'en', 'Data Deletion Policy: 3'),
+    ('do you share my personal data with third parties', 'en', 'Privacy Policy: 2'),
+    ('is the chatbot giving financial advice', 'en', 'Terms of Service: 2'),
+    ('how old must I be to use your service', 'en', 'Terms of Service: 2'),
+    ('apa itu pembiayaan semula?', 'ms', 'apa itu pembiayaan semula'),
+    ('dokumen apa yang diperlukan', 'ms', 'dokumen apa yang diperlukan'),
+    ('berapa lama proses pembiayaan semula', 'ms', 'berapa lama proses'),
+    ('什么是再融资？', 'zh', '什么是再融资'),
+    ('需要哪些文件', 'zh', '申请房屋贷款或再融资需要哪些文件'),
+    ('什么是锁定期', 'zh', '什么是锁定期'),
+    ('tell me a joke', 'en', None),
+    ('what is the weather today', 'en', None),
+    ('Can my wife be a joint borrower on the new loan?', 'en', None),
+    ('My loan is 350k at 4.5% with 25 years left, is it worth refinancing to 3.9%?', 'en', None),
+)
+
+
+def _matches(passage, expected):
+    return expected is not None and passage.title.lower().startswith(expected.lower())
+
+
+def difflib_top(question, language_code, passages, k):
+    """ The old approach: fuzzy string match of the cleaned question against preset questions. """
+    from backend.utils.presets import clean_question
+
+    titles = {passage.title: passage for passage in passages if passage.language == language_code}
+    return [titles[title] for title in get_close_matches(clean_question(question), titles, n=k, cutoff=0.0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=500, help='Timing repetitions of the corpus.')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    registry.init_app(app)
+    with app.app_context():
+        from backend.utils.retrieval import get_knowledge_index
+
+        started = time.perf_counter()
+        index = get_knowledge_index()
+        build_ms = (time.perf_counter() - started) * 1000
+        threshold = float(app.config.get('RETRIEVAL_ANSWER_MIN_CONFIDENCE', 0.65))
+
+        results = {'bm25': [0, 0], 'difflib': [0, 0]}
+        answered = wrong = 0
+        expected_count = sum(1 for _, _, expected in CORPUS if expected)
+        for question, language_code, expected in CORPUS:
+            hits = index.search(question, language_code, 3)
+            passages = [hit.passage for hit in hits]
+            fuzzy = difflib_top(question, language_code, index.passages, 3)
+            for name, ranked in (('bm25', passages), ('difflib', fuzzy)):
+                results[name][0] += bool(ranked) and _matches(ranked[0], expected)
+                results[name][1] += any(_matches(passage, expected) for passage in ranked)
+            if hits and hits[0].passage.answer and hits[0].confidence >= threshold:
+                answered += 1
+                if not _matches(hits[0].passage, expected):
+                    wrong += 1
+                    print(f"WRONG direct answer for {question!r}: {hits[0].passage.title!r} "
+                          f"({hits[0].confidence:.2f})")
+
+        for name, (top1, top3) in results.items():
+            print(f"{name:<8} hit@1 {top1:>3}/{expected_count}   hit@3 {top3:>3}/{expected_count}")
+        print(f"answered directly: {answered}/{len(CORPUS)} at confidence >= {threshold} ({wrong} wrong)")
+
+        queries = [(question, language_code) for question, language_code, _ in CORPUS]
+        started = time.perf_counter()
+        for _ in range(args.number):
+            for question, language_code in queries:
+                index.search(question, language_code, 3)
+        per_query = (time.perf_counter() - started) / (args.number * len(queries))
+        print(f"index: {len(index.passages)} passages, {len(index.vocabulary)} terms, "
+              f"{index.nbytes / 1024:.0f} KB of arrays, built in {build_ms:.1f} ms")
+        print(f"search: {per_query * 1e6:.1f} us/query")
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Upstream OpenAI calls saved by coalescing identical questions (backend.utils.singleflight).
+
+Simulates a broadcast burst: --users threads ask query-mode questions at the
+same moment, drawn from --distinct different questions (with case and
+punctuation variations), against the local fake OpenAI endpoint:
+
+    python -m benchmarks.bench_singleflight --users 50 --distinct 3 --latency-ms 800
+
+Modes:
+    direct     - every question calls OpenAI (the behaviour before coalescing)
+    coalesced  - handle_gpt_query as shipped
+
+Prints upstream calls, wall time and per-question latency for each mode. Set
+REDIS_URL to also exercise the cross-worker path.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.fakes import FakeUpstreamServer
+
+QUESTIONS = (
+    'What is refinancing?',
+    'How long does refinancing take?',
+    'Can I refinance with bad credit?',
+    'What documents do I need?',
+    'Is there a lock-in period?',
+)
+VARIANTS = (str, str.lower, str.upper, lambda text: text.rstrip('?') + ' ??', lambda text: f'  {text}')
+
+
+def make_app(db_path, upstream):
+    from backend.app import create_app
+    from backend.extensions import db
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'WHATSAPP_API_URL': upstream.whatsapp_url,
+        'WHATSAPP_API_TOKEN': 'bench',
+        'WHATSAPP_PHONE_NUMBER_ID': '1000000000',
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_API_BASE': upstream.openai_base,
+        'SQL_AUDIT_ENABLED': False,
+        # One connection: SQLite cannot take the burst's concurrent chat-log writes, so they queue
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60},
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def run_burst(app, questions):
+    """ Ask every (phone, question) pair at once; returns per-question latencies in ms. """
+    from backend.extensions import db
+    from backend.routes.chatbot import handle_gpt_query
+
+    barrier = threading.Barrier(len(questions))
+    latencies = []
+    lock = threading.Lock()
+
+    def ask(phone, question):
+        with app.app_context():
+            barrier.wait()
+            started = time.perf_counter()
+            handle_gpt_query(question, None, phone)
+            elapsed = (time.perf_counter() - started) * 1000
+            db.session.commit()
+            db.session.remove()
+        with lock:
+            latencies.append(elapsed)
+
+    threads = [threading.Thread(target=ask, args=pair) for pair in questions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--distinct', type=int, default=3, help='Different questions in the burst.')
+    parser.add_argument('--latency-ms', type=float, default=800.0, help='Fake OpenAI latency.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import backend.routes.chatbot as chatbot
+
+    rng = random.Random(args.seed)
+    pool = QUESTIONS[:max(1, min(args.distinct, len(QUESTIONS)))]
+    questions = [(f'6019{i:07d}', rng.choice(VARIANTS)(rng.choice(pool))) for i in range(args.users)]
+
+    upstream = FakeUpstreamServer(latency_ms=args.latency_ms).start()
+    app = make_app(os.path.join(tempfile.mkdtemp(prefix='singleflight_bench_'), 'bench.db'), upstream)
+    coalesce = chatbot.coalesce
+    try:
+        for mode in ('direct', 'coalesced'):
+            chatbot.coalesce = coalesce if mode == 'coalesced' else (lambda name, key_parts, fn: fn())
+            upstream.requests.clear()
+            started = time.perf_counter()
+            latencies = run_burst(app, questions)
+            seconds = time.perf_counter() - started
+            calls = upstream.requests[('openai', 200)]
+            print(f"{mode:<10} {calls:>4} OpenAI calls for {len(questions)} questions in {seconds:6.2f}s"
+                  f"  p50 {latencies[len(latencies) // 2]:7.1f} ms  max {latencies[-1]:7.1f} ms")
+    finally:
+        chatbot.coalesce = coalesce
+        upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+First-request vs steady-state latency under gunicorn, with and without the pre-fork warm-up.
+
+Starts a single-worker gunicorn twice against a seeded SQLite database and a
+local stand-in for the WhatsApp API: once with an empty config (cold workers)
+and once with gunicorn.conf.py (preload_app + warm_up/init_worker). For each
+run, one full conversation is timed as the first traffic the worker sees, and
+then again as the median over later conversations. Each mode is started
+--repeats times and medians are reported, since a single cold start is noisy:
+
+    python -m benchmarks.bench_worker_warmup [--conversations 20] [--repeats 5]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from benchmarks.fakes import FakeUpstreamServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOW = ('hi', '1', 'John Doe', '300000', '30', '1800')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _seed(db_path):
+    """ Create the schema and one bank rate in a fresh SQLite file. """
+    from backend.app import create_app
+    from backend.extensions import db
+    from backend.models import BankRate
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(BankRate(bank_name='Bench Bank', min_amount=0, max_amount=10_000_000, interest_rate=3.5))
+        db.session.commit()
+
+
+def _payload(phone, text):
+    return {'entry': [{'changes': [{'value': {
+        'contacts': [{'wa_id': phone}],
+        'messages': [{'from': phone, 'text': {'body': text}}],
+    }}]}]}
+
+
+def _conversation_ms(session, base_url, phone):
+    """ Per-message latencies (ms) for one full conversation. """
+    latencies = []
+    for text in FLOW:
+        started = time.perf_counter()
+        response = session.post(f'{base_url}/webhook', json=_payload(phone, text), timeout=30)
+        latencies.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    return latencies
+
+
+def run(mode, env, conversations, tmpdir, fake_url):
+    port = _free_port()
+    config_path = os.path.join(ROOT, 'gunicorn.conf.py')
+    if mode == 'cold':
+        config_path = os.path.join(tmpdir, 'empty.conf.py')
+        open(config_path, 'w').close()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', config_path, '-w', '1', '-b', f'127.0.0.1:{port}',
+         'backend.app:create_app()'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:  # Wait for the port without sending an HTTP request that would warm the worker
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.1)
+        time.sleep(1.0)  # Let the worker finish booting (and post_fork) before the first request
+        base_url = f'http://127.0.0.1:{port}'
+        session = requests.Session()
+        session.post(fake_url, json={})  # Warm the benchmark's own client so only server cost is timed
+        prefix = f'60{mode}{port}'
+        first = _conversation_ms(session, base_url, f'{prefix}0000')
+        later = [_conversation_ms(session, base_url, f'{prefix}{n:04d}') for n in range(1, conversations)]
+        steady = [statistics.median(step) for step in zip(*later)]
+        return first, steady
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    fake = FakeUpstreamServer().start()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, 'bench.db')
+        fake_url = fake.whatsapp_url
+        env = {
+            **os.environ,
+            'PYTHONPATH': ROOT,
+            'DATABASE_URL': f'sqlite:///{db_path}',
+            'WHATSAPP_API_URL': fake_url,
+            'WHATSAPP_API_TOKEN': 'bench',
+            'WHATSAPP_PHONE_NUMBER_ID': '1',
+            'OPENAI_API_KEY': 'bench',
+            'LOG_LEVEL': 'WARNING',
+        }
+        os.environ.update(env)
+        _seed(db_path)
+
+        print(f"{'mode':<6} {'message':<10} {'first ms':>9} {'steady ms':>10}")
+        for mode in ('cold', 'warm'):
+            runs = [run(mode, env, args.conversations, tmpdir, fake_url) for _ in range(args.repeats)]
+            first = [statistics.median(step) for step in zip(*(first for first, _ in runs))]
+            steady = [statistics.median(step) for step in zip(*(steady for _, steady in runs))]
+            for text, first_ms, steady_ms in zip(FLOW, first, steady):
+                print(f"{mode:<6} {text:<10} {first_ms:>9.1f} {steady_ms:>10.1f}")
+            print(f"{mode:<6} {'total':<10} {sum(first):>9.1f} {sum(steady):>10.1f}")
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Local stand-ins for the WhatsApp Graph API and the OpenAI API.
+
+One threaded HTTP server answers both:
+
+    POST /v17.0/<phone_number_id>/messages   -> WhatsApp send-message response
+    POST /v1/chat/completions                -> OpenAI chat completion
+
+Latency (a fixed delay plus uniform jitter) and error injection (a fraction
+of requests answered with HTTP 500) are configurable, so benchmarks can see
+how the app behaves against slow or flaky upstreams. Chat completions behave
+like a model tier: model_latency_ms adds a per-model delay, and the answer is
+as long as the question warrants within max_tokens, each completion token
+costing token_latency_ms. Point the app at it with:
+
+    WHATSAPP_API_URL = server.whatsapp_url
+    OPENAI_API_BASE  = server.openai_base
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, host='127.0.0.1', port=0,
+                 model_latency_ms=None, token_latency_ms=0.0):
+        super().__init__((host, port), _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.model_latency_ms = dict(model_latency_ms or {})  # model -> extra delay per completion
+        self.token_latency_ms = token_latency_ms
+        self.requests = Counter()  # (upstream, status) -> count
+        self.models = Counter()  # model -> completions served
+        self.completion_tokens = Counter()  # model -> completion tokens generated
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def whatsapp_url(self):
+        return f'{self.url}/v17.0/1000000000/messages'
+
+    @property
+    def openai_base(self):
+        return f'{self.url}/v1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-upstream', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def record(self, upstream, status):
+        with self._lock:
+            self.requests[(upstream, status)] += 1
+
+    def record_completion(self, model, completion_tokens):
+        with self._lock:
+            self.models[model] += 1
+            self.completion_tokens[model] += completion_tokens
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # Headers and body are separate writes; avoid the 40ms delayed-ACK stall
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        upstream = 'openai' if self.path.endswith('/chat/completions') else 'whatsapp'
+
+        delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+        if upstream == 'openai':
+            completion_tokens = _completion_tokens(body)
+            delay += server.model_latency_ms.get(body.get('model'), 0.0) + server.token_latency_ms * completion_tokens
+        if delay:
+            time.sleep(delay / 1000)
+
+        if server.error_rate and random.random() < server.error_rate:
+            status, payload = 500, {'error': {'message': 'Injected failure', 'type': 'server_error'}}
+        elif upstream == 'openai':
+            status, payload = 200, _chat_completion(body, completion_tokens)
+            server.record_completion(body.get('model'), completion_tokens)
+        else:
+            status, payload = 200, {
+                'messaging_product': 'whatsapp',
+                'contacts': [{'input': body.get('to'), 'wa_id': body.get('to')}],
+                'messages': [{'id': f'wamid.fake{random.getrandbits(48):012x}'}],
+            }
+        server.record(upstream, status)
+
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, *args):
+        pass
+
+
+def _completion_tokens(body):
+    """ Answers grow with the question, up to max_tokens. """
+    question = (body.get('messages') or [{}])[-1].get('content', '')
+    return min(int(body.get('max_tokens') or 256), 40 + len(question) * 2)
+
+
+def _chat_completion(body, completion_tokens):
+    question = (body.get('messages') or [{}])[-1].get('content', '')
+    answer = f"Refinancing replaces your current home loan with a new one. ({len(question)} chars received)"
+    return {
+        'id': f'chatcmpl-fake{random.getrandbits(32):08x}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'gpt-3.5-turbo'),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 120, 'completion_tokens': completion_tokens, 'total_tokens': 120 + completion_tokens},
+    }
@@ -0,0 +1,266 @@
+"""
+Load test and micro-benchmarks for the chatbot.
+
+load (default): replays realistic WhatsApp webhook payloads through the app
+in-process, against the local WhatsApp/OpenAI stand-ins in benchmarks.fakes.
+Every conversation greets, picks a language when asked, walks all flow steps
+(with an occasional invalid answer), completes and asks query-mode questions. Reports
+throughput, p50/p95/p99 latency and DB queries/commits per message type,
+taken from the X-SQL-* headers of backend.utils.sql_audit:
+
+    python -m benchmarks.load_test --conversations 200 --concurrency 4
+    python -m benchmarks.load_test --endpoint process_message --latency-ms 80 --jitter-ms 40
+    python -m benchmarks.load_test --error-rate 0.05 --json results.json
+    python -m benchmarks.load_test --strict-budgets   # exit 1 if any route exceeds its SQL budget
+
+micro: per-call cost of the hot helpers (calculate_refinance_savings,
+get_preset_response, is_greeting):
+
+    python -m benchmarks.load_test micro
+
+Set DATABASE_URL to a PostgreSQL database for realistic concurrency; the
+default is a throwaway SQLite file.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeUpstreamServer
+
+ENDPOINTS = {'webhook': '/webhook', 'process_message': '/chatbot/process_message'}
+
+NAMES = ('Aisyah Binti Rahman', 'John Tan', 'Muthu Kumar', 'Lim Wei Ling', 'Siti Nor')
+QUESTIONS = (
+    'What is refinancing?',
+    'How long does the refinance process take?',
+    'Can I cash out my home equity?',
+    'What documents do I need?',
+    'How do I contact the admin?',
+)
+# Opening messages and whether their language is clear enough to skip the menu (backend.utils.language)
+OPENERS = (
+    ('hi', False),
+    ('Hello', False),
+    ('hai', False),
+    ('你好', True),
+    ('Hi, I would like to refinance my home loan', True),
+    ('Saya nak refinance rumah saya', True),
+)
+BANK_RATES = (
+    ('Bank A', 0, 500_000, 3.85),
+    ('Bank B', 100_000, 2_000_000, 3.65),
+    ('Bank C', 300_000, 10_000_000, 3.55),
+)
+
+
+def conversation_script(rng, questions):
+    """ [(message type, text)] for one realistic conversation. """
+    amount = rng.randrange(150_000, 1_500_000, 1000)
+    tenure = rng.choice((20, 25, 30, 35))
+    repayment = int(amount * rng.uniform(0.0045, 0.006))
+    opener, detected = rng.choice(OPENERS)
+    script = [('greeting', opener)]
+    if not detected:
+        script.append(('language', rng.choice('123')))
+    script.append(('name', rng.choice(NAMES)))
+    if rng.random() < 0.2:
+        script.append(('invalid_input', rng.choice(('abc', '-5', '250k'))))
+    script += [
+        ('loan_amount', str(amount)),
+        ('loan_tenure', str(tenure)),
+        ('completion', str(repayment)),
+    ]
+    script += [('query', rng.choice(QUESTIONS)) for _ in range(questions)]
+    return script
+
+
+def webhook_payload(phone, text, rng):
+    """ A webhook body shaped like the WhatsApp Cloud API's text-message notification. """
+    return {
+        'object': 'whatsapp_business_account',
+        'entry': [{
+            'id': '102290129340398',
+            'changes': [{
+                'field': 'messages',
+                'value': {
+                    'messaging_product': 'whatsapp',
+                    'metadata': {'display_phone_number': '15550783881', 'phone_number_id': '106540352242922'},
+                    'contacts': [{'profile': {'name': 'Load Test'}, 'wa_id': phone}],
+                    'messages': [{
+                        'from': phone,
+                        'id': f'wamid.{rng.getrandbits(64):016x}',
+                        'timestamp': str(int(time.time())),
+                        'type': 'text',
+                        'text': {'body': text},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+def _percentile(ordered, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def make_app(db_url, upstream, strict_budgets=False, **overrides):
+    """ The app against the local stand-ins, with a fresh schema and the benchmark bank rates. """
+    from backend.app import create_app
+    from backend.extensions import db
+    from backend.models import BankRate
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': db_url,
+        'WHATSAPP_API_URL': upstream.whatsapp_url if upstream else 'http://127.0.0.1:9/unused',
+        'WHATSAPP_API_TOKEN': 'load-test',
+        'WHATSAPP_PHONE_NUMBER_ID': '1000000000',
+        'OPENAI_API_KEY': 'load-test',
+        'OPENAI_API_BASE': upstream.openai_base if upstream else None,
+        'SQL_AUDIT_HEADERS': True,
+        'SQL_AUDIT_STRICT': strict_budgets,
+        **overrides,
+    })
+    with app.app_context():
+        db.create_all()
+        if not BankRate.query.count():
+            db.session.add_all(BankRate(bank_name=name, min_amount=low, max_amount=high, interest_rate=rate)
+                               for name, low, high, rate in BANK_RATES)
+            db.session.commit()
+    return app
+
+
+def _run_conversations(app, path, phones, questions, seed):
+    """ Run whole conversations sequentially on one client; returns [(type, ms, queries, commits, ok)]. """
+    client = app.test_client()
+    results = []
+    for phone in phones:
+        rng = random.Random(f'{seed}:{phone}')
+        for kind, text in conversation_script(rng, questions):
+            started = time.perf_counter()
+            response = client.post(path, json=webhook_payload(phone, text, rng))
+            elapsed = (time.perf_counter() - started) * 1000
+            results.append((kind, elapsed, int(response.headers.get('X-SQL-Queries', 0)),
+                            int(response.headers.get('X-SQL-Commits', 0)), response.status_code < 500))
+    return results
+
+
+def run_load(args):
+    upstream = FakeUpstreamServer(args.latency_ms, args.jitter_ms, args.error_rate).start()
+    tmpdir = tempfile.mkdtemp(prefix='finzo-load-')
+    db_url = os.getenv('DATABASE_URL') or f"sqlite:///{os.path.join(tmpdir, 'load.db')}"
+    # Closed loop: every client thread is always busy, which load shedding would rightly read as saturation
+    app = make_app(db_url, upstream, strict_budgets=args.strict_budgets, LOAD_SHED_ENABLED=False)
+
+    phones = [f'6019{args.seed:03d}{n:05d}' for n in range(args.conversations)]
+    shards = [phones[i::args.concurrency] for i in range(args.concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(_run_conversations, app, ENDPOINTS[args.endpoint], shard, args.questions, args.seed)
+                   for shard in shards]
+        results = [row for future in futures for row in future.result()]
+    wall = time.perf_counter() - started
+    upstream.stop()
+
+    by_kind = defaultdict(list)
+    for row in results:
+        by_kind[row[0]].append(row)
+    by_kind['all'] = results
+
+    summary = {
+        'endpoint': args.endpoint,
+        'conversations': args.conversations,
+        'concurrency': args.concurrency,
+        'messages': len(results),
+        'seconds': round(wall, 3),
+        'throughput_msgs_per_s': round(len(results) / wall, 1),
+        'upstream_requests': {f'{name}:{status}': count for (name, status), count in sorted(upstream.requests.items())},
+        'by_type': {},
+    }
+    for kind, rows in by_kind.items():
+        latencies = sorted(row[1] for row in rows)
+        summary['by_type'][kind] = {
+            'count': len(rows),
+            'p50_ms': round(_percentile(latencies, 50), 2),
+            'p95_ms': round(_percentile(latencies, 95), 2),
+            'p99_ms': round(_percentile(latencies, 99), 2),
+            'queries_mean': round(statistics.fmean(row[2] for row in rows), 2),
+            'queries_max': max(row[2] for row in rows),
+            'commits_mean': round(statistics.fmean(row[3] for row in rows), 2),
+            'errors': sum(1 for row in rows if not row[4]),  # 5xx responses, including budget violations
+        }
+
+    print(f"{summary['messages']} messages in {summary['seconds']}s "
+          f"({summary['throughput_msgs_per_s']} msg/s, concurrency {args.concurrency}, endpoint {args.endpoint})")
+    print(f"{'type':<14} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'max q':>6} "
+          f"{'commits':>8} {'errors':>7}")
+    for kind, stats in summary['by_type'].items():
+        print(f"{kind:<14} {stats['count']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+              f"{stats['queries_mean']:>8.2f} {stats['queries_max']:>6} {stats['commits_mean']:>8.2f} {stats['errors']:>7}")
+    print(f"upstream: {summary['upstream_requests']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+def run_micro(args):
+    from backend.routes.chatbot import is_greeting
+    from backend.utils.calculation import calculate_refinance_savings
+    from backend.utils.presets import get_preset_response
+
+    tmpdir = tempfile.mkdtemp(prefix='finzo-micro-')
+    app = make_app(f"sqlite:///{os.path.join(tmpdir, 'micro.db')}", upstream=None)
+    greetings = ('hi', 'Hello there', 'selamat pagi', '你好', '300000', 'John Tan', 'what is refinancing?')
+    with app.app_context():
+        cases = {
+            'calculate_refinance_savings': lambda: calculate_refinance_savings(350_000, 30, 1_900),
+            'get_preset_response': lambda: [get_preset_response(question, 'en') for question in QUESTIONS],
+            'is_greeting': lambda: [is_greeting(message) for message in greetings],
+        }
+        per_call = {'get_preset_response': len(QUESTIONS), 'is_greeting': len(greetings)}
+        for label, case in cases.items():
+            seconds = min(timeit.repeat(case, number=args.number, repeat=3))
+            print(f"{label:<30} {seconds / (args.number * per_call.get(label, 1)) * 1e6:9.3f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', nargs='?', choices=('load', 'micro'), default='load')
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--questions', type=int, default=2, help='Query-mode questions per conversation.')
+    parser.add_argument('--endpoint', choices=tuple(ENDPOINTS), default='webhook')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Fixed upstream latency.')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Extra uniform upstream latency.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of upstream calls answered with 500.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--number', type=int, default=2000, help='Iterations per micro-benchmark repeat.')
+    parser.add_argument('--json', help='Write the load-test summary to this file.')
+    parser.add_argument('--strict-budgets', action='store_true',
+                        help='Fail requests over their SQL budget (SQL_AUDIT_STRICT) and exit 1 on any error.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('ADMIN_PHONE_NUMBER', '60100000000')
+    if args.mode == 'micro':
+        run_micro(args)
+    else:
+        summary = run_load(args)
+        if args.strict_budgets and summary['by_type']['all']['errors']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Replay captured webhook traffic (backend.utils.traffic_capture) and compare builds.
+
+run: drive the app in-process with a capture file or directory. The app
+talks to the local WhatsApp/OpenAI stand-ins in benchmarks.fakes and uses a
+fresh database:
+
+    python -m benchmarks.replay run captures/ --speed 1      # real-time pacing
+    python -m benchmarks.replay run captures/ --speed 10     # ten times faster
+    python -m benchmarks.replay run captures/ --speed max --concurrency 8 --json after.json
+
+Each phone number is always handled by the same replay thread, so a user's
+messages stay in order and conversations unfold as they did in production.
+Paced runs also report schedule lag: how late requests started because the
+app could not keep up.
+
+diff: compare two run summaries, e.g. the previous release against this one:
+
+    git checkout v1.4 && python -m benchmarks.replay run captures/ --speed max --json before.json
+    git checkout main && python -m benchmarks.replay run captures/ --speed max --json after.json
+    python -m benchmarks.replay diff before.json after.json --fail-on-regression 10
+
+Without production captures, record the load test's synthetic conversations:
+
+    TRAFFIC_CAPTURE_DIR=captures TRAFFIC_CAPTURE_SALT=$(openssl rand -hex 32) \
+        python -m benchmarks.load_test --conversations 100
+"""
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+
+from benchmarks.fakes import FakeUpstreamServer
+from benchmarks.load_test import make_app
+
+# Summary metrics compared by diff: (key, label, True if higher is better)
+DIFF_METRICS = (
+    ('throughput_per_s', 'throughput (req/s)', True),
+    ('p50_ms', 'p50 latency (ms)', False),
+    ('p95_ms', 'p95 latency (ms)', False),
+    ('p99_ms', 'p99 latency (ms)', False),
+    ('lag_p95_ms', 'schedule lag p95 (ms)', False),
+    ('errors', 'errors (5xx)', False),
+)
+
+
+def _percentile(ordered, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def _build_id():
+    """ Short git revision of the working tree, marked dirty when it has uncommitted changes. """
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return f'{revision}-dirty' if dirty else revision
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _sender(payload):
+    """ The (pseudonymized) phone number a captured payload came from, for per-user ordering. """
+    try:
+        data = json.loads(payload)
+        return data['entry'][0]['changes'][0]['value']['messages'][0]['from']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ''
+
+
+def run_replay(args):
+    from backend.utils.traffic_capture import read_capture
+
+    records = list(read_capture(args.capture))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        sys.exit(f"No captured requests in {args.capture}")
+    speed = None if args.speed == 'max' else float(args.speed)
+
+    upstream = FakeUpstreamServer(args.latency_ms, args.jitter_ms).start()
+    tmpdir = tempfile.mkdtemp(prefix='finzo-replay-')
+    db_url = os.getenv('DATABASE_URL') or f"sqlite:///{os.path.join(tmpdir, 'replay.db')}"
+    # A lane is a worker thread; at full speed every lane is always busy, which would read as saturation
+    overrides = {'TRAFFIC_CAPTURE_DIR': None, 'LOAD_SHED_MAX_IN_FLIGHT': args.concurrency,
+                 'LOAD_SHED_ENABLED': speed is not None}
+    if db_url.startswith('sqlite'):
+        # One connection: SQLite cannot take concurrent chat-log writes, so they queue
+        overrides['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60}
+    app = make_app(db_url, upstream, **overrides)
+
+    lanes = [queue.Queue() for _ in range(args.concurrency)]
+    results = []  # (latency ms, lag ms, status, recorded status)
+    lock = threading.Lock()
+
+    def lane_worker(lane):
+        client = app.test_client()
+        while True:
+            item = lane.get()
+            if item is None:
+                return
+            captured, due = item
+            started = time.perf_counter()
+            response = client.post(captured.path, data=captured.body, content_type='application/json')
+            latency = (time.perf_counter() - started) * 1000
+            with lock:
+                results.append((latency, max(started - due, 0.0) * 1000, response.status_code, captured.status))
+
+    threads = [threading.Thread(target=lane_worker, args=(lane,), daemon=True) for lane in lanes]
+    for thread in threads:
+        thread.start()
+
+    first_ts = records[0].ts
+    started = time.perf_counter()
+    for captured in records:
+        due = started + ((captured.ts - first_ts) / speed if speed else 0.0)
+        if speed:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        lane = lanes[zlib.crc32(_sender(captured.body).encode()) % len(lanes)]
+        lane.put((captured, due if speed else time.perf_counter()))
+    for lane in lanes:
+        lane.put(None)
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    upstream.stop()
+
+    latencies = sorted(row[0] for row in results)
+    lags = sorted(row[1] for row in results)
+    recorded = sorted(captured.duration_ms for captured in records)
+    statuses = Counter(row[2] for row in results)
+    summary = {
+        'build': _build_id(),
+        'capture': os.path.abspath(args.capture),
+        'speed': args.speed,
+        'concurrency': args.concurrency,
+        'requests': len(results),
+        'seconds': round(wall, 3),
+        'throughput_per_s': round(len(results) / wall, 1),
+        'p50_ms': round(_percentile(latencies, 50), 2),
+        'p95_ms': round(_percentile(latencies, 95), 2),
+        'p99_ms': round(_percentile(latencies, 99), 2),
+        'lag_p95_ms': round(_percentile(lags, 95), 2) if speed else 0.0,
+        'errors': sum(count for status, count in statuses.items() if status >= 500),
+        'status_changed': sum(1 for row in results if row[2] != row[3]),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'recorded_p50_ms': round(_percentile(recorded, 50), 2),
+        'recorded_p95_ms': round(_percentile(recorded, 95), 2),
+        'upstream_requests': {f'{name}:{status}': count for (name, status), count in sorted(upstream.requests.items())},
+    }
+
+    print(f"build {summary['build']}: replayed {summary['requests']} requests at speed {args.speed} in "
+          f"{summary['seconds']}s ({summary['throughput_per_s']} req/s, concurrency {args.concurrency})")
+    print(f"latency p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  p99 {summary['p99_ms']} ms"
+          f"  (recorded in production: p50 {summary['recorded_p50_ms']} ms, p95 {summary['recorded_p95_ms']} ms)")
+    if speed:
+        print(f"schedule lag p95 {summary['lag_p95_ms']} ms")
+    print(f"statuses {summary['statuses']}, {summary['status_changed']} differ from the capture, "
+          f"upstream {summary['upstream_requests']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+def run_diff(args):
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+    if before.get('capture') != after.get('capture') or before.get('speed') != after.get('speed'):
+        print("warning: the runs used different captures or speeds; numbers are not comparable")
+
+    print(f"{'metric':<24} {before.get('build', 'before'):>14} {after.get('build', 'after'):>14} {'change':>9}")
+    regressions = []
+    for key, label, higher_is_better in DIFF_METRICS:
+        old, new = before.get(key, 0), after.get(key, 0)
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        if args.fail_on_regression is not None and worse and abs(change) > args.fail_on_regression:
+            regressions.append(label)
+        if key == 'errors' and new > old:
+            regressions.append(label)
+        print(f"{label:<24} {old:>14} {new:>14} {change:>+8.1f}%{'  worse' if worse and change else ''}")
+    if regressions and args.fail_on_regression is not None:
+        print(f"regressed: {', '.join(dict.fromkeys(regressions))}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Replay a capture against this build.')
+    run.add_argument('capture', help='Capture file or directory (TRAFFIC_CAPTURE_DIR).')
+    run.add_argument('--speed', default='max', help="Time scale: 1 for real time, 10 for ten times faster, or 'max'.")
+    run.add_argument('--concurrency', type=int, default=4, help='Replay threads; users are pinned to one each.')
+    run.add_argument('--limit', type=int, help='Replay only the first N requests.')
+    run.add_argument('--latency-ms', type=float, default=0.0, help='Fixed upstream latency of the stand-ins.')
+    run.add_argument('--jitter-ms', type=float, default=0.0, help='Extra uniform upstream latency.')
+    run.add_argument('--json', help='Write the run summary to this file (input for diff).')
+
+    diff = commands.add_parser('diff', help='Compare two run summaries.')
+    diff.add_argument('before')
+    diff.add_argument('after')
+    diff.add_argument('--fail-on-regression', type=float, metavar='PCT',
+                      help='Exit 1 if a metric got worse by more than PCT percent, or errors increased.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('ADMIN_PHONE_NUMBER', '60100000000')
+    if args.command == 'run':
+        if args.speed != 'max':
+            try:
+                if float(args.speed) <= 0:
+                    raise ValueError
+            except ValueError:
+                parser.error("--speed must be a positive number or 'max'")
+        run_replay(args)
+    else:
+        run_diff(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+# Gunicorn settings for the web dyno (see Procfile).
+#
+# The app is imported and warmed once in the master (preload_app + when_ready),
+# so presets, the bank-rate index and compiled templates are shared by all
+# workers copy-on-write, and each worker only opens its own DB connections.
+# Workers default to $WEB_CONCURRENCY, which gunicorn reads itself.
+import os
+
+preload_app = True
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+
+
+def when_ready(server):
+    from backend.warmup import warm_up
+    warm_up(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    from backend.warmup import init_worker
+    init_worker(server.app.wsgi(), connections=threads)